@@ -0,0 +1,431 @@
+"""
+Admission control and request coalescing for upstream LLM calls.
+
+AdmissionController caps how many calls to one provider are in flight at
+once. Callers beyond the cap wait in a bounded FIFO queue; when the queue is
+full, or a caller has waited longer than its timeout, the call is refused
+with AdmissionRejected instead of piling onto a provider that is already
+returning 429s. A released slot is handed straight to the oldest waiter, so
+the limit holds exactly and waiters are served in arrival order.
+
+Each controller can also own a TokenBucket sized to the provider's request
+quota (requests per minute with a burst allowance); a call holding a slot
+waits for a token before going upstream, so bursts are smoothed client-side
+instead of being answered with 429s. When the service runs as several
+worker processes the bucket lives in SQLite (SharedTokenBucket), so the
+quota holds for the service as a whole rather than once per worker, and the
+in-flight cap is split between the workers. Taking a shared token can wait
+on another process's SQLite transaction, so async callers do it on a worker
+thread.
+
+SingleFlight lets identical in-flight calls share one upstream request: the
+first caller for a key runs it, later callers with the same key wait for
+that result.
+
+Both work from the event loop (async) and from worker threads (sync), since
+quiz generation reaches the providers both ways, and share state across them.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+from latency_stats import get_window
+from shared_state import SERVICE_WORKERS, SHARED_STATE_PATH, connect, per_worker
+
+load_dotenv()
+
+# Defaults for every provider; GEMINI_MAX_IN_FLIGHT etc. override per provider
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+# Client-side request quota (0 disables the token bucket)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "600"))
+LLM_BURST = int(os.getenv("LLM_BURST", "20"))
+
+
+class AdmissionRejected(Exception):
+    """The provider is saturated: the wait queue was full or the wait timed out"""
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; each upstream request takes one"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters = {"taken": 0, "delayed": 0, "refused": 0}
+        self._waited = 0.0
+
+    def reserve(self, max_wait: float) -> float:
+        """Claim the next token and return how long to wait for it, or raise if that is over max_wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: each caller reserves its place in line
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                self._counters["refused"] += 1
+                raise AdmissionRejected(f"rate limit: next request allowed in {wait:.1f}s")
+            self._tokens -= 1
+            self._counters["taken"] += 1
+            if wait:
+                self._counters["delayed"] += 1
+                self._waited += wait
+            return wait
+
+    async def take(self, max_wait: float):
+        wait = self.reserve(max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def take_sync(self, max_wait: float):
+        wait = self.reserve(max_wait)
+        if wait:
+            time.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "requests_per_minute": round(self.rate * 60, 1),
+                "burst": self.burst,
+                "tokens": round(min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate), 2),
+                "seconds_delayed": round(self._waited, 3),
+            }
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose tokens are kept in SQLite and shared by every worker process"""
+
+    def __init__(self, name: str, rate: float, burst: int, path: str = SHARED_STATE_PATH):
+        super().__init__(rate, burst)
+        self.name = name
+        # Autocommit mode, so reserve() controls its own write transaction
+        self._db = connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+
+    def _refill(self, now: float) -> float:
+        # Caller holds the write transaction. Wall-clock time, since
+        # monotonic clocks are not comparable across processes.
+        row = self._db.execute("SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return float(self.burst)
+        tokens, updated = row
+        return min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+
+    def reserve(self, max_wait: float) -> float:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens = self._refill(now)
+                wait = max(0.0, (1 - tokens) / self.rate)
+                if wait > max_wait:
+                    self._db.execute("ROLLBACK")
+                    self._counters["refused"] += 1
+                    raise AdmissionRejected(f"rate limit: next request allowed in {wait:.1f}s")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens - 1, now),
+                )
+                self._db.execute("COMMIT")
+            except AdmissionRejected:
+                raise
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._counters["taken"] += 1
+            if wait:
+                self._counters["delayed"] += 1
+                self._waited += wait
+            return wait
+
+    async def take(self, max_wait: float):
+        # reserve() may wait out SQLITE_BUSY_TIMEOUT_SECONDS for the write lock
+        wait = await asyncio.to_thread(self.reserve, max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._db.execute("BEGIN")
+            tokens = self._refill(time.time())
+            self._db.execute("COMMIT")
+            return {
+                **self._counters,
+                "requests_per_minute": round(self.rate * 60, 1),
+                "burst": self.burst,
+                "tokens": round(tokens, 2),
+                "seconds_delayed": round(self._waited, 3),
+                "shared": True,
+            }
+
+
+class _Waiter:
+    __slots__ = ("granted", "event", "future", "loop")
+
+    def __init__(self):
+        self.granted = False
+        self.event: Optional[threading.Event] = None
+        self.future: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def wake(self):
+        # Caller holds the controller lock and has set granted
+        if self.event is not None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """Bounded in-flight calls plus a bounded, time-limited FIFO wait queue for one provider"""
+
+    def __init__(self, name: str, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS, bucket: Optional[TokenBucket] = None):
+        self.name = name
+        self.bucket = bucket
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        self._counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "timed_out": 0}
+        self._max_queue_depth = 0
+        self._wait_window = get_window(f"admission_wait_{name}")
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdmissionController":
+        prefix = name.upper()
+        per_minute = float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", str(LLM_REQUESTS_PER_MINUTE)))
+        burst = int(os.getenv(f"{prefix}_BURST", str(LLM_BURST)))
+        bucket = None
+        if per_minute > 0:
+            bucket = (SharedTokenBucket(name, per_minute / 60, burst) if SERVICE_WORKERS > 1
+                      else TokenBucket(per_minute / 60, burst))
+        return cls(
+            name,
+            # The configured cap is for the whole service
+            max_in_flight=per_worker(int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", str(LLM_MAX_IN_FLIGHT)))),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", str(LLM_MAX_QUEUE))),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", str(LLM_QUEUE_TIMEOUT_SECONDS))),
+            bucket=bucket,
+        )
+
+    def _try_enter(self) -> Optional[_Waiter]:
+        # Caller holds self._lock. Returns None when admitted immediately,
+        # otherwise the queued waiter.
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise AdmissionRejected(f"{self.name}: {len(self._waiters)} calls already waiting")
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        self._counters["queued"] += 1
+        self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+        return waiter
+
+    def has_capacity(self) -> bool:
+        """True when a call made now would be admitted without queueing"""
+        with self._lock:
+            return self._in_flight < self.max_in_flight and not self._waiters
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout/cancel; True if the slot was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot over directly; in_flight stays the same
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self._counters["admitted"] += 1
+                waiter.wake()
+            else:
+                self._in_flight -= 1
+
+    def _timed_out(self, started: float) -> AdmissionRejected:
+        with self._lock:
+            self._counters["timed_out"] += 1
+        self._wait_window.observe(time.perf_counter() - started)
+        return AdmissionRejected(f"{self.name}: no capacity after waiting {self.queue_timeout:.0f}s")
+
+    async def acquire(self):
+        started = time.perf_counter()
+        with self._lock:
+            waiter = self._try_enter()
+            if waiter is not None:
+                waiter.loop = asyncio.get_running_loop()
+                waiter.future = waiter.loop.create_future()
+        if waiter is None:
+            self._wait_window.observe(0.0)
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise self._timed_out(started)
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+        self._wait_window.observe(time.perf_counter() - started)
+
+    def acquire_sync(self):
+        started = time.perf_counter()
+        with self._lock:
+            waiter = self._try_enter()
+            if waiter is not None:
+                waiter.event = threading.Event()
+        if waiter is None:
+            self._wait_window.observe(0.0)
+            return
+        if not waiter.event.wait(self.queue_timeout) and not self._abandon(waiter):
+            raise self._timed_out(started)
+        self._wait_window.observe(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight slot (and take a rate-limit token) for the duration of an async call"""
+        await self.acquire()
+        try:
+            if self.bucket is not None:
+                await self.bucket.take(self.queue_timeout)
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def slot_sync(self):
+        """Hold one in-flight slot (and take a rate-limit token) for the duration of a blocking call"""
+        self.acquire_sync()
+        try:
+            if self.bucket is not None:
+                self.bucket.take_sync(self.queue_timeout)
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+            queue_depth = len(self._waiters)
+            max_queue_depth = self._max_queue_depth
+        return {
+            **counters,
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+            "max_queue_depth_seen": max_queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "wait": self._wait_window.summary(),
+            "rate_limit": self.bucket.stats() if self.bucket else None,
+        }
+
+
+class _LeaderGone(Exception):
+    """The caller running a shared call was cancelled before it finished"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    def _join(self, key: Hashable):
+        # Returns (future, is_leader)
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self._counters["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `call()`, or the identical call another caller already started"""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except _LeaderGone:
+                    continue
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                future.set_exception(_LeaderGone())
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._finish(key, future)
+
+    def do_sync(self, key: Hashable, call: Callable[[], Any]) -> Any:
+        """Blocking counterpart of do(), sharing in-flight calls with async callers"""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return future.result()
+                except _LeaderGone:
+                    continue
+            try:
+                result = call()
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                self._finish(key, future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "in_flight_keys": len(self._calls)}
@@ -0,0 +1,111 @@
+"""
+Concurrency benchmark for /chat and quiz generation against the fake LLM server.
+
+Each provider call costs a fixed simulated latency, so if model calls overlap
+correctly the requests per second grow roughly linearly with concurrency
+(until LLM_MAX_WORKERS is reached). A blocking call would pin it at
+1 / latency regardless of concurrency.
+
+Usage (from ai-service/):
+    python benchmarks/bench_concurrency.py --latency-ms 200 --levels 1,4,16
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import start_in_thread  # noqa: E402
+
+SAMPLE_CONTENT = "WebSockets keep a persistent connection open between client and server. " * 40
+
+
+async def run_level(make_call, concurrency: int, total: int) -> float:
+    """Fire `total` calls with at most `concurrency` in flight; return requests per second"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await make_call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def probe_health(client, stop: asyncio.Event) -> list:
+    """Measure /health latency while the load is running"""
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.02)
+    return samples
+
+
+async def main(args):
+    import httpx
+    import main as service
+    import quiz_generator
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://service", timeout=120) as client:
+
+        async def chat_call():
+            response = await client.post("/chat", json={"message": "How do I join a room?"})
+            assert "response" in response.json(), response.text
+
+        async def quiz_call():
+            questions = await quiz_generator.generate_quiz_from_content(SAMPLE_CONTENT, 5, "Medium")
+            assert questions[0]["q"].startswith("Synthetic"), "fallback questions returned"
+
+        print(f"Simulated provider latency: {args.latency_ms:.0f} ms, "
+              f"LLM_MAX_WORKERS={os.environ['LLM_MAX_WORKERS']}")
+        print(f"{'scenario':<10}{'concurrency':>12}{'req/s':>10}{'speedup':>10}")
+        for name, call in (("chat", chat_call), ("quiz", quiz_call)):
+            baseline = None
+            for level in args.levels:
+                rps = await run_level(call, level, level * args.rounds)
+                baseline = baseline or rps
+                print(f"{name:<10}{level:>12}{rps:>10.1f}{rps / baseline:>9.1f}x")
+
+        # Health probes must stay fast while the model calls are in flight
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, stop))
+        await run_level(chat_call, max(args.levels), max(args.levels) * args.rounds)
+        stop.set()
+        samples = sorted(await probe)
+        if samples:
+            print(f"/health under load: {len(samples)} probes, "
+                  f"p50={samples[len(samples) // 2]:.1f} ms, max={samples[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    parser.add_argument("--rounds", type=int, default=3, help="requests per unit of concurrency")
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",")]
+
+    # Route every provider call to the local fake server
+    os.environ["GEMINI_API_KEY"] = "fake-benchmark-key"
+    os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{args.port}"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("LLM_MAX_WORKERS", str(max(args.levels)))
+    # Measure the service, not the client-side quota
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(max(args.levels)))
+
+    start_in_thread(args.port, args.latency_ms)
+    asyncio.run(main(args))
@@ -0,0 +1,83 @@
+"""
+Extraction benchmark on a synthetic PDF.
+
+Builds an N-page PDF (500 by default), then times the old serial
+`text += page.extract_text()` loop against text_extraction.extract_text with
+1..EXTRACT_WORKERS worker processes, and the early-stop path used for a
+10-question quiz. Reports pages per second and pages per second per core.
+
+Usage (from ai-service/):
+    python benchmarks/bench_extraction.py --pages 500 --workers 1,2,4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic_docs import write_pdf  # noqa: E402
+
+
+def serial_baseline(path: str) -> int:
+    """The original quadratic single-core loop"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    return len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+                        help="comma-separated worker counts to try")
+    parser.add_argument("--questions", type=int, default=10, help="quiz size for the early-stop run")
+    args = parser.parse_args()
+
+    import text_extraction
+    from quiz_chunking import text_budget
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(write_pdf(Path(tmp) / "synthetic.pdf", args.pages))
+        print(f"Synthetic PDF: {args.pages} pages, {os.path.getsize(path) / 1024:.0f} KiB, "
+              f"{os.cpu_count()} CPU(s) available\n")
+
+        start = time.perf_counter()
+        chars = serial_baseline(path)
+        elapsed = time.perf_counter() - start
+        print(f"{'serial baseline':<22} {elapsed:7.2f}s  {args.pages / elapsed:7.1f} pages/s  "
+              f"{args.pages / elapsed:7.1f} pages/s/core  ({chars} chars)")
+
+        for workers in (int(n) for n in args.workers.split(",")):
+            text_extraction.shutdown_pool()
+            text_extraction.EXTRACT_WORKERS = workers
+            if workers > 1:
+                # Start the pool outside the timed region (spawn start-up is a
+                # one-off cost per service process)
+                list(text_extraction._get_pool().map(abs, range(workers)))
+            start = time.perf_counter()
+            pages = sum(1 for _ in text_extraction.iter_pdf_pages(path, workers=workers))
+            elapsed = time.perf_counter() - start
+            cores = min(workers, os.cpu_count() or 1)
+            print(f"{f'{workers} worker(s)':<22} {elapsed:7.2f}s  {pages / elapsed:7.1f} pages/s  "
+                  f"{pages / elapsed / cores:7.1f} pages/s/core")
+
+        budget = text_budget(args.questions)
+        start = time.perf_counter()
+        text = text_extraction.extract_text(path, budget)
+        elapsed = time.perf_counter() - start
+        print(f"\nEarly stop for a {args.questions}-question quiz (budget {budget} chars): "
+              f"{len(text)} chars in {elapsed:.2f}s")
+        text_extraction.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Tail-latency benchmark for hedged quiz calls.
+
+The fake LLM server answers most calls after --latency-ms but a fraction
+(--tail-rate) only after --tail-latency-ms, like Gemini's occasional 30s
+responses. The same batch of quiz requests (distinct content, so nothing is
+cached or coalesced) is run with hedging off and on, for the async and the
+blocking generation paths, and p50/p90/p99 plus the extra upstream calls
+hedging cost are reported.
+
+Usage (from ai-service/):
+    python benchmarks/bench_hedging.py --requests 500 --tail-rate 0.03
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import start_in_thread  # noqa: E402
+
+
+async def run_batch(generate, label: str, total: int, concurrency: int):
+    """Time `total` quiz requests with at most `concurrency` in flight"""
+    from latency_stats import LatencyWindow
+
+    window = LatencyWindow(size=total)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            questions = await generate(f"{label} request {i}: TCP handshakes and congestion control. " * 10)
+            window.observe(time.perf_counter() - start)
+            assert questions[0]["q"].startswith("Synthetic"), "fallback questions returned"
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return window.summary()
+
+
+async def main(args, server):
+    import hedging
+    import quiz_generator
+    from llm_providers import run_blocking
+
+    paths = {
+        "async": lambda content: quiz_generator.generate_questions_async(content, 5, "Medium"),
+        "blocking": lambda content: run_blocking(quiz_generator.generate_questions, content, 5, "Medium"),
+    }
+
+    # Fill the per-route latency windows the hedge delay is taken from
+    await run_batch(paths["async"], "warmup", hedging.HEDGE_MIN_SAMPLES * 3, args.concurrency)
+
+    print(f"Simulated latency: {args.latency_ms:.0f} ms, {args.tail_rate:.0%} of calls take "
+          f"{args.tail_latency_ms:.0f} ms; hedge budget {hedging.HEDGE_BUDGET_RATIO:.0%} of calls\n")
+    print(f"{'path':<10}{'hedging':<9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'upstream calls':>16}"
+          f"{'hedged':>8}{'won':>6}{'skipped':>9}")
+    results = {}
+    for path, generate in paths.items():
+        for enabled in (False, True):
+            hedging.hedger = hedging.Hedger(enabled=enabled)
+            calls_before = server.config.app.state.calls
+            summary = await run_batch(generate, f"{path}-{enabled}", args.requests, args.concurrency)
+            calls = server.config.app.state.calls - calls_before
+            results[path, enabled] = summary
+            stats = hedging.hedger.stats()
+            print(f"{path:<10}{'on' if enabled else 'off':<9}{summary['p50_ms']:>9.0f}{summary['p90_ms']:>9.0f}"
+                  f"{summary['p99_ms']:>9.0f}{calls:>16}{stats['hedged']:>8}{stats['hedge_wins']:>6}"
+                  f"{stats['over_budget'] + stats['no_capacity']:>9}")
+
+    print()
+    for path in paths:
+        before, after = results[path, False]["p99_ms"], results[path, True]["p99_ms"]
+        print(f"{path}: p99 {before:.0f} ms -> {after:.0f} ms ({(before - after) / before:.0%} lower)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--tail-rate", type=float, default=0.03)
+    parser.add_argument("--tail-latency-ms", type=float, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    # Route every provider call to the local fake server, with nothing cached
+    os.environ["GEMINI_API_KEY"] = "fake-benchmark-key"
+    os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{args.port}"
+    os.environ["QUIZ_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    # The fake latency has almost no spread, so p90 sits a few ms above the
+    # median and scheduling jitter alone would trigger hedges; floor the delay
+    # the way HEDGE_MIN_DELAY_SECONDS does for real multi-second calls
+    os.environ.setdefault("HEDGE_MIN_DELAY_SECONDS", str(args.latency_ms * 1.5 / 1000))
+    # Leave headroom over the request concurrency for hedges and for losing
+    # Gemini calls, which hold their slot until the blocking call returns
+    os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(args.concurrency * 4))
+    os.environ.setdefault("LLM_MAX_WORKERS", os.environ["LLM_MAX_IN_FLIGHT"])
+
+    server = start_in_thread(args.port, args.latency_ms, tail_rate=args.tail_rate,
+                             tail_latency_ms=args.tail_latency_ms)
+    asyncio.run(main(args, server))
@@ -0,0 +1,142 @@
+"""
+Upload benchmark: peak memory and upload→extraction time for /generate-quiz.
+
+Each scenario runs in a fresh subprocess so its peak RSS (ru_maxrss) belongs
+to that one upload. The "buffered" scenario reproduces the previous handling
+(whole body read into memory, written to disk, then PdfReader(path), which
+reads the file into a second copy); "streaming" posts the same file through
+the real endpoint via an in-process ASGI client. The "limit" scenario sends an
+oversized upload and reports how much of it was read before the 413.
+
+Usage (from ai-service/):
+    python benchmarks/bench_upload.py --pages 200,1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def peak_rss_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def multipart_chunks(path: Path, boundary: str, chunk_size: int = 64 * 1024):
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"num_questions\"\r\n\r\n3\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{path.name}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode()
+    yield head
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def run_buffered(path: Path) -> dict:
+    import text_extraction
+    from pypdf import PdfReader
+
+    text_extraction.EXTRACT_WORKERS = 1
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    body = b"".join(multipart_chunks(path, "bench"))          # the framework's full read
+    data = body[body.index(b"\r\n\r\n", body.index(b'name="file"')) + 4:-len(b"\r\n--bench--\r\n")]
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as out:  # written to disk
+        out.write(data)
+    del body, data
+    reader = PdfReader(out.name)                              # read back into memory
+    text = "".join(page.extract_text() or "" for page in reader.pages)
+    elapsed = time.perf_counter() - started
+    os.remove(out.name)
+    return {"upload_to_extraction_ms": round(elapsed * 1000, 1), "chars": len(text),
+            "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1)}
+
+
+def run_streaming(path: Path, max_bytes: int = None) -> dict:
+    os.environ.setdefault("QUIZ_CACHE_ENABLED", "false")
+    os.environ["EXTRACT_WORKERS"] = "1"
+    if max_bytes:
+        os.environ["UPLOAD_MAX_BYTES"] = str(max_bytes)
+    import httpx
+    import main
+    import uploads
+
+    async def go():
+        baseline = peak_rss_mb()
+        sent = 0
+
+        async def body():
+            nonlocal sent
+            for chunk in multipart_chunks(path, "bench"):
+                sent += len(chunk)
+                yield chunk
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            response = await client.post(
+                "/generate-quiz", content=body(),
+                headers={"content-type": "multipart/form-data; boundary=bench"},
+            )
+        result = {"status": response.status_code, "body_bytes_sent": sent,
+                  "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1)}
+        window = main.get_window("upload_to_extraction")
+        if window.count:
+            result["upload_to_extraction_ms"] = round(window.percentile(100) * 1000, 1)
+        result["uploads"] = {k: v for k, v in uploads.stats().items() if k in ("spilled_to_disk", "max_rss_delta_bytes")}
+        return result
+
+    return asyncio.run(go())
+
+
+def child(args):
+    path = Path(args.child_file)
+    if args.child == "buffered":
+        result = run_buffered(path)
+    elif args.child == "limit":
+        result = run_streaming(path, max_bytes=path.stat().st_size // 4)
+    else:
+        result = run_streaming(path)
+    print("RESULT " + json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="200,1000", help="comma-separated synthetic PDF sizes")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    from synthetic_docs import write_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in (int(n) for n in args.pages.split(",")):
+            path = write_pdf(Path(tmp) / f"upload-{pages}.pdf", pages)
+            print(f"\n{pages}-page PDF, {path.stat().st_size / 1024 / 1024:.1f} MiB")
+            for scenario in ("buffered", "streaming", "limit"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", scenario, "--child-file", str(path)],
+                    capture_output=True, text=True, cwd=SERVICE_DIR, env={**os.environ, "GEMINI_API_KEY": ""},
+                )
+                lines = [line for line in out.stdout.splitlines() if line.startswith("RESULT ")]
+                result = json.loads(lines[-1][7:]) if lines else {"error": out.stderr.strip()[-300:]}
+                print(f"  {scenario:<10} {result}")
+
+
+if __name__ == "__main__":
+    main()
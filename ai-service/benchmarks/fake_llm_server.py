@@ -0,0 +1,328 @@
+"""
+Local stand-in for the Gemini and OpenAI HTTP APIs.
+
+It answers quiz prompts with a well-formed JSON array and chat prompts with a
+short text reply after a configurable delay, so the AI service can be load
+tested without network access or an API key. Streaming calls
+(Gemini streamGenerateContent, OpenAI stream=true) send the first chunk after
+the delay and the rest one word at a time.
+
+Faults can be injected to exercise retries and failover: a fraction of calls
+(error_rate) fail with error_status, and any model listed in failing_models
+always fails with 503.
+
+Quiz replies in free-text mode can be made noisy like real model output: a
+fraction of them (noise_rate) come back with a chat preamble and code fence,
+cut off mid-object, or with one question breaking the schema. Requests in
+structured-output mode (Gemini responseMimeType application/json, OpenAI
+response_format) always get clean JSON, as constrained decoding guarantees;
+OpenAI's is wrapped as {"questions": [...]}. Prompt sizes are tallied in
+prompt_tokens (4 characters per token, like the usage numbers reported).
+Replies longer than the request's output limit (Gemini maxOutputTokens,
+OpenAI max_tokens) are cut there and marked as stopped by the limit.
+Gemini models listed in thinking_models first spend thinking_tokens of that
+limit on hidden reasoning, reported only as thoughtsTokenCount. When the
+limit leaves nothing for the answer, the reply has no parts, like a real
+thinking model that ran out of output budget.
+
+Latency follows latency_distribution: "fixed" (every call takes
+latency_ms) or "lognormal" (median latency_ms, spread latency_sigma). A long
+tail can be added on top: a fraction of calls (tail_rate) take
+tail_latency_ms instead.
+
+Run standalone:
+    python benchmarks/fake_llm_server.py --port 9100 --latency-ms 250
+
+Point the service at it with:
+    GEMINI_API_ENDPOINT=http://127.0.0.1:9100
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+QUESTION_COUNT_RE = re.compile(r"Generate (\d+)")
+
+
+def fake_questions(count: int, topic: str = "the supplied content") -> list:
+    return [
+        {
+            "q": f"Synthetic question {i + 1} about {topic}?",
+            "options": [f"Option A{i}", f"Option B{i}", f"Option C{i}", f"Option D{i}"],
+            "correct": i % 4,
+        }
+        for i in range(count)
+    ]
+
+
+NOISE_KINDS = ("preamble", "truncated", "invalid")
+
+
+def is_quiz_prompt(prompt: str) -> bool:
+    return QUESTION_COUNT_RE.search(prompt) is not None
+
+
+def noisy(text: str, kind: str) -> str:
+    """A JSON array reply damaged the way free-text model output tends to be"""
+    if kind == "preamble":
+        return f"Sure! Here are the questions you asked for:\n```json\n{text}\n```\nLet me know if you need more."
+    if kind == "truncated":
+        # Hit the token limit partway through the last question
+        return text[:text.rfind("{") + 30]
+    questions = json.loads(text)
+    questions[-1]["options"] = questions[-1]["options"][:3]
+    return json.dumps(questions)
+
+
+def limit_output(text: str, max_tokens) -> tuple:
+    """(text cut to max_tokens at 4 characters per token, whether it was cut)"""
+    if max_tokens and len(text) > int(max_tokens) * 4:
+        return text[:int(max_tokens) * 4], True
+    return text, False
+
+
+def fake_reply(prompt: str, wrap: bool = False, noise: str = None) -> str:
+    """Quiz prompts get a JSON array (an object if `wrap`), anything else a plain chat answer"""
+    match = QUESTION_COUNT_RE.search(prompt)
+    if match:
+        # Distinct prompts (e.g. document sections) get distinct questions
+        topic = "section " + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        questions = fake_questions(int(match.group(1)), topic)
+        if wrap:
+            return json.dumps({"questions": questions})
+        text = json.dumps(questions)
+        return noisy(text, noise) if noise else text
+    return "To join a room, open the Join page and enter the room code shown by the host."
+
+
+def split_tokens(text: str) -> list:
+    """Word-sized pieces that concatenate back to `text`"""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def create_app(latency_ms: float = 250, token_interval_ms: float = 10, error_rate: float = 0.0,
+               error_status: int = 429, failing_models=(), seed: int = 0,
+               tail_rate: float = 0.0, tail_latency_ms: float = 0.0,
+               latency_distribution: str = "fixed", latency_sigma: float = 0.5,
+               noise_rate: float = 0.0, thinking_tokens: int = 0,
+               thinking_models=("gemini-flash-latest",)) -> FastAPI:
+    if latency_distribution not in ("fixed", "lognormal"):
+        raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+    app = FastAPI(title="Fake LLM")
+    app.state.latency = latency_ms / 1000
+    app.state.token_interval = token_interval_ms / 1000
+    app.state.error_rate = error_rate
+    app.state.error_status = error_status
+    app.state.failing_models = set(failing_models)
+    app.state.random = random.Random(seed)
+    app.state.tail_rate = tail_rate
+    app.state.tail_latency = tail_latency_ms / 1000
+    app.state.latency_distribution = latency_distribution
+    app.state.latency_sigma = latency_sigma
+    app.state.noise_rate = noise_rate
+    app.state.thinking_tokens = thinking_tokens
+    app.state.thinking_models = set(thinking_models)
+    app.state.calls = 0
+    app.state.quiz_calls = 0
+    app.state.prompt_tokens = 0
+    app.state.errors = 0
+    app.state.cancelled_streams = 0
+
+    async def stream_pieces(text: str):
+        """Yield word pieces, the first after the simulated latency"""
+        try:
+            for i, piece in enumerate(split_tokens(text)):
+                if i:
+                    await asyncio.sleep(app.state.token_interval)
+                yield piece
+        except (asyncio.CancelledError, GeneratorExit):
+            app.state.cancelled_streams += 1
+            raise
+
+    async def simulate_latency():
+        app.state.calls += 1
+        rng = app.state.random
+        if rng.random() < app.state.tail_rate:
+            await asyncio.sleep(app.state.tail_latency)
+        elif app.state.latency_distribution == "lognormal":
+            await asyncio.sleep(app.state.latency * rng.lognormvariate(0, app.state.latency_sigma))
+        else:
+            await asyncio.sleep(app.state.latency)
+
+    def quiz_noise(prompt: str, structured: bool):
+        """Count a quiz prompt and pick the damage (if any) done to its free-text reply"""
+        if not is_quiz_prompt(prompt):
+            return None
+        app.state.quiz_calls += 1
+        app.state.prompt_tokens += len(prompt) // 4
+        if structured or app.state.random.random() >= app.state.noise_rate:
+            return None
+        return app.state.random.choice(NOISE_KINDS)
+
+    def injected_error(model: str):
+        """An error response for this call, or None to answer normally"""
+        model = model.split("/")[-1].split(":")[0]
+        if model in app.state.failing_models:
+            status = 503
+        elif app.state.random.random() < app.state.error_rate:
+            status = app.state.error_status
+        else:
+            return None
+        app.state.errors += 1
+        return JSONResponse(
+            {"error": {"code": status, "message": f"Injected fake error for {model}", "status": "UNAVAILABLE"}},
+            status_code=status,
+            headers={"retry-after": "0"} if status == 429 else None,
+        )
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        body = await request.json()
+        prompt = "".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        await simulate_latency()
+        error = injected_error(model_action)
+        if error is not None:
+            return error
+        config = body.get("generationConfig") or body.get("generation_config") or {}
+        mime_type = config.get("responseMimeType") or config.get("response_mime_type")
+        text = fake_reply(prompt, noise=quiz_noise(prompt, mime_type == "application/json"))
+        max_tokens = config.get("maxOutputTokens") or config.get("max_output_tokens")
+        thoughts = 0
+        if model_action.split(":")[0] in app.state.thinking_models:
+            thoughts = app.state.thinking_tokens
+            if max_tokens:
+                thoughts = min(thoughts, int(max_tokens))
+                max_tokens = int(max_tokens) - thoughts
+        text, cut = limit_output(text, max_tokens)
+        if max_tokens == 0:
+            text, cut = "", True
+        if model_action.endswith(":streamGenerateContent"):
+            if request.query_params.get("alt") == "sse":
+                return StreamingResponse(gemini_sse_stream(text, len(prompt) // 4), media_type="text/event-stream")
+            return StreamingResponse(gemini_stream(text), media_type="application/json")
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}] if text else [], "role": "model"},
+                "finishReason": 2 if cut else 1,
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "thoughtsTokenCount": thoughts,
+                "totalTokenCount": (len(prompt) + len(text)) // 4 + thoughts,
+            },
+        }
+
+    async def gemini_stream(text: str):
+        # The REST transport expects one JSON array of response objects
+        yield "["
+        first = True
+        async for piece in stream_pieces(text):
+            chunk = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]}
+            yield ("" if first else ",\r\n") + json.dumps(chunk)
+            first = False
+        yield ",\r\n" + json.dumps({
+            "candidates": [{"content": {"parts": [], "role": "model"}, "finishReason": 1, "index": 0}],
+            "usageMetadata": {"candidatesTokenCount": len(text) // 4},
+        })
+        yield "]"
+
+    async def gemini_sse_stream(text: str, prompt_tokens: int):
+        async for piece in stream_pieces(text):
+            chunk = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]}
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+        yield "data: " + json.dumps({
+            "candidates": [{"content": {"parts": [{"text": ""}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text) // 4},
+        }) + "\r\n\r\n"
+
+    async def openai_stream(text: str, model: str):
+        async for piece in stream_pieces(text):
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        await simulate_latency()
+        error = injected_error(body.get("model", "fake"))
+        if error is not None:
+            return error
+        structured = bool(body.get("response_format"))
+        text = fake_reply(prompt, wrap=structured, noise=quiz_noise(prompt, structured))
+        text, cut = limit_output(text, body.get("max_tokens") or body.get("max_completion_tokens"))
+        if body.get("stream"):
+            return StreamingResponse(openai_stream(text, body.get("model", "fake")), media_type="text/event-stream")
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "length" if cut else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": (len(prompt) + len(text)) // 4,
+            },
+        }
+
+    return app
+
+
+def start_in_thread(port: int, latency_ms: float = 250, token_interval_ms: float = 10, **faults) -> uvicorn.Server:
+    """Start the fake server on a background thread and wait until it accepts connections"""
+    config = uvicorn.Config(create_app(latency_ms, token_interval_ms, **faults),
+                            host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini/OpenAI server for benchmarks")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=250)
+    parser.add_argument("--token-interval-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--failing-models", default="", help="comma-separated models that always return 503")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of calls that are slow")
+    parser.add_argument("--tail-latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-distribution", choices=("fixed", "lognormal"), default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the lognormal distribution")
+    parser.add_argument("--noise-rate", type=float, default=0.0, help="fraction of free-text quiz replies damaged")
+    parser.add_argument("--thinking-tokens", type=int, default=0,
+                        help="output tokens gemini-flash-latest spends thinking before it answers")
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.token_interval_ms, args.error_rate, args.error_status,
+                     [m for m in args.failing_models.split(",") if m],
+                     tail_rate=args.tail_rate, tail_latency_ms=args.tail_latency_ms,
+                     latency_distribution=args.latency_distribution, latency_sigma=args.latency_sigma,
+                     noise_rate=args.noise_rate, thinking_tokens=args.thinking_tokens)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
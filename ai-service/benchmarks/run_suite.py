@@ -0,0 +1,423 @@
+"""
+Benchmark suite with regression thresholds.
+
+Runs every scenario in-process against the fake LLM server (no network, no
+API key), with the quiz, chat and text caches off so each request does the
+full amount of work:
+
+    chat        POST /chat, distinct questions          -> latency, requests/s
+    chat_stream POST /chat/stream over SSE              -> time to first token
+    quiz        POST /generate-quiz with a distinct
+                synthetic PDF per request (upload,
+                extraction, sectioned generation)       -> latency, quizzes/s
+    extraction  text_extraction.extract_text over the
+                synthetic PDF/PPTX corpus               -> latency per document, pages/s
+    structured_output
+                quiz generation from text, first with
+                the free-text prompt, then with the
+                providers' JSON-schema mode             -> prompt tokens, parse failure rate
+    batch       POST /generate-quiz/batch, one batch
+                of texts with mixed sizes at a time     -> batch wall time vs its slowest item
+    startup     `import main` in a fresh interpreter
+                (what a cold start pays before uvicorn
+                can listen)                             -> import time, SDK modules loaded
+
+The fake provider answers after a lognormal delay (median --latency-ms) and
+fails --error-rate of calls with 429, so retries and tail behaviour are part
+of the numbers. Free-text quiz replies are damaged at --noise-rate the way
+model output is (chat preamble and fences, cut off, a question breaking the
+schema); schema-constrained replies are not, so the parse-failure comparison
+reflects that assumption while the prompt-token numbers are measured. Each
+scenario reports p50/p95/p99 and is checked against
+benchmarks/thresholds.json; the exit status is 1 when any limit is exceeded.
+Thresholds are absolute and sized for the default settings, with headroom
+for slower CI machines; adjust them in the same change as anything that
+legitimately moves a number.
+
+With --provider local the service answers from llm_adapters.LocalAdapter
+instead (LLM_PROVIDER=local): no HTTP server or sockets at all, a fixed
+--latency-ms per call and no injected errors or damaged replies, which
+isolates the service's own overhead. structured_output needs the fake
+server's prompt counters and is skipped there.
+
+Usage (from ai-service/):
+    python benchmarks/run_suite.py
+    python benchmarks/run_suite.py --scenarios chat,quiz --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import start_in_thread  # noqa: E402
+from synthetic_docs import build_corpus, page_lines, write_pdf  # noqa: E402
+
+THRESHOLDS_PATH = Path(__file__).resolve().parent / "thresholds.json"
+SCENARIOS = ("chat", "chat_stream", "quiz", "extraction", "structured_output", "batch", "startup")
+# Provider SDKs that must only be imported on first use, never by `import main`
+LAZY_MODULES = ("google.generativeai", "openai")
+STARTUP_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+async def run_load(call: Callable[[int], Any], total: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Run call(i) for i in range(total) with at most `concurrency` in flight.
+    call returns the latency to record in seconds (or None for the whole call)
+    and raises on a failed request.
+    """
+    from latency_stats import LatencyWindow
+
+    window = LatencyWindow(size=total)
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                latency = await call(i)
+            except Exception as e:
+                errors += 1
+                if errors <= 3:
+                    print(f"  request {i} failed: {e}")
+                return
+            window.observe(latency if latency is not None else time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        **window.summary(),
+        "requests": total,
+        "throughput": round((total - errors) / elapsed, 2),
+        "error_rate": round(errors / total, 4),
+    }
+
+
+async def chat_scenario(client, args) -> Dict[str, Any]:
+    async def call(i: int):
+        response = await client.post("/chat", json={"message": f"Question {i}: how do I join a quiz room?"})
+        body = response.json()
+        if "response" not in body:
+            raise RuntimeError(body.get("error", response.text))
+
+    return await run_load(call, args.requests, args.concurrency)
+
+
+async def chat_stream_scenario(client, args) -> Dict[str, Any]:
+    async def call(i: int):
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream("POST", "/chat/stream",
+                                 json={"message": f"Streaming question {i}: how do I host?"}) as response:
+            async for line in response.aiter_lines():
+                if line == "event: token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif line == "event: error":
+                    raise RuntimeError("stream reported an error")
+        if first_token is None:
+            raise RuntimeError("no tokens streamed")
+        return first_token
+
+    return await run_load(call, args.requests, args.concurrency)
+
+
+async def quiz_scenario(client, args, workdir: Path) -> Dict[str, Any]:
+    # A distinct document per request, so nothing is shared between requests
+    total = max(1, args.requests // 4)
+    documents = [write_pdf(workdir / f"quiz_{i}.pdf", 12, seed=1000 + i) for i in range(total)]
+
+    async def call(i: int):
+        with open(documents[i], "rb") as fh:
+            response = await client.post(
+                "/generate-quiz",
+                files={"file": (documents[i].name, fh, "application/pdf")},
+                data={"num_questions": "10", "difficulty": "Medium"},
+            )
+        quiz = response.json().get("quiz_data") or []
+        if response.status_code != 200 or not quiz or not quiz[0]["q"].startswith(("Synthetic", "According to the content")):
+            raise RuntimeError(f"status {response.status_code} or fallback questions returned")
+
+    return await run_load(call, total, max(1, args.concurrency // 2))
+
+
+async def structured_output_scenario(args, server) -> Dict[str, Any]:
+    """Quiz generation in free-text mode, then structured-output mode, on the same kind of content"""
+    from prometheus_client import REGISTRY
+    import quiz_generator
+
+    state = server.config.app.state
+    total = max(1, args.requests // 4)
+    results_by_mode = {}
+    original = quiz_generator.QUIZ_STRUCTURED_OUTPUT
+
+    def parses(result: str) -> float:
+        return REGISTRY.get_sample_value("ai_service_quiz_parses_total", {"result": result}) or 0
+
+    for structured in (False, True):
+        quiz_generator.QUIZ_STRUCTURED_OUTPUT = structured
+        mode = "json" if structured else "text"
+        before = {result: parses(result) for result in ("ok", "partial", "failed")}
+        calls, tokens = state.quiz_calls, state.prompt_tokens
+
+        async def call(i: int):
+            content = "\n".join(page_lines(i, lines=40, seed=2000 + i))
+            questions = await quiz_generator.generate_questions_async(content, 10, "Medium")
+            if len(questions) < 10:
+                raise RuntimeError(f"only {len(questions)} of 10 questions")
+
+        result = await run_load(call, total, max(1, args.concurrency // 2))
+        counts = {name: parses(name) - value for name, value in before.items()}
+        replies = sum(counts.values()) or 1
+        calls = state.quiz_calls - calls
+        result.update({
+            "prompt_tokens_per_call": round((state.prompt_tokens - tokens) / max(1, calls), 1),
+            "instruction_tokens": len(quiz_generator.build_quiz_prompt("", 10, "Medium")) // 4,
+            "parse_failure_rate": round((counts["partial"] + counts["failed"]) / replies, 4),
+            "calls_per_quiz": round(calls / total, 3),
+        })
+        results_by_mode[mode] = result
+    quiz_generator.QUIZ_STRUCTURED_OUTPUT = original
+
+    text, json_mode = results_by_mode["text"], results_by_mode["json"]
+    print(f"  {'mode':<6}{'prompt tokens/call':>20}{'instruction tokens':>20}{'parse failures':>16}{'calls/quiz':>12}")
+    for mode, result in results_by_mode.items():
+        print(f"  {mode:<6}{result['prompt_tokens_per_call']:>20.0f}{result['instruction_tokens']:>20}"
+              f"{result['parse_failure_rate']:>16.1%}{result['calls_per_quiz']:>12.2f}")
+    return {
+        **json_mode,
+        "text_mode": text,
+        "prompt_token_reduction": round(1 - json_mode["prompt_tokens_per_call"] / text["prompt_tokens_per_call"], 4),
+        "instruction_token_reduction": round(1 - json_mode["instruction_tokens"] / text["instruction_tokens"], 4),
+    }
+
+
+async def batch_scenario(client, args) -> Dict[str, Any]:
+    """Batches of quizzes of mixed sizes; a batch should take about as long as its slowest item"""
+    import quiz_batch
+
+    size = quiz_batch.QUIZ_BATCH_CONCURRENCY
+    total = max(1, args.requests // (4 * size))
+    ratios, speedups = [], []
+
+    async def call(i: int):
+        items = [
+            {"id": f"{i}-{j}", "content": "\n".join(page_lines(j, lines=20 + 10 * (j % 3), seed=3000 + i * size + j)),
+             "num_questions": 3 + j % 8, "difficulty": ("Easy", "Medium", "Hard")[j % 3]}
+            for j in range(size)
+        ]
+        response = await client.post("/generate-quiz/batch", json={"items": items})
+        events = [json.loads(line[5:]) for line in response.text.splitlines() if line.startswith("data:")]
+        if response.status_code != 200 or not events:
+            raise RuntimeError(f"status {response.status_code}")
+        done = events[-1]
+        if done.get("ok") != size:
+            raise RuntimeError(f"{done.get('ok')} of {size} items ok")
+        ratios.append(done["total_ms"] / done["slowest_item_ms"])
+        speedups.append(done["sum_item_ms"] / done["total_ms"])
+        return done["total_ms"] / 1000
+
+    result = await run_load(call, total, 1)
+    return {
+        **result,
+        "items_per_batch": size,
+        "wall_to_slowest_item": round(sum(ratios) / max(1, len(ratios)), 3),
+        "speedup_over_sequential": round(sum(speedups) / max(1, len(speedups)), 2),
+    }
+
+
+def extraction_scenario(args, workdir: Path) -> Dict[str, Dict[str, Any]]:
+    import text_extraction
+    from latency_stats import LatencyWindow
+
+    results = {}
+    for name, (path, pages) in build_corpus(workdir / "corpus").items():
+        window = LatencyWindow(size=args.repeats)
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            text_extraction.extract_text(str(path))
+            window.observe(time.perf_counter() - start)
+        summary = window.summary()
+        results[f"extraction_{name}"] = {
+            **summary,
+            "requests": args.repeats,
+            "throughput": round(pages / (summary["p50_ms"] / 1000), 1),
+            "error_rate": 0.0,
+        }
+    text_extraction.shutdown_pool()
+    return results
+
+
+def startup_scenario(args) -> Dict[str, Any]:
+    """Cold import of the app, each in a new interpreter so nothing is already in sys.modules"""
+    import subprocess
+    from latency_stats import LatencyWindow
+
+    window = LatencyWindow(size=args.repeats)
+    loaded = set()
+    for _ in range(args.repeats):
+        probe = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=SERVICE_DIR, env=os.environ,
+                               capture_output=True, text=True, timeout=120)
+        if probe.returncode != 0:
+            raise RuntimeError(f"import main failed: {probe.stderr.strip()[-500:]}")
+        report = json.loads(probe.stdout.strip().splitlines()[-1])
+        window.observe(report["seconds"])
+        loaded.update(report["loaded"])
+    if loaded:
+        print(f"  imported at startup: {', '.join(sorted(loaded))}")
+    return {
+        **window.summary(),
+        "requests": args.repeats,
+        "throughput": 0.0,
+        "error_rate": 0.0,
+        "lazy_modules_loaded": len(loaded),
+    }
+
+
+def check(results: Dict[str, Dict[str, Any]], thresholds: Dict[str, Dict[str, float]]) -> List[str]:
+    """Threshold violations as readable lines (empty when everything is within limits)"""
+    failures = []
+    for scenario, limits in thresholds.items():
+        result = results.get(scenario)
+        if result is None or not isinstance(limits, dict):
+            continue
+        for key, limit in limits.items():
+            if key.startswith("min_"):
+                name = key[4:]
+                if result.get(name) is not None and result[name] < limit:
+                    failures.append(f"{scenario}: {name} {result[name]} < {limit}")
+            elif result.get(key) is not None and result[key] > limit:
+                failures.append(f"{scenario}: {key} {result[key]} > {limit}")
+    return failures
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    print(f"\n{'scenario':<24}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'throughput':>12}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['requests']:>6}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+              f"{result['p99_ms']:>10.1f}{result['throughput']:>12.1f}{result['error_rate']:>8.1%}")
+
+
+async def run_http_scenarios(names: List[str], args, workdir: Path, server) -> Dict[str, Dict[str, Any]]:
+    import httpx
+    import main as service
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # ASGITransport does not run the lifespan, whose pre-warm a deployed service has
+    # done before its first requests; without it they would all wait on the SDK import
+    service.get_registry().start()
+    results = {}
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://service", timeout=120) as client:
+        for name in names:
+            print(f"Running {name}...")
+            if name == "chat":
+                results[name] = await chat_scenario(client, args)
+            elif name == "chat_stream":
+                results[name] = await chat_stream_scenario(client, args)
+            elif name == "quiz":
+                results[name] = await quiz_scenario(client, args, workdir)
+            elif name == "structured_output":
+                results[name] = await structured_output_scenario(args, server)
+            elif name == "batch":
+                results[name] = await batch_scenario(client, args)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--provider", choices=("fake", "local"), default="fake",
+                        help="fake: HTTP fake provider server; local: the in-process deterministic backend")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--latency-ms", type=float, default=150, help="median simulated provider latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--noise-rate", type=float, default=0.1, help="fraction of free-text quiz replies damaged")
+    parser.add_argument("--requests", type=int, default=200, help="requests per chat scenario (quiz runs a quarter)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=5, help="extractions per corpus document, cold imports for startup")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS_PATH))
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--no-check", action="store_true", help="report only, never fail")
+    args = parser.parse_args()
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Everything goes to the fake server, with every cache off
+    os.environ.update({
+        "GEMINI_API_KEY": "fake-benchmark-key",
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{args.port}",
+        "OPENAI_API_KEY": "",
+        "QUIZ_CACHE_ENABLED": "false",
+        "CHAT_CACHE_ENABLED": "false",
+        "TEXT_CACHE_ENABLED": "false",
+        "LLM_REQUESTS_PER_MINUTE": "0",
+    })
+    os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(args.concurrency * 2))
+    os.environ.setdefault("LLM_MAX_WORKERS", str(args.concurrency * 2))
+
+    server = None
+    if args.provider == "local":
+        os.environ.update({"LLM_PROVIDER": "local", "LOCAL_LLM_LATENCY_MS": str(args.latency_ms)})
+        if "structured_output" in names:
+            print("Skipping structured_output (needs the fake server)")
+            names.remove("structured_output")
+        print(f"Local provider: {args.latency_ms:.0f} ms per call, no errors; {os.cpu_count()} CPU(s)")
+    else:
+        server = start_in_thread(args.port, args.latency_ms, error_rate=args.error_rate, error_status=429,
+                                 latency_distribution="lognormal", latency_sigma=args.latency_sigma,
+                                 noise_rate=args.noise_rate)
+        print(f"Fake provider: lognormal latency, median {args.latency_ms:.0f} ms (sigma {args.latency_sigma}), "
+              f"{args.error_rate:.0%} 429s; {os.cpu_count()} CPU(s)")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if "startup" in names:
+            print("Running startup...")
+            results["startup"] = startup_scenario(args)
+        http_names = [name for name in names if name not in ("extraction", "startup")]
+        if http_names:
+            results.update(asyncio.run(run_http_scenarios(http_names, args, workdir, server)))
+        if "extraction" in names:
+            print("Running extraction...")
+            results.update(extraction_scenario(args, workdir))
+
+    print_table(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if args.no_check:
+        return
+    thresholds = json.loads(Path(args.thresholds).read_text())
+    failures = check(results, thresholds)
+    if failures:
+        print("\nRegressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nAll scenarios within {Path(args.thresholds).name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Synthetic PDF and PPTX documents for extraction benchmarks.
+
+The PDF writer emits a minimal but valid PDF (one Helvetica font, one text
+content stream per page) without any third-party dependency, so benchmarks
+can build documents of any page count on the fly. Text is deterministic for a
+given seed so runs are comparable.
+
+CORPUS lists the documents the benchmark suite extracts: PDFs and PPTX decks
+from a handful of pages up to a long textbook-sized PDF.
+"""
+import random
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+WORDS = (
+    "network protocol latency throughput packet router switch cache memory "
+    "thread process kernel scheduler socket stream buffer queue compiler "
+    "function variable object class module database index query transaction "
+    "replica shard consensus leader election timeout retry backoff client server"
+).split()
+
+
+def page_lines(page: int, lines: int = 45, words_per_line: int = 12, seed: int = 0) -> List[str]:
+    rng = random.Random(seed * 100003 + page)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words_per_line)).capitalize() + "."
+        for _ in range(lines)
+    ]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: int, lines_per_page: int = 45, seed: int = 0) -> Path:
+    """Write a `pages`-page text PDF to `path`"""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1}"] + page_lines(page, lines_per_page, seed=seed)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        data = stream.encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+
+    path = Path(path)
+    path.write_bytes(bytes(out))
+    return path
+
+
+def write_pptx(path: Path, slides: int, bullets_per_slide: int = 6, seed: int = 0) -> Path:
+    """Write a `slides`-slide title-and-content deck to `path`"""
+    from pptx import Presentation
+
+    deck = Presentation()
+    layout = deck.slide_layouts[1]
+    for number in range(slides):
+        slide = deck.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {number + 1}"
+        body = slide.placeholders[1].text_frame
+        lines = page_lines(number, bullets_per_slide, seed=seed)
+        body.text = lines[0]
+        for line in lines[1:]:
+            body.add_paragraph().text = line
+    path = Path(path)
+    deck.save(str(path))
+    return path
+
+
+# name -> (format, pages or slides)
+CORPUS: Dict[str, Tuple[str, int]] = {
+    "pdf_small": ("pdf", 10),
+    "pdf_medium": ("pdf", 100),
+    "pdf_large": ("pdf", 500),
+    "pptx_small": ("pptx", 10),
+    "pptx_large": ("pptx", 80),
+}
+
+
+def build_corpus(directory: Path, names: List[str] = None, seed: int = 0) -> Dict[str, Tuple[Path, int]]:
+    """Write the CORPUS documents (or the named subset) into `directory`; returns name -> (path, pages)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    documents = {}
+    for name in names or list(CORPUS):
+        kind, pages = CORPUS[name]
+        path = directory / f"{name}.{kind}"
+        writer = write_pdf if kind == "pdf" else write_pptx
+        documents[name] = (writer(path, pages, seed=seed), pages)
+    return documents
@@ -0,0 +1,366 @@
+"""
+Exact and near-duplicate response cache for the /chat assistant.
+
+Prompts are normalized (case, punctuation, filler words, plurals) and looked
+up exactly first. On a miss, a MinHash signature over character 3-grams is
+bucketed with LSH banding to find candidate prompts, and a candidate is reused
+only if its true Jaccard similarity reaches CHAT_CACHE_SIMILARITY. Everything is local and
+CPU-only; memory is bounded by CHAT_CACHE_MAX_ENTRIES with LRU eviction, and
+every entry expires after CHAT_CACHE_TTL_SECONDS.
+
+Each entry remembers how long the original model call took and how many
+tokens it used, so hits can be reported as latency and cost saved.
+
+With several worker processes (CHAT_CACHE_SHARED, on by default when
+SERVICE_WORKERS > 1) every stored answer is also appended to a SQLite table,
+and each process folds the rows the others added into its own index before a
+lookup, so the hit rate does not drop as workers are added. Async callers
+use alookup()/astore(), which then run on a worker thread so the event loop
+never waits on SQLite.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from dotenv import load_dotenv
+
+import metrics
+from shared_state import SERVICE_WORKERS, SHARED_STATE_PATH, connect
+
+load_dotenv()
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "true").lower() == "true"
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.85"))
+CHAT_CACHE_TTL_SECONDS = int(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "2048"))
+CHAT_CACHE_SHARED = os.getenv("CHAT_CACHE_SHARED", str(SERVICE_WORKERS > 1)).lower() == "true"
+# USD per 1K tokens, used only to report money saved by cache hits
+CHAT_COST_PER_1K_INPUT = float(os.getenv("CHAT_COST_PER_1K_INPUT", "0.000075"))
+CHAT_COST_PER_1K_OUTPUT = float(os.getenv("CHAT_COST_PER_1K_OUTPUT", "0.0003"))
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+# Near-duplicate candidates verified with exact Jaccard per lookup
+MAX_CANDIDATES = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seeds so signatures are stable across processes and restarts
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+    )
+    for i in range(NUM_PERMUTATIONS)
+]
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+# Function words that rarely change what is being asked. Question words and
+# negations are deliberately kept: "why"/"how" and "not" change the answer.
+_STOPWORDS = frozenset(
+    "a an the i me my we our you your it its this that is are am was be been "
+    "do does did can could would should will shall may might must to of in on "
+    "for at by with from and or please hey hi hello just".split()
+)
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, and fold simple plurals"""
+    text = text.lower().replace("n't", " not").replace("cannot", "can not")
+    words = _PUNCTUATION_RE.sub(" ", text).split()
+    return " ".join(_singular(word) for word in words if word not in _STOPWORDS)
+
+
+def shingles(normalized: str) -> FrozenSet[int]:
+    """Stable 64-bit hashes of the character 3-grams of a normalized prompt"""
+    padded = f" {normalized} "
+    grams = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    return frozenset(
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for gram in grams
+    )
+
+
+def minhash(shingle_set: FrozenSet[int]) -> List[int]:
+    return [
+        min((a * s + b) % _MERSENNE_PRIME for s in shingle_set)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def jaccard(left: FrozenSet[int], right: FrozenSet[int]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) when the provider reports none"""
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class ChatCacheEntry:
+    key: str
+    response: str
+    shingles: FrozenSet[int]
+    bands: List[tuple]
+    created_at: float
+    latency_seconds: float
+    input_tokens: int
+    output_tokens: int
+
+    @property
+    def cost(self) -> float:
+        return (self.input_tokens * CHAT_COST_PER_1K_INPUT + self.output_tokens * CHAT_COST_PER_1K_OUTPUT) / 1000
+
+
+class ChatCache:
+    """Bounded in-memory cache of chat answers with near-duplicate lookup"""
+
+    def __init__(self, similarity: float = CHAT_CACHE_SIMILARITY, ttl_seconds: int = CHAT_CACHE_TTL_SECONDS,
+                 max_entries: int = CHAT_CACHE_MAX_ENTRIES, shared_path: Optional[str] = None):
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ChatCacheEntry]" = OrderedDict()
+        self._buckets: Dict[tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                          "shared_loaded": 0}
+        self._latency_saved = 0.0
+        self._cost_saved = 0.0
+        self._tokens_saved = 0
+        self._db = None
+        self._synced_id = 0
+        self._own_ids: Set[int] = set()
+        if shared_path:
+            self._db = connect(shared_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_cache ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " prompt_key TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " latency_seconds REAL NOT NULL,"
+                " input_tokens INTEGER NOT NULL,"
+                " output_tokens INTEGER NOT NULL)"
+            )
+            self._db.commit()
+
+    def lookup(self, prompt: str) -> Optional[str]:
+        """Return a cached answer for this prompt or a near-duplicate of it"""
+        key = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            self._sync(now)
+            if not key:
+                self._counters["misses"] += 1
+                metrics.cache_lookup("chat", "miss")
+                return None
+
+            entry = self._fresh(key, now)
+            if entry is not None:
+                self._record_hit(entry, "exact_hits")
+                return entry.response
+
+            prompt_shingles = shingles(key)
+            best, best_score = None, 0.0
+            for candidate_key in self._candidates(minhash(prompt_shingles)):
+                candidate = self._fresh(candidate_key, now)
+                if candidate is None:
+                    continue
+                score = jaccard(prompt_shingles, candidate.shingles)
+                if score > best_score:
+                    best, best_score = candidate, score
+
+            if best is not None and best_score >= self.similarity:
+                self._record_hit(best, "similar_hits")
+                return best.response
+
+            self._counters["misses"] += 1
+            metrics.cache_lookup("chat", "miss")
+            return None
+
+    def store(self, prompt: str, response: str, latency_seconds: float,
+              input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        """Remember a model answer along with what it cost to produce"""
+        key = normalize_prompt(prompt)
+        if not key:
+            # Pure small talk ("hi", "can you help") carries nothing to match on
+            return
+        entry = self._entry(
+            key, response, time.time(), latency_seconds,
+            input_tokens if input_tokens is not None else estimate_tokens(prompt),
+            output_tokens if output_tokens is not None else estimate_tokens(response),
+        )
+        with self._lock:
+            self._insert(entry)
+            self._counters["stores"] += 1
+            if self._db is not None:
+                self._share(entry)
+
+    async def alookup(self, prompt: str) -> Optional[str]:
+        """lookup() for the event loop; off it when the shared table has to be read"""
+        if self._db is None:
+            return self.lookup(prompt)
+        return await asyncio.to_thread(self.lookup, prompt)
+
+    async def astore(self, prompt: str, response: str, latency_seconds: float,
+                     input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        """store() for the event loop; off it when the answer is written to the shared table"""
+        if self._db is None:
+            self.store(prompt, response, latency_seconds, input_tokens, output_tokens)
+        else:
+            await asyncio.to_thread(self.store, prompt, response, latency_seconds, input_tokens, output_tokens)
+
+    def _entry(self, key: str, response: str, created_at: float, latency_seconds: float,
+               input_tokens: int, output_tokens: int) -> ChatCacheEntry:
+        prompt_shingles = shingles(key)
+        signature = minhash(prompt_shingles)
+        return ChatCacheEntry(
+            key=key,
+            response=response,
+            shingles=prompt_shingles,
+            bands=[(band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]))
+                   for band in range(LSH_BANDS)],
+            created_at=created_at,
+            latency_seconds=latency_seconds,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+        )
+
+    def _insert(self, entry: ChatCacheEntry):
+        # Caller holds self._lock
+        self._remove(entry.key)
+        self._entries[entry.key] = entry
+        for band in entry.bands:
+            self._buckets.setdefault(band, set()).add(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._counters["evictions"] += 1
+
+    def _share(self, entry: ChatCacheEntry):
+        # Caller holds self._lock. The table keeps about as many rows as one
+        # process's index holds, so it stays bounded too.
+        cursor = self._db.execute(
+            "INSERT INTO chat_cache (prompt_key, response, created_at, latency_seconds, input_tokens, output_tokens)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (entry.key, entry.response, entry.created_at, entry.latency_seconds, entry.input_tokens,
+             entry.output_tokens),
+        )
+        self._own_ids.add(cursor.lastrowid)
+        self._db.execute("DELETE FROM chat_cache WHERE id <= ? OR created_at <= ?",
+                         (cursor.lastrowid - self.max_entries, entry.created_at - self.ttl_seconds))
+        self._db.commit()
+
+    def _sync(self, now: float):
+        # Caller holds self._lock. Fold in the answers other processes stored
+        # since the last lookup (the newest max_entries of them at most).
+        if self._db is None:
+            return
+        rows = self._db.execute(
+            "SELECT id, prompt_key, response, created_at, latency_seconds, input_tokens, output_tokens"
+            " FROM chat_cache WHERE id > ? AND created_at > ? ORDER BY id DESC LIMIT ?",
+            (self._synced_id, now - self.ttl_seconds, self.max_entries),
+        ).fetchall()
+        for row_id, *fields in reversed(rows):
+            if row_id not in self._own_ids:
+                self._insert(self._entry(*fields))
+                self._counters["shared_loaded"] += 1
+        if rows:
+            self._synced_id = rows[0][0]
+            self._own_ids = {row_id for row_id in self._own_ids if row_id > self._synced_id}
+
+    def _candidates(self, signature: List[int]) -> List[str]:
+        # Caller holds self._lock. Entries sharing the most LSH bands are the
+        # likeliest near-duplicates; only the top few are verified exactly.
+        collisions: Counter = Counter()
+        for band in range(LSH_BANDS):
+            bucket = self._buckets.get((band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])))
+            if bucket:
+                collisions.update(bucket)
+        return [key for key, _ in collisions.most_common(MAX_CANDIDATES)]
+
+    def _fresh(self, key: str, now: float) -> Optional[ChatCacheEntry]:
+        # Caller holds self._lock. Expired entries are dropped on access.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.created_at >= self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        # Caller holds self._lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _record_hit(self, entry: ChatCacheEntry, counter: str):
+        # Caller holds self._lock
+        self._counters[counter] += 1
+        metrics.cache_lookup("chat", counter[:-1])
+        self._latency_saved += entry.latency_seconds
+        self._cost_saved += entry.cost
+        self._tokens_saved += entry.input_tokens + entry.output_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+            latency_saved = self._latency_saved
+            cost_saved = self._cost_saved
+            tokens_saved = self._tokens_saved
+        hits = counters["exact_hits"] + counters["similar_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "shared": self._db is not None,
+            "similarity_threshold": self.similarity,
+            "ttl_seconds": self.ttl_seconds,
+            "latency_saved_seconds": round(latency_saved, 3),
+            "tokens_saved": tokens_saved,
+            "cost_saved_usd": round(cost_saved, 6),
+        }
+
+
+_chat_cache: Optional[ChatCache] = None
+_chat_cache_lock = threading.Lock()
+
+
+def get_chat_cache() -> Optional[ChatCache]:
+    """Return the process-wide chat cache, or None when CHAT_CACHE_ENABLED=false"""
+    global _chat_cache
+    if not CHAT_CACHE_ENABLED:
+        return None
+    if _chat_cache is None:
+        with _chat_cache_lock:
+            if _chat_cache is None:
+                _chat_cache = ChatCache(shared_path=SHARED_STATE_PATH if CHAT_CACHE_SHARED else None)
+    return _chat_cache
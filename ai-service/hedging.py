@@ -0,0 +1,190 @@
+"""
+Hedged quiz calls to cut provider tail latency.
+
+Most quiz calls finish in a few seconds but a few take many times longer.
+When a call has run past the route's observed p90 (HEDGE_PERCENTILE) without
+answering, a duplicate is sent (to the next failover route when there is one,
+otherwise the same route) and whichever returns a valid response first wins;
+the other is cancelled.
+
+Hedges are paid for out of a budget: every call earns HEDGE_BUDGET_RATIO of a
+hedge credit (up to HEDGE_BUDGET_BURST banked) and every hedge spends one, so
+hedged traffic never exceeds that fraction of calls however slow the provider
+gets. No hedges are sent until a route has HEDGE_MIN_SAMPLES latencies to
+take the percentile from, nor when the hedge's provider has no free
+admission slot (a queued duplicate would only add load to a busy provider).
+The percentile is taken over the model's provider_call latencies (see
+metrics), which start once the call holds its admission slot, so queueing
+under load does not push the hedge delay up.
+
+The Gemini REST client is blocking, so a losing Gemini call cannot be
+interrupted: its result is discarded when it eventually returns. OpenAI
+calls are cancelled outright.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent import futures
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+from latency_stats import get_window
+from metrics import model_window_name
+from llm_providers import LLM_MAX_WORKERS, get_registry
+from resilience import Route
+
+load_dotenv()
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# At most this fraction of calls is duplicated (0.2 = at most 20% extra spend).
+# Hedging at p90 fires on ~10% of calls, so leave headroom above that
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.2"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "10"))
+
+T = TypeVar("T")
+
+
+def hedge_route(route: Route, routes: List[Route]) -> Route:
+    """Where a duplicate of a call on `route` goes: the next failover route, else the same one"""
+    try:
+        index = routes.index(route)
+    except ValueError:
+        return route
+    return routes[index + 1] if index + 1 < len(routes) else route
+
+
+def latency_window(route: Route):
+    return get_window(model_window_name(route.provider, route.model))
+
+
+class Hedger:
+    """Decides when to hedge, enforces the hedge budget and keeps the counters"""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, min_delay: float = HEDGE_MIN_DELAY_SECONDS,
+                 budget_ratio: float = HEDGE_BUDGET_RATIO, budget_burst: float = HEDGE_BUDGET_BURST):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self._credits = budget_burst
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "over_budget": 0, "no_capacity": 0}
+
+    def delay(self, route: Route) -> Optional[float]:
+        """How long to wait before hedging a call on this route; None to never hedge it"""
+        with self._lock:
+            self._counters["calls"] += 1
+            self._credits = min(self.budget_burst, self._credits + self.budget_ratio)
+        if not self.enabled:
+            return None
+        window = latency_window(route)
+        if window.count < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def spend(self, alternate: Route) -> bool:
+        """Take one hedge credit; False when the budget is used up or `alternate` is saturated"""
+        if not get_registry().admission(alternate.provider).has_capacity():
+            with self._lock:
+                self._counters["no_capacity"] += 1
+            return False
+        with self._lock:
+            if self._credits < 1:
+                self._counters["over_budget"] += 1
+                return False
+            self._credits -= 1
+            self._counters["hedged"] += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self._counters["hedge_wins"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            credits = self._credits
+        return {
+            **counters,
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "hedge_rate": round(counters["hedged"] / counters["calls"], 4) if counters["calls"] else 0.0,
+            "budget_ratio": self.budget_ratio,
+            "budget_credits": round(credits, 2),
+        }
+
+
+hedger = Hedger()
+
+# Blocking calls race on their own threads so the caller can wait on both
+_executor = futures.ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS * 2, thread_name_prefix="hedge")
+
+
+async def hedged_call(route: Route, routes: List[Route], call: Callable[[Route], Awaitable[T]]) -> T:
+    """
+    Await call(route), sending a duplicate to hedge_route() once it runs past
+    the hedge delay, and return the first successful result. Raises the
+    primary's error only when every call sent has failed.
+    """
+    delay = hedger.delay(route)
+    if delay is None:
+        return await call(route)
+
+    primary = asyncio.ensure_future(call(route))
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        alternate = hedge_route(route, routes)
+        if done or not hedger.spend(alternate):
+            return await primary
+
+        print(f"{route} still running after {delay:.2f}s; hedging on {alternate}")
+        hedge = asyncio.ensure_future(call(alternate))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedger.won()
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def hedged_call_sync(route: Route, routes: List[Route], call: Callable[[Route], T]) -> T:
+    """Blocking counterpart of hedged_call; the losing call finishes in the background"""
+    delay = hedger.delay(route)
+    if delay is None:
+        return call(route)
+
+    primary = _executor.submit(contextvars.copy_context().run, call, route)
+    done, _ = futures.wait({primary}, timeout=delay)
+    alternate = hedge_route(route, routes)
+    if done or not hedger.spend(alternate):
+        return primary.result()
+
+    print(f"{route} still running after {delay:.2f}s; hedging on {alternate}")
+    hedge = _executor.submit(contextvars.copy_context().run, call, alternate)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    hedger.won()
+                for other in pending:
+                    other.cancel()
+                return future.result()
+    return primary.result()
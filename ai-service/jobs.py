@@ -0,0 +1,569 @@
+"""
+Background quiz jobs with a pollable status API.
+
+A quiz from a large document can take longer than a client (or Render's
+proxy) is willing to hold a request open, so /jobs/quiz only stores the
+document and returns a job id; a small pool of workers on the event loop
+does the extraction and generation, and clients poll /jobs/{id} for progress
+and fetch /jobs/{id}/result once it is done.
+
+Jobs live in a SQLite table (JOBS_DB_PATH) and their input documents under
+JOBS_INPUT_DIR, so a restart loses nothing and every worker process of the
+service sees the same jobs: workers claim the oldest queued job with an
+atomic update, so a job runs once whichever process accepted it. A process
+that stops puts its running jobs back in the queue; one that dies leaves
+them to be re-queued once their heartbeat is JOBS_STALE_SECONDS old. A
+resumed job starts over from extraction, but the extracted-text and quiz
+caches make the work it had already finished cheap to redo. Cancelling a
+job running in another process is passed on through the table.
+
+Submissions are deduplicated: a job for the same document (by SHA-256) with
+the same question count and difficulty that is still queued, running or
+done is returned instead of starting another one. The lookup and the insert
+happen in one write transaction, so identical submissions racing each other
+(in one process or several) still make a single job. A job that only
+finished with fallback questions is not reused, so resubmitting it tries the
+provider again, just as the quiz cache never stores fallback output.
+
+Progress is reported per stage: queued, extracting, generating (section k of
+n as sections finish), validating, then one of done, failed or cancelled.
+Progress and results are written on worker threads, never on the event loop.
+Document jobs get at least MIN_FILE_QUESTIONS questions, like POST
+/generate-quiz.
+Finished jobs, and their input files, are deleted after JOBS_TTL_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import quiz_generator
+import quiz_generator_gemini
+import token_budget
+from quiz_cache import normalize_text
+from quiz_chunking import text_budget
+from quiz_parser import validate_question
+from shared_state import connect
+from text_cache import extract_text_cached, file_digest
+from uploads import UploadBuffer
+
+load_dotenv()
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() == "true"
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", str(Path(__file__).parent / "cache" / "jobs.sqlite3"))
+JOBS_INPUT_DIR = os.getenv("JOBS_INPUT_DIR", str(Path(__file__).parent / "cache" / "jobs"))
+# Jobs generated at once; each one still fans out into concurrent section calls
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_TTL_SECONDS = int(os.getenv("JOBS_TTL_SECONDS", str(24 * 3600)))
+# How often idle workers look for jobs queued by other processes and running jobs are heartbeated
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+# A running job whose heartbeat is this old belonged to a process that died
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "30"))
+
+def job_key(input_digest: str, num_questions: int, difficulty: str) -> str:
+    """Deduplication key: the same document asked for the same quiz"""
+    return hashlib.sha256(f"{input_digest}\0{num_questions}\0{difficulty.strip().lower()}".encode()).hexdigest()
+
+
+class JobStore:
+    """SQLite table of jobs: parameters, state, progress and result"""
+
+    COLUMNS = ("id", "key", "state", "progress", "filename", "input_path", "num_questions", "difficulty",
+               "result", "error", "created_at", "started_at", "finished_at", "owner", "heartbeat_at",
+               "cancel_requested")
+    # Columns added after the first release of the table, and added to older files on open
+    MIGRATIONS = {"owner": "TEXT", "heartbeat_at": "REAL", "cancel_requested": "INTEGER NOT NULL DEFAULT 0"}
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " progress TEXT NOT NULL,"
+            " filename TEXT,"
+            " input_path TEXT NOT NULL,"
+            " num_questions INTEGER NOT NULL,"
+            " difficulty TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            f" {', '.join(f'{column} {definition}' for column, definition in self.MIGRATIONS.items())})"
+        )
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, definition in self.MIGRATIONS.items():
+            if column not in existing:
+                try:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError:
+                    # Another worker process added it first
+                    pass
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        self._db.commit()
+
+    def _row(self, row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["progress"] = json.loads(job["progress"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def _find_reusable(self, key: str) -> Optional[tuple]:
+        # Caller holds the lock. Done jobs with an error only have fallback questions
+        return self._db.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE key = ?"
+            " AND (state IN ('queued', 'running') OR (state = 'done' AND error IS NULL))"
+            " ORDER BY created_at DESC LIMIT 1", (key,),
+        ).fetchone()
+
+    def find_reusable(self, key: str) -> Optional[Dict[str, Any]]:
+        """An unexpired job for this key that is queued, running or done with real (not fallback) questions"""
+        with self._lock:
+            row = self._find_reusable(key)
+        return self._row(row)
+
+    def create(self, key: str, filename: Optional[str], input_path: str, num_questions: int,
+               difficulty: str, job_id: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Insert a queued job unless a reusable one for `key` exists; returns
+        (job, created). The check and the insert share one write transaction,
+        so concurrent identical submissions from any process make one job.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._find_reusable(key)
+                if existing is None:
+                    self._db.execute(
+                        "INSERT INTO jobs (id, key, state, progress, filename, input_path, num_questions,"
+                        " difficulty, created_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                        (job_id, key, json.dumps({"stage": "queued"}), filename, input_path, num_questions,
+                         difficulty, time.time()),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        if existing is not None:
+            return self._row(existing), False
+        return self.get(job_id), True
+
+    def update(self, job_id: str, **fields: Any):
+        for name in ("progress", "result"):
+            if name in fields and fields[name] is not None:
+                fields[name] = json.dumps(fields[name], separators=(",", ":"))
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]):
+        """Record a running job's progress; a no-op once the job has finished or gone back to the queue"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET progress = ? WHERE id = ? AND state = 'running'",
+                             (json.dumps(progress, separators=(",", ":")), job_id))
+            self._db.commit()
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        """Mark a job that no worker has taken yet as cancelled; False if it is already running or finished"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = 'cancelled', progress = ?, finished_at = ? WHERE id = ? AND state = 'queued'",
+                (json.dumps({"stage": "cancelled"}), time.time(), job_id),
+            )
+            self._db.commit()
+        return cursor.rowcount > 0
+
+    def request_cancel(self, job_id: str):
+        """Ask whichever process runs this job to cancel it"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (job_id,))
+            self._db.commit()
+
+    def claim_next(self, owner: str) -> Optional[str]:
+        """Atomically move the oldest queued job to running for `owner`; None when the queue is empty"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE jobs SET state = 'running', started_at = ?, owner = ?, heartbeat_at = ?"
+                " WHERE id = (SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1)"
+                " AND state = 'queued' RETURNING id",
+                (now, owner, now),
+            ).fetchone()
+            self._db.commit()
+        return row[0] if row else None
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> List[str]:
+        """Refresh the owner's running jobs; returns those whose cancellation was requested"""
+        if not job_ids:
+            return []
+        marks = ", ".join("?" * len(job_ids))
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND state = 'running' AND id IN ({marks})",
+                (time.time(), owner, *job_ids),
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({marks})", job_ids,
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def requeue(self, owner: Optional[str] = None, stale_before: Optional[float] = None) -> int:
+        """Put running jobs back in the queue: the owner's own, or any whose heartbeat is older than stale_before"""
+        condition, params = ("owner = ?", (owner,)) if owner is not None else ("heartbeat_at < ?", (stale_before,))
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = 'queued', progress = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL"
+                f" WHERE state = 'running' AND cancel_requested = 0 AND {condition}",
+                (json.dumps({"stage": "queued", "resumed": True}), *params),
+            )
+            # A job cancelled while its process was going away stays cancelled
+            self._db.execute(
+                "UPDATE jobs SET state = 'cancelled', progress = ?, error = 'Cancelled', finished_at = ?"
+                f" WHERE state = 'running' AND cancel_requested = 1 AND {condition}",
+                (json.dumps({"stage": "cancelled"}), time.time(), *params),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def purge(self, older_than: float) -> List[str]:
+        """Delete jobs that finished before `older_than`; returns their input paths"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, input_path FROM jobs WHERE state IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                (older_than,),
+            ).fetchall()
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id, _ in rows])
+            self._db.commit()
+        return [path for _, path in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+
+class ProgressWriter:
+    """
+    Writes a job's progress on a worker thread. Reports made while a write
+    is in flight are coalesced into the next one, so writes stay in order
+    and the event loop never waits on SQLite.
+    """
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._pending: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def report(self, progress: Dict[str, Any]):
+        self._pending = progress
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while self._pending is not None:
+            progress, self._pending = self._pending, None
+            try:
+                await asyncio.to_thread(self.store.update_progress, self.job_id, progress)
+            except Exception as e:
+                print(f"Failed to record progress of quiz job {self.job_id}: {e}")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Failed to delete job input {path}: {e}")
+
+
+class JobQueue:
+    """Runs stored jobs on a pool of asyncio workers in this process"""
+
+    def __init__(self, store: JobStore, input_dir: str = JOBS_INPUT_DIR, workers: int = JOBS_WORKERS,
+                 ttl_seconds: int = JOBS_TTL_SECONDS):
+        self.store = store
+        self.input_dir = Path(input_dir)
+        self.workers = max(1, workers)
+        self.ttl_seconds = ttl_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wake: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Set once a worker has recorded how the job ended
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._stopping = False
+        self._counters = {"submitted": 0, "deduplicated": 0, "resumed": 0, "completed": 0, "failed": 0,
+                          "cancelled": 0}
+
+    async def start(self):
+        """Start the workers and the heartbeat; jobs left behind by a dead process are picked up as they go stale"""
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        await asyncio.to_thread(self._purge)
+        await self._requeue_stale()
+        self._workers = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.workers)]
+        self._workers.append(asyncio.create_task(self._heartbeat(), name="job-heartbeat"))
+
+    async def stop(self):
+        """Stop the workers and put the jobs they were running back in the queue for the next start"""
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        requeued = await asyncio.to_thread(self.store.requeue, self.owner)
+        if requeued:
+            print(f"Returned {requeued} running quiz job(s) to the queue")
+
+    async def _requeue_stale(self):
+        resumed = await asyncio.to_thread(self.store.requeue, None, time.time() - JOBS_STALE_SECONDS)
+        if resumed:
+            self._counters["resumed"] += resumed
+            print(f"Resuming {resumed} quiz job(s) left behind by a stopped worker")
+            self._wake.set()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOBS_POLL_SECONDS)
+            try:
+                cancelled = await asyncio.to_thread(self.store.heartbeat, self.owner, list(self._running))
+                for job_id in cancelled:
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                await self._requeue_stale()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def submit_upload(self, buffer: UploadBuffer, num_questions: int,
+                            difficulty: str) -> Tuple[Dict[str, Any], bool]:
+        """Store an uploaded document as a job (or find its duplicate); the buffer is consumed either way"""
+        key = job_key(buffer.digest, num_questions, difficulty)
+        existing = await asyncio.to_thread(self.store.find_reusable, key)
+        if existing is not None:
+            buffer.close()
+            return self._deduplicated(existing)
+        job_id = uuid.uuid4().hex
+        input_path = str(self.input_dir / f"{job_id}{os.path.splitext(buffer.filename)[1].lower()}")
+        await asyncio.to_thread(buffer.save, input_path)
+        return await self._create(job_id, key, buffer.filename, input_path, num_questions, difficulty)
+
+    async def submit_text(self, content: str, num_questions: int, difficulty: str) -> Tuple[Dict[str, Any], bool]:
+        """Store a text body as a job (or find its duplicate)"""
+        digest = hashlib.sha256(normalize_text(content).encode("utf-8")).hexdigest()
+        key = job_key(digest, num_questions, difficulty)
+        existing = await asyncio.to_thread(self.store.find_reusable, key)
+        if existing is not None:
+            return self._deduplicated(existing)
+        job_id = uuid.uuid4().hex
+        input_path = str(self.input_dir / f"{job_id}.txt")
+        await asyncio.to_thread(Path(input_path).write_text, content, "utf-8")
+        return await self._create(job_id, key, None, input_path, num_questions, difficulty)
+
+    def _deduplicated(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        self._counters["deduplicated"] += 1
+        return job, True
+
+    async def _create(self, job_id: str, key: str, filename: Optional[str], input_path: str,
+                      num_questions: int, difficulty: str) -> Tuple[Dict[str, Any], bool]:
+        job, created = await asyncio.to_thread(self.store.create, key, filename, input_path, num_questions,
+                                               difficulty, job_id)
+        if not created:
+            # An identical submission got in while this one was storing its input
+            await asyncio.to_thread(_remove, input_path)
+            return self._deduplicated(job)
+        self._counters["submitted"] += 1
+        self._wake.set()
+        return job, False
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; returns the job as it stands afterwards (None if unknown)"""
+        if await asyncio.to_thread(self.store.cancel_if_queued, job_id):
+            self._counters["cancelled"] += 1
+            job = await asyncio.to_thread(self.store.get, job_id)
+            _remove(job["input_path"])
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            finished = self._finished[job_id]
+            task.cancel()
+            # Let the worker record the cancellation before answering
+            await finished.wait()
+        else:
+            # Running in another worker process, which picks this up on its next heartbeat
+            await asyncio.to_thread(self.store.request_cancel, job_id)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _work(self):
+        # Checked as well as cancelled: on Python 3.11 wait_for() can swallow
+        # a cancellation that lands just as the wake event fires
+        while not self._stopping:
+            # Cleared before looking, so a submission made meanwhile is not missed
+            self._wake.clear()
+            job_id = await asyncio.to_thread(self.store.claim_next, self.owner)
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOBS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._execute(job_id))
+            self._running[job_id] = task
+            finished = self._finished[job_id] = asyncio.Event()
+            try:
+                await task
+            except asyncio.CancelledError:
+                if self._stopping:
+                    raise
+                await self._finish(job_id, "cancelled", {"stage": "cancelled"}, error="Cancelled")
+                self._counters["cancelled"] += 1
+            except Exception as e:
+                print(f"Quiz job {job_id} failed: {e}")
+                await self._finish(job_id, "failed", {"stage": "failed"}, error=str(e))
+                self._counters["failed"] += 1
+            finally:
+                self._running.pop(job_id, None)
+                self._finished.pop(job_id, None)
+                finished.set()
+            await asyncio.to_thread(self._purge)
+
+    async def _finish(self, job_id: str, state: str, progress: Dict[str, Any], **fields: Any):
+        await asyncio.to_thread(self._record_finish, job_id, state, progress, fields)
+
+    def _record_finish(self, job_id: str, state: str, progress: Dict[str, Any], fields: Dict[str, Any]):
+        job = self.store.get(job_id)
+        self.store.update(job_id, state=state, progress=progress, finished_at=time.time(), **fields)
+        if job is not None:
+            _remove(job["input_path"])
+
+    def _purge(self):
+        for path in self.store.purge(time.time() - self.ttl_seconds):
+            _remove(path)
+
+    async def _execute(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        num_questions, difficulty = job["num_questions"], job["difficulty"]
+        if job["filename"] is not None:
+            num_questions = max(num_questions, quiz_generator_gemini.MIN_FILE_QUESTIONS)
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        writer = ProgressWriter(self.store, job_id)
+
+        def progress(stage: str, **detail: Any):
+            writer.report({"stage": stage, **detail, "stage_ms": dict(timings)})
+
+        def lap(stage: str, since: float) -> float:
+            now = time.perf_counter()
+            timings[stage] = round((now - since) * 1000, 1)
+            return now
+
+        progress("extracting")
+        path = job["input_path"]
+        if job["filename"] is None:
+            content = await asyncio.to_thread(Path(path).read_text, "utf-8")
+        else:
+            digest = await asyncio.to_thread(file_digest, path)
+            try:
+                content = await extract_text_cached(path, digest, os.path.getsize(path),
+                                                    text_budget(num_questions), job["filename"])
+            except Exception as e:
+                raise RuntimeError(f"Could not read {job['filename']}: {e}") from e
+        mark = lap("extracting", started)
+        if not content.strip():
+            raise RuntimeError("No text to generate questions from")
+
+        def sections(finished: int, total: int):
+            progress("generating", chunk=finished, chunks=total)
+
+        fallback_error = None
+        with token_budget.token_ledger(f"job {job_id}") as ledger:
+            try:
+                quiz = await quiz_generator.generate_quiz_from_content(
+                    content, num_questions, difficulty, fallback=False, progress=sections,
+                )
+            except Exception as e:
+                fallback_error = str(e)
+                quiz = (quiz_generator.get_fallback_questions() if job["filename"] is None
+                        else quiz_generator_gemini.get_fallback_questions())
+        mark = lap("generating", mark)
+
+        progress("validating")
+        valid = [question for question in map(validate_question, quiz) if question is not None]
+        lap("validating", mark)
+
+        result = {
+            "message": f"Generated {len(valid)} questions",
+            "filename": job["filename"],
+            "quiz_data": valid,
+            "fallback": fallback_error is not None,
+            "token_usage": ledger.summary(),
+        }
+        await self._finish(job_id, "done", {"stage": "done", "stage_ms": timings}, result=result,
+                           error=fallback_error)
+        self._counters["completed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "workers": self.workers,
+            "owner": self.owner,
+            "running": len(self._running),
+            "by_state": self.store.counts(),
+        }
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """A job as the status endpoint shows it (no result payload or server paths)"""
+    return {
+        "job_id": job["id"],
+        "state": job["state"],
+        "progress": job["progress"],
+        "filename": job["filename"],
+        "num_questions": job["num_questions"],
+        "difficulty": job["difficulty"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> Optional[JobQueue]:
+    """Return the process-wide job queue, or None when JOBS_ENABLED=false"""
+    global _queue
+    if not JOBS_ENABLED:
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(JobStore())
+    return _queue
@@ -0,0 +1,112 @@
+"""
+Rolling latency windows with percentile summaries.
+
+Each named window keeps the most recent LATENCY_WINDOW_SIZE observations, so
+percentiles describe current behaviour rather than the whole process
+lifetime. Windows are created on first use via get_window(name).
+
+Outcome windows (get_outcomes(name)) do the same for success/failure, giving
+error rates over recent calls; every upstream model call feeds both (see
+metrics.provider_call), and the model router reads them.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+LATENCY_WINDOW_SIZE = int(os.getenv("LATENCY_WINDOW_SIZE", "1024"))
+
+
+class LatencyWindow:
+    """Most recent latency samples (seconds) for one operation"""
+
+    def __init__(self, size: int = LATENCY_WINDOW_SIZE):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+        # time.monotonic() of the latest sample, for telling live numbers from stale ones
+        self.last_observed: Optional[float] = None
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.last_observed = time.monotonic()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile of the window, or None when empty"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            ordered = sorted(self._samples)
+            count = self.count
+        if not ordered:
+            return {"count": count}
+
+        def ms(p: float) -> float:
+            return round(ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1] * 1000, 1)
+
+        return {
+            "count": count,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p50_ms": ms(50),
+            "p90_ms": ms(90),
+            "p95_ms": ms(95),
+            "p99_ms": ms(99),
+        }
+
+
+class OutcomeWindow:
+    """Success or failure of the most recent calls for one operation"""
+
+    def __init__(self, size: int = LATENCY_WINDOW_SIZE):
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, ok: bool):
+        with self._lock:
+            self._events.append((time.monotonic(), ok))
+
+    def error_rate(self, max_age: Optional[float] = None) -> Tuple[int, Optional[float]]:
+        """(calls, fraction failed) over the window, or over its last `max_age` seconds"""
+        since = time.monotonic() - max_age if max_age is not None else None
+        with self._lock:
+            outcomes = [ok for at, ok in self._events if since is None or at >= since]
+        if not outcomes:
+            return 0, None
+        return len(outcomes), round(outcomes.count(False) / len(outcomes), 4)
+
+
+_windows: Dict[str, LatencyWindow] = {}
+_windows_lock = threading.Lock()
+_outcomes: Dict[str, OutcomeWindow] = {}
+
+
+def get_window(name: str) -> LatencyWindow:
+    window = _windows.get(name)
+    if window is None:
+        with _windows_lock:
+            window = _windows.setdefault(name, LatencyWindow())
+    return window
+
+
+def get_outcomes(name: str) -> OutcomeWindow:
+    window = _outcomes.get(name)
+    if window is None:
+        with _windows_lock:
+            window = _outcomes.setdefault(name, OutcomeWindow())
+    return window
+
+
+def all_summaries() -> Dict[str, Dict[str, Optional[float]]]:
+    with _windows_lock:
+        names = sorted(_windows)
+    return {name: _windows[name].summary() for name in names}
@@ -0,0 +1,306 @@
+"""
+One interface over every LLM backend the service can call.
+
+Quiz generation and chat describe a call as a CompletionRequest and hand it
+to the adapter for the route's provider (get_adapter(route.provider)); they
+never branch on the provider themselves. Each adapter offers the same four
+call styles:
+
+    complete()   blocking, for the sync quiz path and thread-pool callers
+    acomplete()  async, keeping the event loop free while the call is in flight
+    stream()     async iterator of {"text", "usage"} chunks as they arrive
+    batch()      many independent completions at once
+
+and takes care of its provider's admission slot, metrics.provider_call
+timing and token counts, so callers get a Completion with the reply text,
+token usage and whether the output budget cut it off.
+
+GeminiAdapter and OpenAIAdapter wrap the shared clients in llm_providers.
+LocalAdapter needs no key or network: it answers deterministically from the
+prompt (quiz questions built from the content's own sentences, a canned chat
+reply) after LOCAL_LLM_LATENCY_MS, so tests, benchmarks and CI can run the
+whole pipeline offline with LLM_PROVIDER=local.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+import metrics
+from llm_providers import GEMINI_QUIZ_REQUEST_OPTIONS, ProviderRegistry, get_registry, run_blocking
+from quiz_parser import GEMINI_QUIZ_GENERATION_CONFIG, OPENAI_QUIZ_RESPONSE_FORMAT, QUESTION_OPTIONS
+from token_budget import gemini_truncated, openai_truncated
+
+load_dotenv()
+
+# Simulated model latency of the local backend (0: answer immediately)
+LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "0"))
+# Words per chunk when the local backend streams
+LOCAL_LLM_STREAM_WORDS = 8
+
+# OpenAI's default output limit when the caller sets no budget
+OPENAI_DEFAULT_MAX_TOKENS = 2000
+
+
+@dataclass
+class CompletionRequest:
+    """What to ask for, independent of the provider that answers"""
+    prompt: str
+    # System instructions, for backends with a system role (OpenAI)
+    system: Optional[str] = None
+    max_output_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    # "quiz" for quiz-question JSON, "chat" for free text
+    task: str = "chat"
+    # Constrain the reply to the quiz JSON schema (provider structured-output mode)
+    structured: bool = False
+    # Questions asked for, for backends that write the quiz themselves (local)
+    questions: int = 0
+
+
+@dataclass
+class Completion:
+    text: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    truncated: bool = False
+
+    @property
+    def usage(self) -> Tuple[Optional[int], Optional[int]]:
+        return self.input_tokens, self.output_tokens
+
+
+class ProviderAdapter(ABC):
+    """Sync, async, streaming and batch calls to one provider"""
+
+    name = ""
+
+    def __init__(self, registry: ProviderRegistry):
+        self.registry = registry
+
+    @abstractmethod
+    def complete(self, model: str, request: CompletionRequest) -> Completion:
+        ...
+
+    @abstractmethod
+    async def acomplete(self, model: str, request: CompletionRequest) -> Completion:
+        ...
+
+    @abstractmethod
+    def stream(self, model: str, request: CompletionRequest) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+    async def batch(self, model: str, requests: List[CompletionRequest]) -> List[Union[Completion, Exception]]:
+        """
+        Completions for independent requests, in request order. They run
+        concurrently within the provider's admission limit; a failed request
+        is returned as its exception instead of failing the others.
+        """
+        return await asyncio.gather(*(self.acomplete(model, request) for request in requests),
+                                    return_exceptions=True)
+
+
+class GeminiAdapter(ProviderAdapter):
+    """Gemini through the SDK's REST transport (blocking, so run on the LLM thread pool) and SSE streaming"""
+
+    name = "gemini"
+
+    @staticmethod
+    def _generation_config(request: CompletionRequest) -> Dict[str, Any]:
+        config = dict(GEMINI_QUIZ_GENERATION_CONFIG) if request.structured else {}
+        if request.max_output_tokens:
+            config["max_output_tokens"] = request.max_output_tokens
+        if request.temperature is not None:
+            config["temperature"] = request.temperature
+        return config
+
+    def complete(self, model: str, request: CompletionRequest) -> Completion:
+        with self.registry.admission("gemini").slot_sync():
+            return self._complete(model, request)
+
+    def _complete(self, model: str, request: CompletionRequest) -> Completion:
+        # Caller holds a Gemini admission slot
+        config = self._generation_config(request)
+        with metrics.provider_call("gemini", model) as call:
+            response = self.registry.gemini_model(model).generate_content(
+                request.prompt, request_options=GEMINI_QUIZ_REQUEST_OPTIONS,
+                **({"generation_config": config} if config else {}),
+            )
+            usage = metrics.gemini_usage(response)
+            call.tokens(*usage)
+        return Completion(self._text(response), *usage, truncated=gemini_truncated(response))
+
+    @staticmethod
+    def _text(response: Any) -> str:
+        try:
+            return response.text.strip()
+        except ValueError:
+            # No parts: e.g. a thinking model used the whole output budget before answering
+            return ""
+
+    async def acomplete(self, model: str, request: CompletionRequest) -> Completion:
+        # Wait for admission on the event loop, not on a pool thread
+        async with self.registry.admission("gemini").slot():
+            call = asyncio.ensure_future(run_blocking(self._complete, model, request))
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # The blocking call keeps running (e.g. a losing hedge); hold the
+                # slot until it returns so the in-flight count stays truthful
+                await asyncio.wait({call})
+                raise
+
+    def stream(self, model: str, request: CompletionRequest) -> AsyncIterator[Dict[str, Any]]:
+        return self.registry.stream_gemini(model, request.prompt, self._generation_config(request) or None)
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI chat completions: the shared sync client, and the native async client for async and streaming calls"""
+
+    name = "openai"
+
+    @staticmethod
+    def _messages(request: CompletionRequest) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": request.system}] if request.system else []
+        return messages + [{"role": "user", "content": request.prompt}]
+
+    @staticmethod
+    def _params(request: CompletionRequest) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"max_tokens": request.max_output_tokens or OPENAI_DEFAULT_MAX_TOKENS}
+        if request.temperature is not None:
+            params["temperature"] = request.temperature
+        if request.structured:
+            params["response_format"] = OPENAI_QUIZ_RESPONSE_FORMAT
+        return params
+
+    @staticmethod
+    def _completion(response: Any, usage: Tuple[Optional[int], Optional[int]]) -> Completion:
+        text = response.choices[0].message.content or ""
+        return Completion(text.strip(), *usage, truncated=openai_truncated(response))
+
+    def complete(self, model: str, request: CompletionRequest) -> Completion:
+        with self.registry.admission("openai").slot_sync(), metrics.provider_call("openai", model) as call:
+            response = self.registry.openai_client().chat.completions.create(
+                model=model, messages=self._messages(request), **self._params(request),
+            )
+            usage = metrics.openai_usage(response)
+            call.tokens(*usage)
+        return self._completion(response, usage)
+
+    async def acomplete(self, model: str, request: CompletionRequest) -> Completion:
+        async with self.registry.admission("openai").slot():
+            with metrics.provider_call("openai", model) as call:
+                response = await self.registry.async_openai_client().chat.completions.create(
+                    model=model, messages=self._messages(request), **self._params(request),
+                )
+                usage = metrics.openai_usage(response)
+                call.tokens(*usage)
+        return self._completion(response, usage)
+
+    def stream(self, model: str, request: CompletionRequest) -> AsyncIterator[Dict[str, Any]]:
+        return self.registry.stream_openai(model, self._messages(request), **self._params(request))
+
+
+_CONTENT_MARKERS = ("CONTENT:\n", "CONTENT TO ANALYZE:")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9-]{3,}")
+
+
+class LocalAdapter(ProviderAdapter):
+    """
+    Deterministic offline backend: the same prompt always gets the same reply.
+
+    Quiz replies are cloze questions on the content's sentences (the blanked
+    word is the answer, words from other sentences are the distractors), as a
+    plain JSON array in either mode. Output past max_output_tokens is cut off
+    and marked truncated, like a real model hitting its limit. Token counts
+    are estimated at four characters per token.
+    """
+
+    name = "local"
+
+    @staticmethod
+    def _content(prompt: str) -> str:
+        for marker in _CONTENT_MARKERS:
+            if marker in prompt:
+                return prompt.split(marker, 1)[1]
+        return prompt
+
+    def _quiz(self, request: CompletionRequest) -> str:
+        sentences = list(dict.fromkeys(s.strip() for s in _SENTENCE_RE.split(self._content(request.prompt))
+                                       if len(_WORD_RE.findall(s)) >= 3))
+        words = sorted({word.lower() for s in sentences for word in _WORD_RE.findall(s)})
+        if not sentences or len(words) < QUESTION_OPTIONS:
+            return "[]"
+        # Seeded by the whole prompt, so a top-up request (which lists the
+        # questions already asked) starts from different sentences
+        seed = int.from_bytes(hashlib.sha256(request.prompt.encode()).digest()[:8], "big")
+        questions = []
+        for i in range(max(1, request.questions)):
+            sentence = sentences[(seed + i) % len(sentences)]
+            candidates = _WORD_RE.findall(sentence)
+            answer = max(candidates, key=lambda word: (len(word), word))
+            distractors = [word for word in words if word != answer.lower()]
+            offset = (seed + i * 7) % len(distractors)
+            options = [distractors[(offset + k) % len(distractors)] for k in range(QUESTION_OPTIONS - 1)]
+            correct = (seed + i) % QUESTION_OPTIONS
+            options.insert(correct, answer.lower())
+            cloze = sentence.replace(answer, "_____", 1)
+            questions.append({"q": f"According to the content, which word fills the blank ({i + 1}): {cloze}",
+                              "options": options, "correct": correct})
+        return json.dumps(questions)
+
+    @staticmethod
+    def _chat(request: CompletionRequest) -> str:
+        message = request.prompt.split("User Query:", 1)[-1].strip()
+        return f"This is the offline assistant; it answers without calling a model. You asked: {message}"
+
+    def _reply(self, model: str, request: CompletionRequest) -> Completion:
+        text = self._quiz(request) if request.task == "quiz" else self._chat(request)
+        truncated = False
+        if request.max_output_tokens and len(text) > request.max_output_tokens * 4:
+            text, truncated = text[:request.max_output_tokens * 4], True
+        completion = Completion(text, len(request.prompt) // 4, len(text) // 4, truncated)
+        metrics.record_tokens("local", model, *completion.usage)
+        return completion
+
+    def complete(self, model: str, request: CompletionRequest) -> Completion:
+        with metrics.provider_call("local", model):
+            time.sleep(LOCAL_LLM_LATENCY_MS / 1000)
+            return self._reply(model, request)
+
+    async def acomplete(self, model: str, request: CompletionRequest) -> Completion:
+        with metrics.provider_call("local", model):
+            await asyncio.sleep(LOCAL_LLM_LATENCY_MS / 1000)
+            return self._reply(model, request)
+
+    async def stream(self, model: str, request: CompletionRequest) -> AsyncIterator[Dict[str, Any]]:
+        completion = await self.acomplete(model, request)
+        words = completion.text.split(" ")
+        for start in range(0, len(words), LOCAL_LLM_STREAM_WORDS):
+            chunk = " ".join(words[start:start + LOCAL_LLM_STREAM_WORDS])
+            last = start + LOCAL_LLM_STREAM_WORDS >= len(words)
+            yield {"text": chunk if last else chunk + " ",
+                   "usage": {"input_tokens": completion.input_tokens, "output_tokens": completion.output_tokens}
+                   if last else None}
+
+
+ADAPTERS = {adapter.name: adapter for adapter in (GeminiAdapter, OpenAIAdapter, LocalAdapter)}
+_adapters: Dict[str, ProviderAdapter] = {}
+
+
+def get_adapter(provider: str) -> ProviderAdapter:
+    """The shared adapter for `provider` ("gemini", "openai" or "local")"""
+    adapter = _adapters.get(provider)
+    if adapter is None:
+        if provider not in ADAPTERS:
+            raise RuntimeError(f"No adapter for provider {provider!r}")
+        adapter = _adapters.setdefault(provider, ADAPTERS[provider](get_registry()))
+    return adapter
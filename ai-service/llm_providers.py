@@ -0,0 +1,409 @@
+"""
+Process-wide registry of LLM provider clients.
+
+Provider SDK clients are configured once and reused for every request: one
+Gemini configuration with cached GenerativeModel objects per model name, an
+async HTTP client for Gemini's streaming endpoint, and one sync + one async
+OpenAI client, all on keep-alive HTTP connection pools. main.py opens the
+registry in its FastAPI lifespan and closes it on shutdown; scripts that
+import quiz_generator directly get the same lazily created instance.
+
+The Gemini SDK only ships a synchronous REST transport, so Gemini calls are
+run on a bounded thread pool. OpenAI has a native async client and is awaited
+directly. Either way the FastAPI event loop stays free to serve other requests
+(including /health probes) while a model call is in flight.
+
+Every upstream call goes through the provider's AdmissionController
+(admission(provider)), which bounds in-flight calls and queues the rest, and
+identical concurrent calls can share one request through single_flight.
+
+The provider SDKs take over a second to import, which a cold start would
+pay before serving its first request. They are only located at import time
+(GEMINI_AVAILABLE / OPENAI_AVAILABLE) and imported when a client is first
+created, either by the first call that needs one or by prewarm(), which
+main.py runs in the background once the server is up (PROVIDER_PREWARM).
+"""
+import asyncio
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+import metrics
+from admission import AdmissionController, SingleFlight
+from resilience import Route
+
+
+
+def _installed(module: str) -> bool:
+    """Whether `module` can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:
+        return False
+
+
+GEMINI_AVAILABLE = _installed("google.generativeai")
+OPENAI_AVAILABLE = _installed("openai")
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on blocking provider calls running at the same time
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))
+# Keep-alive connections held open per provider, and how long idle ones live
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(LLM_MAX_WORKERS)))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+# Import and configure the provider SDKs in the background after startup,
+# once the server has had PROVIDER_PREWARM_DELAY_SECONDS to start listening
+PROVIDER_PREWARM = os.getenv("PROVIDER_PREWARM", "true").lower() == "true"
+PROVIDER_PREWARM_DELAY_SECONDS = float(os.getenv("PROVIDER_PREWARM_DELAY_SECONDS", "0.5"))
+
+# Which backend answers quiz and chat calls: "auto" (Gemini, else OpenAI, by
+# configured key), "gemini" or "openai" to put that provider first, or "local"
+# for the deterministic offline backend in llm_adapters (tests, benchmarks and
+# CI; "auto" never picks it)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "auto").lower()
+
+# Models used by the chat assistant and the quiz generator
+GEMINI_CHAT_MODEL = "gemini-1.5-flash"
+GEMINI_QUIZ_MODEL = "models/gemini-flash-latest"
+OPENAI_QUIZ_MODEL = "gpt-4o-mini"
+OPENAI_CHAT_MODEL = OPENAI_QUIZ_MODEL
+LOCAL_MODEL = "local-deterministic"
+# Per-attempt timeout for quiz calls. Retries are done by resilience.py, so the
+# SDKs' own retry loops (up to 10 minutes for Gemini) are switched off there.
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
+GEMINI_QUIZ_REQUEST_OPTIONS = {"retry": None, "timeout": LLM_CALL_TIMEOUT_SECONDS}
+# Alternate Gemini model tried when the primary quiz model keeps failing
+GEMINI_FAILOVER_MODEL = os.getenv("GEMINI_FAILOVER_MODEL", GEMINI_CHAT_MODEL)
+
+PLACEHOLDER_KEYS = {"your_gemini_key_here", "your_gemini_api_key_here",
+                    "your_openai_api_key_here", "dummy_key_for_testing"}
+
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm-call")
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking provider call on the LLM thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request's token ledger) onto the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+
+
+def gemini_client_options() -> dict:
+    """Optional endpoint override for Gemini (used to point at a local fake server)"""
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    return {"api_endpoint": endpoint} if endpoint else {}
+
+
+def gemini_base_url() -> str:
+    endpoint = os.getenv("GEMINI_API_ENDPOINT", "generativelanguage.googleapis.com")
+    return endpoint if endpoint.startswith(("http://", "https://")) else f"https://{endpoint}"
+
+
+def _gemini_chunk_text(chunk: dict) -> str:
+    candidates = chunk.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def _gemini_usage(chunk: dict) -> Optional[Dict[str, int]]:
+    usage = chunk.get("usageMetadata")
+    if not usage:
+        return None
+    return {"input_tokens": usage.get("promptTokenCount"), "output_tokens": usage.get("candidatesTokenCount")}
+
+
+def _usable_key(key: Optional[str]) -> bool:
+    return bool(key) and key not in PLACEHOLDER_KEYS
+
+
+class ProviderRegistry:
+    """Holds one configured client per provider and one GenerativeModel per model name"""
+
+    def __init__(self):
+        self.gemini_key = os.getenv("GEMINI_API_KEY")
+        self.openai_key = os.getenv("OPENAI_API_KEY")
+        self._lock = threading.Lock()
+        self._gemini_configured = False
+        self._gemini_models: Dict[str, Any] = {}
+        self._openai_client = None
+        self._async_openai_client = None
+        self._gemini_http_client = None
+        # How long start() took, once it has run (None while the SDKs are still unloaded)
+        self.warmed_up_ms: Optional[float] = None
+        self._admission = {name: AdmissionController.from_env(name) for name in ("gemini", "openai")}
+        self.single_flight = SingleFlight()
+
+    def admission(self, provider: str) -> AdmissionController:
+        """Concurrency limiter that every call to `provider` must hold a slot of"""
+        return self._admission[provider]
+
+    def admission_stats(self) -> Dict[str, Any]:
+        return {
+            **{name: controller.stats() for name, controller in self._admission.items()},
+            "coalescing": self.single_flight.stats(),
+        }
+
+    @property
+    def gemini_enabled(self) -> bool:
+        return GEMINI_AVAILABLE and _usable_key(self.gemini_key)
+
+    @property
+    def openai_enabled(self) -> bool:
+        return OPENAI_AVAILABLE and _usable_key(self.openai_key)
+
+    def default_provider(self) -> str:
+        """LLM_PROVIDER when it is usable, else Gemini, then OpenAI, otherwise canned fallback questions"""
+        if LLM_PROVIDER == "local":
+            return "local"
+        if LLM_PROVIDER == "openai" and self.openai_enabled:
+            return "openai"
+        if self.gemini_enabled:
+            return "gemini"
+        if self.openai_enabled:
+            return "openai"
+        return "fallback"
+
+    def enabled_providers(self) -> List[str]:
+        """Providers that may be called, in LLM_PROVIDER preference order"""
+        if LLM_PROVIDER == "local":
+            return ["local"]
+        enabled = [name for name in ("gemini", "openai") if getattr(self, f"{name}_enabled")]
+        return sorted(enabled, key=lambda name: name != LLM_PROVIDER)
+
+    def quiz_routes(self, gemini_model: str = GEMINI_QUIZ_MODEL,
+                    openai_model: str = OPENAI_QUIZ_MODEL) -> List[Route]:
+        """Failover order for quiz calls: primary Gemini model, alternate Gemini model, then OpenAI
+        (OpenAI first with LLM_PROVIDER=openai; only the local backend with LLM_PROVIDER=local)"""
+        if LLM_PROVIDER == "local":
+            return [Route("local", LOCAL_MODEL)]
+        routes = []
+        if self.gemini_enabled:
+            routes.append(Route("gemini", gemini_model))
+            if GEMINI_FAILOVER_MODEL and GEMINI_FAILOVER_MODEL != gemini_model:
+                routes.append(Route("gemini", GEMINI_FAILOVER_MODEL))
+        if self.openai_enabled:
+            position = 0 if LLM_PROVIDER == "openai" else len(routes)
+            routes.insert(position, Route("openai", openai_model))
+        return routes
+
+    def chat_route(self) -> Optional[Route]:
+        """Provider and model answering /chat, or None when no provider is configured"""
+        return {
+            "gemini": Route("gemini", GEMINI_CHAT_MODEL),
+            "openai": Route("openai", OPENAI_CHAT_MODEL),
+            "local": Route("local", LOCAL_MODEL),
+        }.get(self.default_provider())
+
+    def _configure_gemini(self):
+        # Caller holds self._lock. genai.configure is process-global, so it must
+        # only ever be called from here.
+        if self._gemini_configured:
+            return
+        import google.generativeai as genai
+        genai.configure(api_key=self.gemini_key, transport="rest", client_options=gemini_client_options())
+        self._gemini_configured = True
+
+        # The REST transport keeps a requests.Session with a default pool of 10;
+        # size it to the worker pool so concurrent calls reuse warm connections.
+        try:
+            from google.generativeai import client as genai_client
+            from requests.adapters import HTTPAdapter
+            session = genai_client.get_default_generative_client()._transport._session
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        except Exception as e:
+            logger.warning(f"Could not resize Gemini connection pool: {e}")
+
+    def gemini_model(self, model_name: str):
+        """Return the shared GenerativeModel for model_name, configuring Gemini on first use"""
+        if not self.gemini_enabled:
+            raise RuntimeError("Gemini is not configured (missing GEMINI_API_KEY or SDK)")
+        model = self._gemini_models.get(model_name)
+        if model is None:
+            with self._lock:
+                self._configure_gemini()
+                model = self._gemini_models.get(model_name)
+                if model is None:
+                    from google.generativeai import GenerativeModel
+                    model = GenerativeModel(model_name)
+                    self._gemini_models[model_name] = model
+        return model
+
+    def gemini_http_client(self) -> httpx.AsyncClient:
+        """Keep-alive async HTTP client for Gemini's REST API (used for streaming)"""
+        if not self.gemini_enabled:
+            raise RuntimeError("Gemini is not configured (missing GEMINI_API_KEY or SDK)")
+        if self._gemini_http_client is None:
+            with self._lock:
+                if self._gemini_http_client is None:
+                    self._gemini_http_client = httpx.AsyncClient(
+                        base_url=gemini_base_url(),
+                        headers={"x-goog-api-key": self.gemini_key},
+                        limits=self._http_limits(),
+                        timeout=httpx.Timeout(120, connect=10),
+                    )
+        return self._gemini_http_client
+
+    async def stream_gemini(self, model_name: str, prompt: str,
+                            generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a Gemini completion over SSE, yielding {"text", "usage"} dicts
+        (usage is None until the provider reports input/output token counts).
+
+        The SDK's REST transport downloads the whole body before iterating, so
+        this talks to streamGenerateContent directly. Lines are read only as
+        fast as the caller consumes them (backpressure), and leaving the loop
+        early closes the HTTP response, which cancels the upstream generation.
+        generation_config (e.g. a response schema) is sent as the request's
+        generationConfig.
+        """
+        model_path = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+        client = self.gemini_http_client()
+        usage = None
+        # Slot first: time spent queueing for it is not provider latency
+        async with self.admission("gemini").slot():
+            with metrics.provider_call("gemini", model_name) as call:
+                async with client.stream("POST", f"/v1beta/{model_path}:streamGenerateContent",
+                                         params={"alt": "sse"}, json=body) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        raise RuntimeError(f"Gemini stream failed ({response.status_code}): {response.text[:200]}")
+                    try:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            chunk = json.loads(line[5:])
+                            usage = _gemini_usage(chunk) or usage
+                            yield {"text": _gemini_chunk_text(chunk), "usage": usage}
+                    finally:
+                        if usage:
+                            call.tokens(usage.get("input_tokens"), usage.get("output_tokens"))
+
+    async def stream_openai(self, model_name: str, messages: list, **params) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an OpenAI chat completion, yielding the same {"text", "usage"} dicts as stream_gemini"""
+        async with self.admission("openai").slot():
+            with metrics.provider_call("openai", model_name) as call:
+                stream = await self.async_openai_client().chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params,
+                )
+                try:
+                    async for chunk in stream:
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        usage = None
+                        if chunk.usage:
+                            usage = {"input_tokens": chunk.usage.prompt_tokens,
+                                     "output_tokens": chunk.usage.completion_tokens}
+                            call.tokens(usage["input_tokens"], usage["output_tokens"])
+                        yield {"text": text or "", "usage": usage}
+                finally:
+                    # Closing early (client gone) drops the connection and stops generation upstream
+                    await stream.close()
+
+    def _http_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+        )
+
+    def openai_client(self):
+        """Shared synchronous OpenAI client"""
+        if not self.openai_enabled:
+            raise RuntimeError("OpenAI is not configured (missing OPENAI_API_KEY or SDK)")
+        if self._openai_client is None:
+            with self._lock:
+                if self._openai_client is None:
+                    from openai import OpenAI
+                    self._openai_client = OpenAI(
+                        api_key=self.openai_key,
+                        max_retries=0,
+                        timeout=LLM_CALL_TIMEOUT_SECONDS,
+                        http_client=httpx.Client(limits=self._http_limits()),
+                    )
+        return self._openai_client
+
+    def async_openai_client(self):
+        """Shared AsyncOpenAI client; must be used from the event loop that serves the app"""
+        if not self.openai_enabled:
+            raise RuntimeError("OpenAI is not configured (missing OPENAI_API_KEY or SDK)")
+        if self._async_openai_client is None:
+            with self._lock:
+                if self._async_openai_client is None:
+                    from openai import AsyncOpenAI
+                    self._async_openai_client = AsyncOpenAI(
+                        api_key=self.openai_key,
+                        max_retries=0,
+                        timeout=LLM_CALL_TIMEOUT_SECONDS,
+                        http_client=httpx.AsyncClient(limits=self._http_limits()),
+                    )
+        return self._async_openai_client
+
+    def start(self, gemini_models=(GEMINI_CHAT_MODEL, GEMINI_QUIZ_MODEL)):
+        """Import the SDKs and create the clients up front so the first request does not pay for setup"""
+        started = time.perf_counter()
+        if self.gemini_enabled:
+            for model_name in gemini_models:
+                self.gemini_model(model_name)
+        if self.openai_enabled:
+            self.openai_client()
+            self.async_openai_client()
+        self.warmed_up_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"LLM provider registry ready in {self.warmed_up_ms} ms "
+                    f"(default provider: {self.default_provider()})")
+
+    async def prewarm(self, delay: float = PROVIDER_PREWARM_DELAY_SECONDS):
+        """start() on a worker thread after `delay`, so it runs while the server is already answering"""
+        await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(self.start)
+        except Exception as e:
+            # The first call that needs the client will try again (and report the error)
+            logger.warning(f"Provider pre-warm failed: {e}")
+
+    async def aclose(self):
+        """Close pooled HTTP connections on shutdown"""
+        if self._gemini_http_client is not None:
+            await self._gemini_http_client.aclose()
+            self._gemini_http_client = None
+        if self._async_openai_client is not None:
+            await self._async_openai_client.close()
+            self._async_openai_client = None
+        if self._openai_client is not None:
+            self._openai_client.close()
+            self._openai_client = None
+
+
+_registry: Optional[ProviderRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ProviderRegistry:
+    """Return the process-wide ProviderRegistry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ProviderRegistry()
+    return _registry
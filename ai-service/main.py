@@ -1,11 +1,31 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
+import hmac
 import os
-import uvicorn
 from dotenv import load_dotenv
 import logging
+import time
 from datetime import datetime
 
+from llm_adapters import CompletionRequest, get_adapter
+from llm_providers import PROVIDER_PREWARM, get_registry
+from model_router import router
+from latency_stats import all_summaries, get_window
+from quiz_cache import get_quiz_cache
+from chat_cache import get_chat_cache
+from text_cache import extract_text_cached, get_text_cache
+from resilience import outcomes
+from hedging import hedger
+import jobs
+import metrics
+import profiling
+import text_extraction
+import token_budget
+import uploads
+
 load_dotenv()
 
 # Configure logging
@@ -15,14 +35,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up the shared LLM clients in the background once the server is up
+    (they are otherwise created by the first request that needs them) and
+    close their connections on shutdown
+    """
+    providers = get_registry()
+    app.state.providers = providers
+    prewarm = asyncio.create_task(providers.prewarm()) if PROVIDER_PREWARM else None
+    job_queue = jobs.get_job_queue()
+    if job_queue:
+        await job_queue.start()
+    yield
+    if prewarm:
+        prewarm.cancel()
+    if job_queue:
+        await job_queue.stop()
+    await providers.aclose()
+    text_extraction.shutdown_pool()
+    profiler = profiling.get_profiler()
+    if profiler:
+        profiler.flush()
+    metrics.mark_process_dead()
+
 app = FastAPI(
     title="TechNexus Arena Service",
     description="Service for TechNexus Arena - Manual quiz creation support",
-    version="2.5.0"
+    version="2.5.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"] if "*" in allowed_origins else allowed_origins,
@@ -38,8 +86,9 @@ def read_root():
         "service": "TechNexus Arena Service",
         "version": "2.5.0",
         "status": "operational",
-        "mode": "Manual Quiz Creation",
-        "message": "PDF generation has been disabled. Create quizzes manually in the admin dashboard.",
+        "mode": "AI Quiz Generation",
+        "message": "Generate quizzes from PDF/PPTX uploads or text (/generate-quiz, /generate-quiz/stream, "
+                   "/generate-quiz/batch, /jobs/quiz), or create them manually in the admin dashboard.",
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -55,59 +104,522 @@ def health_check():
 @app.get("/status")
 def get_status():
     """Diagnostic endpoint to check service status"""
+    quiz_cache = get_quiz_cache()
+    chat_cache = get_chat_cache()
+    text_cache = get_text_cache()
+    job_queue = jobs.get_job_queue()
     return {
         "status": "active",
-        "mode": "Manual Quiz Creation",
+        "mode": "AI Quiz Generation",
         "features": {
-            "pdf_quiz_generation": False,
+            "pdf_quiz_generation": True,
+            "quiz_streaming": True,
+            "batch_quiz_generation": True,
+            "quiz_jobs": job_queue is not None,
             "manual_quiz_creation": True,
             "real_time_quizzes": True,
             "chatbot": True
         },
+        "quiz_cache": quiz_cache.stats() if quiz_cache else {"enabled": False},
+        "chat_cache": chat_cache.stats() if chat_cache else {"enabled": False},
+        "providers": {
+            "default": get_registry().default_provider(),
+            "warmed_up_ms": get_registry().warmed_up_ms,
+        },
+        "model_router": router.stats(),
+        "admission": get_registry().admission_stats(),
+        "quiz_outcomes": outcomes.stats(),
+        "hedging": hedger.stats(),
+        "token_budget": token_budget.stats(),
+        "uploads": uploads.stats(),
+        "text_cache": text_cache.stats() if text_cache else {"enabled": False},
+        "jobs": job_queue.stats() if job_queue else {"enabled": False},
+        "latency": all_summaries(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms and request/cache/token counters"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/profile")
+def get_profile(top: int = 20, endpoint: str = None, format: str = "json",
+                x_admin_token: str = Header(default="")):
+    """
+    Hottest functions per endpoint from the sampling profiler (PROFILE_ENABLED).
+    `format=folded` with an `endpoint` returns its collapsed stacks for a
+    flamegraph instead. Requires the X-Admin-Token header to match
+    PROFILE_ADMIN_TOKEN; without a configured token the endpoint does not exist.
+    """
+    if not profiling.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token, profiling.PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    profiler = profiling.get_profiler()
+    if profiler is None:
+        return {"enabled": False}
+    if format == "folded":
+        if not endpoint:
+            raise HTTPException(status_code=400, detail="format=folded needs an endpoint, e.g. 'POST /chat'")
+        return PlainTextResponse(profiler.folded(endpoint))
+    return {**profiler.stats(), "top": profiler.top(top, endpoint)}
+
 # Chat functionality
-import google.generativeai as genai
-from pydantic import BaseModel
+import json
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 class ChatRequest(BaseModel):
     message: str
 
+def build_chat_prompt(message: str) -> str:
+    # Add system context
+    return f"""You are the TechNexus AI Assistant, a helpful expert 
+        ready to assist users with the TechNexus Quiz Platform.
+        
+        User Query: {message}
+        """
+
+
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
-    Chat endpoint using Google Gemini.
+    Chat endpoint, answered by the model the router picks for it (see model_router).
+    Clients sending `Accept: text/event-stream` get the streaming variant.
     """
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return await chat_stream_endpoint(request)
+
+    started = time.perf_counter()
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            return {"error": "GEMINI_API_KEY not configured"}
-            
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        # Add system context
-        prompt = f"""You are the TechNexus AI Assistant, a helpful expert 
-        ready to assist users with the TechNexus Quiz Platform.
-        
-        User Query: {request.message}
-        """
-        
-        response = model.generate_content(prompt)
-        return {"response": response.text}
+        providers = get_registry()
+        if providers.chat_route() is None:
+            return {"error": "No AI provider configured (set GEMINI_API_KEY or OPENAI_API_KEY)"}
+
+        # Repeated and near-duplicate questions are answered from the cache
+        chat_cache = get_chat_cache()
+        cached = await chat_cache.alookup(request.message) if chat_cache else None
+        if cached is not None:
+            return {"response": cached}
+
+        prompt = build_chat_prompt(request.message)
+        route = router.route_chat(prompt).route
+
+        async def ask() -> str:
+            # Within the provider's in-flight limit, off the event loop
+            call_started = time.perf_counter()
+            completion = await get_adapter(route.provider).acomplete(route.model, CompletionRequest(prompt))
+            if chat_cache:
+                await chat_cache.astore(
+                    request.message,
+                    completion.text,
+                    latency_seconds=time.perf_counter() - call_started,
+                    input_tokens=completion.input_tokens or None,
+                    output_tokens=completion.output_tokens or None,
+                )
+            return completion.text
+
+        # Identical questions already in flight share one upstream call
+        answer = await providers.single_flight.do(("chat", prompt), ask)
+        return {"response": answer}
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         return {"error": str(e)}
+    finally:
+        get_window("chat_total").observe(time.perf_counter() - started)
 
-if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8000))
-    logger.info(f"Starting TechNexus Arena Service on port {port}")
-    logger.info("PDF quiz generation disabled - Manual creation only")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=True,
-        log_level="info"
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def chat_event_stream(message: str):
+    """
+    Yield the assistant's answer as SSE `token` events while the model produces it,
+    then a `done` event with time-to-first-byte and total latency.
+    """
+    started = time.perf_counter()
+    ttfb = None
+
+    def mark_first_byte():
+        nonlocal ttfb
+        if ttfb is None:
+            ttfb = time.perf_counter() - started
+            get_window("chat_stream_ttfb").observe(ttfb)
+
+    def timings(**extra) -> dict:
+        total = time.perf_counter() - started
+        get_window("chat_stream_total").observe(total)
+        return {"ttfb_ms": round((ttfb or total) * 1000, 1), "total_ms": round(total * 1000, 1), **extra}
+
+    if get_registry().chat_route() is None:
+        yield sse_event("error", {"error": "No AI provider configured (set GEMINI_API_KEY or OPENAI_API_KEY)"})
+        return
+
+    chat_cache = get_chat_cache()
+    cached = await chat_cache.alookup(message) if chat_cache else None
+    if cached is not None:
+        mark_first_byte()
+        yield sse_event("token", {"text": cached})
+        yield sse_event("done", timings(cached=True))
+        return
+
+    parts = []
+    usage = {}
+    try:
+        prompt = build_chat_prompt(message)
+        route = router.route_chat(prompt).route
+        chunks = get_adapter(route.provider).stream(route.model, CompletionRequest(prompt))
+        async for chunk in chunks:
+            usage = chunk["usage"] or usage
+            if not chunk["text"]:
+                continue
+            mark_first_byte()
+            parts.append(chunk["text"])
+            yield sse_event("token", {"text": chunk["text"]})
+    except asyncio.CancelledError:
+        # Client went away; leaving the stream closed the upstream response
+        logger.info("Chat stream cancelled by client disconnect")
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream error: {str(e)}")
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    done = timings(cached=False)
+    if chat_cache and parts:
+        await chat_cache.astore(
+            message,
+            "".join(parts),
+            latency_seconds=done["total_ms"] / 1000,
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+        )
+    yield sse_event("done", done)
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming chat over Server-Sent Events.
+
+    Tokens are forwarded as the model produces them. The next upstream chunk is
+    only read once the previous event has been written to the client, so a
+    slow reader applies backpressure, and a disconnect cancels the upstream
+    request.
+    """
+    return StreamingResponse(
+        chat_event_stream(request.message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+# Quiz generation
+import quiz_batch
+import quiz_generator
+
+class QuizStreamRequest(BaseModel):
+    content: str
+    num_questions: int = Field(5, ge=1, le=quiz_batch.QUIZ_BATCH_MAX_QUESTIONS)
+    difficulty: str = "Medium"
+
+async def quiz_event_stream(request: QuizStreamRequest):
+    """
+    Yield each generated question as an SSE `question` event as soon as the
+    model has finished writing it, then a `done` event. If the provider fails
+    before producing anything, the fallback questions are sent instead and
+    `done` reports fallback=true.
+    """
+    started = time.perf_counter()
+    ttfb = None
+    count = 0
+    fallback = False
+    with token_budget.token_ledger("POST /generate-quiz/stream") as ledger:
+        try:
+            async for question in quiz_generator.stream_quiz_from_content(
+                request.content, request.num_questions, request.difficulty
+            ):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                    get_window("quiz_stream_first_question").observe(ttfb)
+                yield sse_event("question", {"index": count, "question": question})
+                count += 1
+        except asyncio.CancelledError:
+            logger.info("Quiz stream cancelled by client disconnect")
+            raise
+        except Exception as e:
+            logger.error(f"Quiz stream error: {str(e)}")
+            if count:
+                yield sse_event("error", {"error": str(e)})
+
+    if count:
+        outcomes.real()
+    else:
+        fallback = True
+        for question in quiz_generator.get_fallback_questions():
+            yield sse_event("question", {"index": count, "question": question})
+            count += 1
+
+    total = time.perf_counter() - started
+    get_window("quiz_stream_total").observe(total)
+    yield sse_event("done", {
+        "count": count,
+        "fallback": fallback,
+        "first_question_ms": round((ttfb or total) * 1000, 1),
+        "total_ms": round(total * 1000, 1),
+        "token_usage": ledger.summary(),
+    })
+
+@app.post("/generate-quiz/stream")
+async def generate_quiz_stream_endpoint(request: QuizStreamRequest):
+    """
+    Generate a quiz from text and push questions over Server-Sent Events as
+    they are parsed, so the admin dashboard can fill in while generation runs.
+    """
+    return StreamingResponse(
+        quiz_event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+import quiz_generator_gemini
+from quiz_chunking import text_budget
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+class QuizJobSettings(BaseModel):
+    """Quiz settings sent as form fields next to an uploaded document"""
+    num_questions: int = Field(10, ge=1, le=quiz_batch.QUIZ_BATCH_MAX_QUESTIONS)
+    difficulty: str = "Medium"
+
+def form_settings(fields: dict, num_questions: int = 10, difficulty: str = "Medium") -> QuizJobSettings:
+    """Validate the `num_questions` and `difficulty` form fields of an upload (422 when invalid)"""
+    try:
+        return QuizJobSettings(
+            num_questions=fields.get("num_questions", num_questions),
+            difficulty=fields.get("difficulty", difficulty),
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+@app.post("/generate-quiz")
+async def generate_quiz_endpoint(request: Request, num_questions: int = 10, difficulty: str = "Medium"):
+    """
+    Generate a quiz from an uploaded PDF or PPTX (multipart field `file`,
+    optional form fields `num_questions` and `difficulty`, validated like
+    POST /jobs/quiz: anything but 1 to QUIZ_BATCH_MAX_QUESTIONS is a 422).
+    Questions come from the document's leading text_budget() characters
+    (480k by default); the rest of a longer document is not extracted.
+
+    The upload is streamed into memory (or a temp file past UPLOAD_SPOOL_BYTES)
+    and parsed in place; uploads over UPLOAD_MAX_BYTES are rejected with 413
+    while they are still arriving.
+    """
+    upload = await uploads.receive_upload(request)
+    try:
+        settings = form_settings(upload.fields, num_questions, difficulty)
+        num_questions, difficulty = settings.num_questions, settings.difficulty
+        requested = max(num_questions, quiz_generator_gemini.MIN_FILE_QUESTIONS)
+        try:
+            text_content = await extract_text_cached(
+                upload.buffer.source(), upload.buffer.digest, upload.buffer.size,
+                text_budget(requested), upload.filename,
+            )
+        except Exception as e:
+            logger.error(f"Extraction failed for {upload.filename}: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Could not read {upload.filename}: {e}")
+        upload.mark_extracted()
+        with token_budget.token_ledger("POST /generate-quiz") as ledger:
+            quiz = await quiz_generator_gemini.generate_quiz_from_text(text_content, num_questions, difficulty)
+    finally:
+        upload.close()
+    return {
+        "message": f"Generated {len(quiz)} questions",
+        "filename": upload.filename,
+        "quiz_data": quiz,
+        "token_usage": ledger.summary(),
+    }
+
+from dataclasses import asdict
+from typing import List, Optional
+from pydantic import TypeAdapter
+
+class BatchQuizItem(BaseModel):
+    id: Optional[str] = None
+    # Text to generate from; for multipart requests the file at the same position is used instead
+    content: Optional[str] = None
+    num_questions: int = Field(5, ge=1, le=quiz_batch.QUIZ_BATCH_MAX_QUESTIONS)
+    difficulty: str = "Medium"
+
+class BatchQuizRequest(BaseModel):
+    items: List[BatchQuizItem] = Field(min_length=1, max_length=quiz_batch.QUIZ_BATCH_MAX_ITEMS)
+
+BATCH_SETTINGS = TypeAdapter(List[BatchQuizItem])
+
+def parse_batch_items(raw, model=BatchQuizRequest) -> List[BatchQuizItem]:
+    """Validate a batch body (or, with model=BATCH_SETTINGS, a bare list of item settings)"""
+    try:
+        parsed = model.validate_json(raw) if isinstance(model, TypeAdapter) else model.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    return parsed if isinstance(model, TypeAdapter) else parsed.items
+
+async def quiz_batch_event_stream(items: List[quiz_batch.BatchItem], upload: Optional[uploads.ReceivedUpload]):
+    """
+    Yield a `result` event per item in completion order, then a `done` event
+    with per-status counts, the batch's wall time next to its slowest item
+    and the summed item time, and the batch's token usage.
+    """
+    started = time.perf_counter()
+    counts = {"ok": 0, "fallback": 0, "error": 0}
+    slowest_ms = 0.0
+    sum_ms = 0.0
+    try:
+        with token_budget.token_ledger("POST /generate-quiz/batch") as ledger:
+            async for result in quiz_batch.BatchRunner(items).results():
+                counts[result.status] += 1
+                slowest_ms = max(slowest_ms, result.elapsed_ms)
+                sum_ms += result.elapsed_ms
+                yield sse_event("result", asdict(result))
+    except asyncio.CancelledError:
+        logger.info("Quiz batch cancelled by client disconnect")
+        raise
+    finally:
+        if upload is not None:
+            upload.close()
+
+    total = time.perf_counter() - started
+    get_window("quiz_batch_total").observe(total)
+    yield sse_event("done", {
+        "items": len(items),
+        **counts,
+        "total_ms": round(total * 1000, 1),
+        "slowest_item_ms": slowest_ms,
+        "sum_item_ms": round(sum_ms, 1),
+        "token_usage": ledger.summary(),
+    })
+
+@app.post("/generate-quiz/batch")
+async def generate_quiz_batch_endpoint(request: Request):
+    """
+    Generate several quizzes in one request and stream each one back over
+    Server-Sent Events as soon as it is ready.
+
+    JSON body: {"items": [{"id", "content", "num_questions", "difficulty"}, ...]}.
+    Multipart body: up to QUIZ_BATCH_MAX_ITEMS PDF/PPTX `files` parts, plus an
+    optional `items` field holding a JSON list of per-file settings (same
+    order as the files) and `num_questions` / `difficulty` defaults.
+    """
+    upload = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        upload = await uploads.receive_upload(request, max_files=quiz_batch.QUIZ_BATCH_MAX_ITEMS, field="files")
+        try:
+            try:
+                defaults = BatchQuizItem(
+                    num_questions=upload.fields.get("num_questions", 5),
+                    difficulty=upload.fields.get("difficulty", "Medium"),
+                )
+            except ValidationError as e:
+                raise RequestValidationError(e.errors())
+            settings = parse_batch_items(upload.fields["items"], BATCH_SETTINGS) if "items" in upload.fields else []
+            if len(settings) > len(upload.buffers):
+                raise HTTPException(status_code=400, detail="More items than uploaded files")
+        except Exception:
+            upload.close()
+            raise
+        settings += [defaults] * (len(upload.buffers) - len(settings))
+        items = [
+            quiz_batch.BatchItem(i, setting.id or buffer.filename, setting.num_questions, setting.difficulty,
+                                 upload=buffer)
+            for i, (setting, buffer) in enumerate(zip(settings, upload.buffers))
+        ]
+    else:
+        settings = parse_batch_items(await request.body())
+        if any(not (setting.content or "").strip() for setting in settings):
+            raise HTTPException(status_code=400, detail="Every item needs non-empty content")
+        items = [
+            quiz_batch.BatchItem(i, setting.id or str(i), setting.num_questions, setting.difficulty,
+                                 content=setting.content)
+            for i, setting in enumerate(settings)
+        ]
+
+    return StreamingResponse(
+        quiz_batch_event_stream(items, upload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class QuizJobRequest(QuizJobSettings):
+    content: str = Field(min_length=1)
+
+def require_job_queue() -> jobs.JobQueue:
+    job_queue = jobs.get_job_queue()
+    if job_queue is None:
+        raise HTTPException(status_code=404, detail="Quiz jobs are disabled (JOBS_ENABLED=false)")
+    return job_queue
+
+def require_job(job_id: str) -> dict:
+    job = require_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id}")
+    return job
+
+@app.post("/jobs/quiz", status_code=202)
+async def submit_quiz_job(request: Request):
+    """
+    Queue a quiz and return its job id straight away; poll GET /jobs/{id} for
+    progress and fetch GET /jobs/{id}/result when it is done.
+
+    Multipart body: a PDF/PPTX `file` plus optional `num_questions` and
+    `difficulty` fields. JSON body: {"content", "num_questions", "difficulty"}.
+    An identical submission that is queued, running or done (other than
+    with fallback questions) returns the existing job with deduplicated=true.
+    Document quizzes have at least MIN_FILE_QUESTIONS questions and draw on
+    the same leading part of the document as POST /generate-quiz.
+    """
+    job_queue = require_job_queue()
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        upload = await uploads.receive_upload(request)
+        try:
+            settings = form_settings(upload.fields)
+            job, deduplicated = await job_queue.submit_upload(upload.buffer, settings.num_questions,
+                                                              settings.difficulty)
+        finally:
+            upload.close()
+    else:
+        try:
+            settings = QuizJobRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        job, deduplicated = await job_queue.submit_text(settings.content, settings.num_questions,
+                                                        settings.difficulty)
+    return {
+        **jobs.public_view(job),
+        "deduplicated": deduplicated,
+        "status_url": f"/jobs/{job['id']}",
+        "result_url": f"/jobs/{job['id']}/result",
+    }
+
+@app.get("/jobs/{job_id}")
+def get_quiz_job(job_id: str):
+    """State and per-stage progress of a quiz job"""
+    return jobs.public_view(require_job(job_id))
+
+@app.get("/jobs/{job_id}/result")
+def get_quiz_job_result(job_id: str):
+    """The finished quiz, in the same shape as POST /generate-quiz; 409 while the job is not done"""
+    job = require_job(job_id)
+    if job["state"] != "done":
+        raise HTTPException(status_code=409, detail={"state": job["state"], "error": job["error"]})
+    return job["result"]
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_quiz_job(job_id: str):
+    """Cancel a queued or running quiz job; finished jobs are left as they are"""
+    require_job(job_id)
+    return jobs.public_view(await require_job_queue().cancel(job_id))
+
+if __name__ == "__main__":
+    # Worker count, reload mode and shared-state setup live in the launcher
+    import serve
+    serve.main()
@@ -0,0 +1,189 @@
+"""
+Prometheus metrics served on /metrics.
+
+Histograms break a request down by stage (request, extraction, prompt_build,
+provider_call, json_parse), so a slow quiz can be pinned on PDF parsing or
+on the model. Counters track quiz outcomes (real vs fallback questions,
+retries, failovers), how cleanly quiz replies parsed, cache lookups,
+provider errors by exception type and tokens in/out per model.
+
+The rolling windows in latency_stats stay as they are for /status; these are
+cumulative and meant to be scraped. provider_call() feeds both: each model
+call also lands in the per-model latency and outcome windows the model
+router decides from.
+
+When the service runs as several worker processes, serve.py points
+PROMETHEUS_MULTIPROC_DIR at an empty directory before the workers start;
+each process then writes its samples there and /metrics, whichever worker
+answers it, aggregates all of them.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Optional, Tuple
+
+from latency_stats import get_outcomes, get_window
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Quiz calls take seconds, extraction and parsing milliseconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "ai_service_request_duration_seconds", "HTTP request time until the last body byte is sent",
+    ["method", "route", "status"], buckets=BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "ai_service_stage_duration_seconds", "Time spent in one stage of handling a request",
+    ["stage"], buckets=BUCKETS,
+)
+QUIZ_EVENTS = Counter(
+    "ai_service_quiz_events_total", "Quiz requests answered with real or fallback questions, plus retries and failovers",
+    ["event"],
+)
+QUIZ_PARSES = Counter(
+    "ai_service_quiz_parses_total",
+    "Quiz replies by parse result: ok, partial (invalid or cut-off objects dropped) or failed (no valid question)",
+    ["result"],
+)
+CACHE_LOOKUPS = Counter(
+    "ai_service_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"],
+)
+PROVIDER_ERRORS = Counter(
+    "ai_service_provider_errors_total", "Failed provider calls by exception type", ["provider", "model", "error"],
+)
+TOKENS = Counter(
+    "ai_service_tokens_total", "Tokens sent to and received from each model", ["provider", "model", "direction"],
+)
+MODEL_ROUTES = Counter(
+    "ai_service_model_routes_total", "Model router decisions by task, chosen route and reason", ["task", "route", "reason"],
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def render() -> bytes:
+    """The current metrics in Prometheus text format (summed over worker processes in multiprocess mode)"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def mark_process_dead():
+    """Let multiprocess mode drop this worker's live samples once it exits"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def quiz_event(event: str):
+    QUIZ_EVENTS.labels(event).inc()
+
+
+def quiz_parse(result: str):
+    QUIZ_PARSES.labels(result).inc()
+
+
+def cache_lookup(cache: str, result: str):
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def record_tokens(provider: str, model: str, input_tokens: Optional[int], output_tokens: Optional[int]):
+    if input_tokens:
+        TOKENS.labels(provider, model, "input").inc(input_tokens)
+    if output_tokens:
+        TOKENS.labels(provider, model, "output").inc(output_tokens)
+
+
+def gemini_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(input, output) token counts from a Gemini response"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+def openai_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(input, output) token counts from an OpenAI chat completion"""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+class ProviderCall:
+    """Handle yielded by provider_call() for reporting the call's token usage"""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+
+    def tokens(self, input_tokens: Optional[int], output_tokens: Optional[int]):
+        record_tokens(self.provider, self.model, input_tokens, output_tokens)
+
+
+def model_window_name(provider: str, model: str) -> str:
+    """latency_stats window (and outcome window) name for calls to one model"""
+    return f"model_call_{provider}:{model}"
+
+
+def model_route(task: str, route: str, reason: str):
+    MODEL_ROUTES.labels(task, route, reason).inc()
+
+
+@contextmanager
+def provider_call(provider: str, model: str):
+    """Time one upstream model call as the provider_call stage and count its failure, if any"""
+    started = time.perf_counter()
+    name = model_window_name(provider, model)
+    try:
+        yield ProviderCall(provider, model)
+    except Exception as e:
+        # Not BaseException: a client disconnect cancelling the call is not a provider error
+        PROVIDER_ERRORS.labels(provider, model, type(e).__name__).inc()
+        get_outcomes(name).observe(False)
+        raise
+    else:
+        get_window(name).observe(time.perf_counter() - started)
+        get_outcomes(name).observe(True)
+    finally:
+        observe_stage("provider_call", time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing each HTTP request into REQUEST_SECONDS, labelled by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
@@ -0,0 +1,291 @@
+"""
+Per-request model choice from request size, difficulty and live model health.
+
+Every model in the catalog (MODEL_ROUTER_MODELS, DEFAULT_CATALOG below) has
+a tier, 1 = fastest and cheapest up to 3 = strongest, and a list price per
+million input and output tokens. A request first gets the tier it needs:
+
+    chat   1; 2 past MODEL_ROUTER_LONG_CHAT_TOKENS of input
+    quiz   Easy 1, Medium and Hard 2; Hard with at least
+           MODEL_ROUTER_LARGE_QUIZ_QUESTIONS questions or
+           MODEL_ROUTER_LARGE_INPUT_TOKENS of content 3
+
+Candidates are the configured providers' models whose context window holds
+the input and the output budget. Each is checked against the task's SLO
+(MODEL_ROUTER_<TASK>_P95_MS, MODEL_ROUTER_MAX_ERROR_RATE) with its live
+numbers: p95 latency and error rate of its recent calls, which
+metrics.provider_call records for every upstream call. A model with fewer
+than MODEL_ROUTER_MIN_SAMPLES calls in the last MODEL_ROUTER_STATS_SECONDS
+counts as within SLO; that is also how a model that was routed around gets
+traffic, and fresh numbers, again once its old samples age out.
+
+The chosen route is the model of at least the required tier that meets the
+SLO from the preferred provider (LLM_PROVIDER; gemini, then openai under
+auto), the one with the lowest estimated cost there (the lower p95 on a
+tie). Another provider's models take over when the preferred provider has
+none that qualifies. The others
+follow as failover routes: capable models within SLO, then lower tiers
+within SLO (a weaker answer beats a late one), then models breaching it,
+fewest errors first.
+
+Every decision is logged, counted in ai_service_model_routes_total and kept
+with its candidate table in the recent history on /status.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+from latency_stats import get_outcomes, get_window
+from llm_providers import LOCAL_MODEL, get_registry
+from resilience import Route
+from token_budget import CHARS_PER_TOKEN, estimator, model_limits
+
+load_dotenv()
+
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+# SLOs: p95 of one model call, and the share of calls that may fail
+MODEL_ROUTER_CHAT_P95_MS = float(os.getenv("MODEL_ROUTER_CHAT_P95_MS", "4000"))
+MODEL_ROUTER_QUIZ_P95_MS = float(os.getenv("MODEL_ROUTER_QUIZ_P95_MS", "20000"))
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", "0.1"))
+# Live numbers: how many recent calls make them trustworthy, and how recent
+MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "20"))
+MODEL_ROUTER_STATS_SECONDS = float(os.getenv("MODEL_ROUTER_STATS_SECONDS", "300"))
+# Where requests start needing a stronger model
+MODEL_ROUTER_LONG_CHAT_TOKENS = int(os.getenv("MODEL_ROUTER_LONG_CHAT_TOKENS", "1500"))
+MODEL_ROUTER_LARGE_QUIZ_QUESTIONS = int(os.getenv("MODEL_ROUTER_LARGE_QUIZ_QUESTIONS", "20"))
+MODEL_ROUTER_LARGE_INPUT_TOKENS = int(os.getenv("MODEL_ROUTER_LARGE_INPUT_TOKENS", "8000"))
+# Expected reply length of a chat answer, for its cost estimate
+MODEL_ROUTER_CHAT_OUTPUT_TOKENS = int(os.getenv("MODEL_ROUTER_CHAT_OUTPUT_TOKENS", "400"))
+# Decisions kept for /status
+MODEL_ROUTER_HISTORY = int(os.getenv("MODEL_ROUTER_HISTORY", "20"))
+
+DIFFICULTY_TIERS = {"Easy": 1, "Medium": 2, "Hard": 2}
+MAX_TIER = 3
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    provider: str
+    model: str
+    tier: int
+    # List price in USD per million tokens
+    input_cost: float
+    output_cost: float
+
+    @property
+    def route(self) -> Route:
+        return Route(self.provider, self.model)
+
+
+@dataclass(frozen=True)
+class SLO:
+    p95_ms: float
+    max_error_rate: float
+
+
+DEFAULT_CATALOG = [
+    ModelProfile("gemini", "gemini-1.5-flash", 1, 0.075, 0.30),
+    ModelProfile("gemini", "models/gemini-flash-latest", 2, 0.30, 2.50),
+    ModelProfile("gemini", "gemini-2.5-pro", 3, 1.25, 10.00),
+    ModelProfile("openai", "gpt-4o-mini", 2, 0.15, 0.60),
+    ModelProfile("openai", "gpt-4o", 3, 2.50, 10.00),
+    ModelProfile("local", LOCAL_MODEL, MAX_TIER, 0.0, 0.0),
+]
+
+
+def load_catalog() -> List[ModelProfile]:
+    """MODEL_ROUTER_MODELS (a JSON list of ModelProfile fields) or the default catalog"""
+    configured = os.getenv("MODEL_ROUTER_MODELS")
+    if not configured:
+        return list(DEFAULT_CATALOG)
+    return [ModelProfile(**entry) for entry in json.loads(configured)]
+
+
+@dataclass
+class RouteDecision:
+    """Routes to try in order (the first is the choice) and the report explaining them"""
+    task: str
+    routes: List[Route]
+    reason: str
+    report: Dict[str, Any]
+
+    @property
+    def route(self) -> Optional[Route]:
+        return self.routes[0] if self.routes else None
+
+
+class ModelRouter:
+    def __init__(self, catalog: Optional[List[ModelProfile]] = None, slos: Optional[Dict[str, SLO]] = None,
+                 enabled: bool = MODEL_ROUTER_ENABLED):
+        self.catalog = catalog if catalog is not None else load_catalog()
+        self.slos = slos or {
+            "chat": SLO(MODEL_ROUTER_CHAT_P95_MS, MODEL_ROUTER_MAX_ERROR_RATE),
+            "quiz": SLO(MODEL_ROUTER_QUIZ_P95_MS, MODEL_ROUTER_MAX_ERROR_RATE),
+        }
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=MODEL_ROUTER_HISTORY)
+        self._decisions: Counter = Counter()
+
+    @staticmethod
+    def required_tier(task: str, input_tokens: int, num_questions: int = 0,
+                      difficulty: Optional[str] = None) -> Tuple[int, str]:
+        """The weakest tier good enough for the request, and why"""
+        if task == "chat":
+            if input_tokens > MODEL_ROUTER_LONG_CHAT_TOKENS:
+                return 2, f"long chat ({input_tokens} tokens)"
+            return 1, "short chat"
+        tier = DIFFICULTY_TIERS.get(difficulty, 2)
+        large = num_questions >= MODEL_ROUTER_LARGE_QUIZ_QUESTIONS or input_tokens >= MODEL_ROUTER_LARGE_INPUT_TOKENS
+        if difficulty == "Hard" and large:
+            return MAX_TIER, f"large Hard quiz ({num_questions} questions, {input_tokens} tokens)"
+        return tier, f"{difficulty} quiz"
+
+    @staticmethod
+    def live_stats(route: Route) -> Dict[str, Any]:
+        """Recent p95 latency and error rate of calls to `route`"""
+        name = metrics.model_window_name(route.provider, route.model)
+        window = get_window(name)
+        samples, error_rate = get_outcomes(name).error_rate(MODEL_ROUTER_STATS_SECONDS)
+        fresh = window.last_observed is not None and time.monotonic() - window.last_observed <= MODEL_ROUTER_STATS_SECONDS
+        p95 = window.percentile(95) if fresh else None
+        return {
+            "samples": samples,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": error_rate,
+        }
+
+    def _assess(self, profile: ModelProfile, slo: SLO, input_text: str, output_tokens: int) -> Dict[str, Any]:
+        input_tokens = estimator.count(input_text, profile.model)
+        stats = self.live_stats(profile.route)
+        if input_tokens + output_tokens > model_limits(profile.model)[0]:
+            status = "too_small"
+        elif stats["samples"] < MODEL_ROUTER_MIN_SAMPLES:
+            status = "no_data"
+        elif stats["error_rate"] is not None and stats["error_rate"] > slo.max_error_rate:
+            status = "errors"
+        elif stats["p95_ms"] is not None and stats["p95_ms"] > slo.p95_ms:
+            status = "slow"
+        else:
+            status = "ok"
+        cost = (input_tokens * profile.input_cost + output_tokens * profile.output_cost) / 1_000_000
+        return {
+            "route": str(profile.route),
+            "tier": profile.tier,
+            "status": status,
+            **stats,
+            "estimated_cost_usd": round(cost, 6),
+        }
+
+    def _decide(self, task: str, input_text: str, output_tokens, tier_inputs: Dict[str, Any]) -> RouteDecision:
+        providers = get_registry()
+        enabled = providers.enabled_providers()
+        # The preferred provider (LLM_PROVIDER, or the default order under auto)
+        # keeps its models ahead; the others are its failover, as without the router
+        rank = {name: i for i, name in enumerate(enabled)}
+        input_tokens = max(1, round(len(input_text) / CHARS_PER_TOKEN))
+        required, why = self.required_tier(task, input_tokens, tier_inputs.get("num_questions", 0),
+                                           tier_inputs.get("difficulty"))
+        slo = self.slos[task]
+
+        profiles = [profile for profile in self.catalog if profile.provider in enabled]
+        candidates = [(profile, self._assess(profile, slo, input_text, output_tokens(profile.model)))
+                      for profile in profiles]
+        fitting = [pair for pair in candidates if pair[1]["status"] != "too_small"]
+        usable = ("ok", "no_data")
+        if not fitting:
+            # Nothing holds the whole input; the content is trimmed to fit anyway
+            fitting, usable = candidates, usable + ("too_small",)
+
+        def order(pair) -> tuple:
+            profile, assessment = pair
+            p95 = assessment["p95_ms"] if assessment["p95_ms"] is not None else 0.0
+            return rank.get(profile.provider, 0), assessment["estimated_cost_usd"], p95
+
+        healthy = [pair for pair in fitting if pair[1]["status"] in usable]
+        capable = sorted((pair for pair in healthy if pair[0].tier >= required), key=order)
+        weaker = sorted((pair for pair in healthy if pair[0].tier < required),
+                        key=lambda pair: (-pair[0].tier,) + order(pair))
+        breaching = sorted((pair for pair in fitting if pair[1]["status"] in ("slow", "errors")),
+                           key=lambda pair: (pair[1]["error_rate"] or 0.0, pair[1]["p95_ms"] or 0.0))
+        if capable:
+            reason = "within_slo"
+        elif weaker:
+            reason = "downgraded"
+        else:
+            reason = "all_breaching" if breaching else "no_model"
+        ranked = capable + weaker + breaching
+        routes = [profile.route for profile, _ in ranked]
+
+        chosen = ranked[0][1] if ranked else {}
+        report = {
+            "task": task,
+            **tier_inputs,
+            "input_tokens": input_tokens,
+            "required_tier": required,
+            "tier_reason": why,
+            "route": chosen.get("route"),
+            "reason": reason,
+            "estimated_cost_usd": chosen.get("estimated_cost_usd"),
+            "failover": [str(route) for route in routes[1:]],
+            "candidates": [assessment for _, assessment in candidates],
+        }
+        return RouteDecision(task, routes, reason, report)
+
+    def _record(self, decision: RouteDecision) -> RouteDecision:
+        route = str(decision.route) if decision.route else "none"
+        metrics.model_route(decision.task, route, decision.reason)
+        with self._lock:
+            self._decisions[f"{decision.task} {route}"] += 1
+            self._recent.append({"at": round(time.time(), 3), **decision.report})
+        report = decision.report
+        logger.info(f"Routed {decision.task} to {route} ({decision.reason}; needs tier "
+                    f"{report.get('required_tier')}: {report.get('tier_reason')}; "
+                    f"est. ${report.get('estimated_cost_usd') or 0:.6f})")
+        return decision
+
+    def route_quiz(self, content: str, num_questions: int, difficulty: str) -> RouteDecision:
+        """Models for one quiz call generating `num_questions` from `content`"""
+        if not self.enabled:
+            routes = get_registry().quiz_routes()
+            return RouteDecision("quiz", routes, "router_disabled", {"route": str(routes[0]) if routes else None})
+        return self._record(self._decide(
+            "quiz", content, lambda model: estimator.output_budget(model, num_questions),
+            {"num_questions": num_questions, "difficulty": difficulty},
+        ))
+
+    def route_chat(self, prompt: str) -> RouteDecision:
+        """Model for one chat answer"""
+        if not self.enabled:
+            route = get_registry().chat_route()
+            return RouteDecision("chat", [route] if route else [], "router_disabled", {"route": str(route)})
+        return self._record(self._decide("chat", prompt, lambda model: MODEL_ROUTER_CHAT_OUTPUT_TOKENS, {}))
+
+    def stats(self) -> Dict[str, Any]:
+        enabled = get_registry().enabled_providers()
+        with self._lock:
+            decisions = dict(self._decisions)
+            recent = list(self._recent)
+        return {
+            "enabled": self.enabled,
+            "slos": {task: asdict(slo) for task, slo in self.slos.items()},
+            "models": [
+                {"route": str(profile.route), "tier": profile.tier, **self.live_stats(profile.route)}
+                for profile in self.catalog if profile.provider in enabled
+            ],
+            "decisions": decisions,
+            "recent": recent,
+        }
+
+
+router = ModelRouter()
@@ -0,0 +1,235 @@
+"""
+Opt-in sampling profiler for the running service.
+
+With PROFILE_ENABLED=true, a PROFILE_SAMPLE_RATE fraction of HTTP requests
+is profiled. While at least one sampled request is in flight, a background
+thread snapshots every thread's Python stack (sys._current_frames) each
+PROFILE_INTERVAL_MS and charges the sample to the endpoint(s) being profiled.
+Requests run on the event loop and hand work to the provider, extraction and
+hedge thread pools, so all threads are sampled; threads parked in an idle
+wait are skipped. When sampled requests for different endpoints overlap,
+each of them is charged with the shared samples.
+
+Stacks are aggregated per endpoint and written every PROFILE_FLUSH_SECONDS
+(and on shutdown) to PROFILE_DIR/<endpoint>.folded in the collapsed format
+flamegraph.pl and speedscope read. /admin/profile, guarded by
+PROFILE_ADMIN_TOKEN, returns the hottest functions per endpoint.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_FLUSH_SECONDS = float(os.getenv("PROFILE_FLUSH_SECONDS", "30"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(Path(__file__).parent / "cache" / "profiles"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_MAX_DEPTH = 64
+
+Stack = Tuple[str, ...]
+
+# Leaf functions of a thread that is waiting for work rather than doing any
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    # uvloop's event loop is C code, so an idle loop thread shows asyncio.run's frame
+    ("runners.py", "run"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+_THREAD_NUMBER_RE = re.compile(r"[_-]\d+$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_LEAVES
+
+
+def _stack(frame, thread_name: str) -> Stack:
+    """Root-first stack of labels, under the thread pool's name"""
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(_THREAD_NUMBER_RE.sub("", thread_name))
+    return tuple(reversed(labels))
+
+
+def endpoint_label(scope: Dict[str, Any]) -> str:
+    """Route template of a request ("POST /generate-quiz"), once routing has happened"""
+    route = getattr(scope.get("route"), "path", None) or scope.get("path", "?")
+    return f"{scope.get('method', '')} {route}".strip()
+
+
+class SamplingProfiler:
+    """Samples thread stacks while sampled requests are active and aggregates them per endpoint"""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, interval_ms: float = PROFILE_INTERVAL_MS,
+                 directory: str = PROFILE_DIR, flush_seconds: float = PROFILE_FLUSH_SECONDS):
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Dict[str, Counter] = defaultdict(Counter)
+        self._dirty = set()
+        self._counters = {"requests_profiled": 0, "samples": 0}
+
+    def should_sample(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def begin(self, scope: Dict[str, Any]) -> int:
+        """Start charging samples to this request; returns a token for end()"""
+        token = id(scope)
+        with self._lock:
+            self._active[token] = scope
+            self._counters["requests_profiled"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return token
+
+    def end(self, token: int):
+        with self._lock:
+            self._active.pop(token, None)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            with self._lock:
+                endpoints = [endpoint_label(scope) for scope in self._active.values()]
+            if not endpoints:
+                self._wake.clear()
+                self.flush()
+                self._wake.wait()
+                continue
+            self._sample(endpoints)
+            if time.monotonic() - last_flush >= self.flush_seconds:
+                self.flush()
+                last_flush = time.monotonic()
+            time.sleep(self.interval)
+
+    def _sample(self, endpoints: List[str]):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = [
+            _stack(frame, names.get(ident, "thread"))
+            for ident, frame in sys._current_frames().items()
+            if ident != own and not _is_idle(frame)
+        ]
+        with self._lock:
+            for endpoint in set(endpoints):
+                counter = self._stacks[endpoint]
+                counter.update(stacks)
+                self._dirty.add(endpoint)
+            self._counters["samples"] += 1
+
+    def folded(self, endpoint: str) -> str:
+        """Collapsed stacks ("frame;frame;frame count" per line) for one endpoint"""
+        with self._lock:
+            items = list(self._stacks.get(endpoint, {}).items())
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(items))
+
+    def flush(self):
+        """Rewrite PROFILE_DIR/<endpoint>.folded for every endpoint with new samples"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for endpoint in dirty:
+            name = re.sub(r"[^A-Za-z0-9]+", "_", endpoint).strip("_") or "root"
+            path = self.directory / f"{name}.folded"
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(self.folded(endpoint))
+            os.replace(tmp, path)
+
+    def top(self, limit: int = 20, endpoint: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Hottest functions per endpoint by self samples, with inclusive samples alongside"""
+        with self._lock:
+            snapshot = {name: dict(counter) for name, counter in self._stacks.items()
+                        if endpoint is None or name == endpoint}
+        report = {}
+        for name, stacks in snapshot.items():
+            total = sum(stacks.values())
+            own: Counter = Counter()
+            inclusive: Counter = Counter()
+            for stack, count in stacks.items():
+                own[stack[-1]] += count
+                for label in set(stack[1:]):
+                    inclusive[label] += count
+            report[name] = [
+                {
+                    "function": label,
+                    "self_samples": count,
+                    "self_pct": round(100 * count / total, 1),
+                    "total_samples": inclusive[label],
+                    "total_pct": round(100 * inclusive[label] / total, 1),
+                }
+                for label, count in own.most_common(limit)
+            ]
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "enabled": True,
+                "sample_rate": self.sample_rate,
+                "interval_ms": self.interval * 1000,
+                "active_requests": len(self._active),
+                "endpoints": sorted(self._stacks),
+            }
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    """Return the process-wide profiler, or None when PROFILE_ENABLED=false"""
+    global _profiler
+    if not PROFILE_ENABLED:
+        return None
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler()
+    return _profiler
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles a random PROFILE_SAMPLE_RATE fraction of HTTP requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = get_profiler()
+        if scope["type"] != "http" or profiler is None or not profiler.should_sample():
+            await self.app(scope, receive, send)
+            return
+        token = profiler.begin(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(token)
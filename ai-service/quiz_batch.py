@@ -0,0 +1,117 @@
+"""
+Batch quiz generation: many documents or text bodies in one request.
+
+Every item carries its own num_questions and difficulty and goes through
+quiz_generator.generate_quiz_from_content, the same path (and quiz cache)
+as a single quiz. Items run concurrently, at most QUIZ_BATCH_CONCURRENCY at
+a time on top of the provider admission limits, and results are yielded in
+completion order, so a batch takes about as long as its slowest item rather
+than the sum of them.
+
+Uploaded documents go through the extracted-text cache. Items sharing the
+same upload (same SHA-256) are extracted once, with the largest text budget
+any of them needs, and each item then takes the text it would have got on
+its own.
+
+A failed item does not fail the batch: generation errors are answered with
+the fallback questions (status "fallback"), unreadable documents with
+status "error" and no questions.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import quiz_generator
+from quiz_chunking import text_budget
+from text_cache import extract_text_cached
+from uploads import UploadBuffer
+
+load_dotenv()
+
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", "8"))
+QUIZ_BATCH_MAX_ITEMS = int(os.getenv("QUIZ_BATCH_MAX_ITEMS", "50"))
+QUIZ_BATCH_MAX_QUESTIONS = int(os.getenv("QUIZ_BATCH_MAX_QUESTIONS", "50"))
+
+
+@dataclass
+class BatchItem:
+    """One quiz to generate: from `content`, or from an uploaded document"""
+    index: int
+    id: str
+    num_questions: int
+    difficulty: str
+    content: Optional[str] = None
+    upload: Optional[UploadBuffer] = None
+
+
+@dataclass
+class BatchResult:
+    index: int
+    id: str
+    status: str
+    quiz_data: List[Dict[str, Any]]
+    error: Optional[str]
+    elapsed_ms: float
+
+
+class BatchRunner:
+    """Runs one batch's items with bounded parallelism and shared extraction"""
+
+    def __init__(self, items: List[BatchItem], concurrency: int = QUIZ_BATCH_CONCURRENCY):
+        self.items = items
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        # Largest text budget per document, so one extraction serves every item using it
+        self._budgets: Dict[str, int] = {}
+        for item in items:
+            if item.upload is not None:
+                digest = item.upload.digest
+                self._budgets[digest] = max(self._budgets.get(digest, 0), text_budget(item.num_questions))
+        self._extractions: Dict[str, asyncio.Task] = {}
+
+    async def _text(self, item: BatchItem) -> str:
+        if item.upload is None:
+            return item.content or ""
+        digest = item.upload.digest
+        if digest not in self._extractions:
+            self._extractions[digest] = asyncio.ensure_future(extract_text_cached(
+                item.upload.source(), digest, item.upload.size, self._budgets[digest], item.upload.filename,
+            ))
+        text = await asyncio.shield(self._extractions[digest])
+        return text[:text_budget(item.num_questions)]
+
+    async def _run(self, item: BatchItem) -> BatchResult:
+        async with self._semaphore:
+            started = time.perf_counter()
+
+            def result(status: str, quiz: List[Dict[str, Any]], error: Optional[str] = None) -> BatchResult:
+                elapsed = round((time.perf_counter() - started) * 1000, 1)
+                return BatchResult(item.index, item.id, status, quiz, error, elapsed)
+
+            try:
+                content = await self._text(item)
+            except Exception as e:
+                print(f"Batch item {item.id}: could not read {item.upload.filename}: {e}")
+                return result("error", [], f"Could not read {item.upload.filename}: {e}")
+            if not content.strip():
+                return result("error", [], "No text to generate questions from")
+            try:
+                quiz = await quiz_generator.generate_quiz_from_content(
+                    content, item.num_questions, item.difficulty, fallback=False,
+                )
+                return result("ok", quiz)
+            except Exception as e:
+                return result("fallback", quiz_generator.get_fallback_questions(), str(e))
+
+    async def results(self) -> AsyncIterator[BatchResult]:
+        """Each item's result as soon as it is ready; pending items are cancelled if the caller stops early"""
+        tasks = [asyncio.ensure_future(self._run(item)) for item in self.items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in [*tasks, *self._extractions.values()]:
+                task.cancel()
@@ -0,0 +1,193 @@
+"""
+Content-addressed cache for generated quizzes.
+
+Keys are a SHA-256 of the normalized source text plus the generation settings
+(question count, difficulty, provider/model), so re-uploading the same deck
+returns the stored questions instead of paying for another model call.
+
+Two tiers:
+- an in-memory LRU for the hottest entries of this process
+- a SQLite file that survives restarts, evicted by total size
+
+Both tiers honour the same TTL. Only real model output is stored; callers must
+never put fallback questions here.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+from shared_state import connect
+
+load_dotenv()
+
+QUIZ_CACHE_ENABLED = os.getenv("QUIZ_CACHE_ENABLED", "true").lower() == "true"
+QUIZ_CACHE_PATH = os.getenv("QUIZ_CACHE_PATH", str(Path(__file__).parent / "cache" / "quiz_cache.sqlite3"))
+QUIZ_CACHE_MEMORY_ENTRIES = int(os.getenv("QUIZ_CACHE_MEMORY_ENTRIES", "256"))
+QUIZ_CACHE_MAX_BYTES = int(os.getenv("QUIZ_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+QUIZ_CACHE_TTL_SECONDS = int(os.getenv("QUIZ_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so cosmetic differences share a key"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_key(content: str, num_questions: int, difficulty: str, model: str) -> str:
+    """Cache key for a quiz generated from `content` with the given settings"""
+    digest = hashlib.sha256()
+    digest.update(normalize_text(content).encode("utf-8"))
+    digest.update(f"\0{num_questions}\0{difficulty.strip().lower()}\0{model}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QuizCache:
+    """Two-tier (memory LRU + SQLite) cache of quiz question lists"""
+
+    def __init__(self, path: str = QUIZ_CACHE_PATH, memory_entries: int = QUIZ_CACHE_MEMORY_ENTRIES,
+                 max_bytes: int = QUIZ_CACHE_MAX_BYTES, ttl_seconds: int = QUIZ_CACHE_TTL_SECONDS):
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                          "memory_evictions": 0, "disk_evictions": 0, "expired": 0}
+
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS quiz_cache ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS quiz_cache_last_access ON quiz_cache (last_access)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a fresh copy of the cached questions, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, payload = entry
+                if now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    metrics.cache_lookup("quiz", "memory_hit")
+                    return json.loads(payload)
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT payload, created_at FROM quiz_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                metrics.cache_lookup("quiz", "miss")
+                return None
+
+            payload, created_at = row
+            if now - created_at >= self.ttl_seconds:
+                self._db.execute("DELETE FROM quiz_cache WHERE key = ?", (key,))
+                self._db.commit()
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                metrics.cache_lookup("quiz", "miss")
+                return None
+
+            self._db.execute("UPDATE quiz_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, created_at, payload)
+            self._counters["disk_hits"] += 1
+            metrics.cache_lookup("quiz", "disk_hit")
+            return json.loads(payload)
+
+    def put(self, key: str, questions: List[Dict[str, Any]]):
+        """Store generated questions in both tiers"""
+        payload = json.dumps(questions, separators=(",", ":"))
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, payload)
+            self._db.execute(
+                "INSERT OR REPLACE INTO quiz_cache (key, payload, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            self._evict_disk(now)
+            self._db.commit()
+            self._counters["stores"] += 1
+
+    def _remember(self, key: str, created_at: float, payload: str):
+        # Caller holds self._lock
+        self._memory[key] = (created_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def _evict_disk(self, now: float):
+        # Caller holds self._lock. Drop expired rows, then least recently used
+        # rows until the table fits in max_bytes.
+        self._db.execute("DELETE FROM quiz_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM quiz_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM quiz_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM quiz_cache WHERE key = ?", (key,))
+            total -= size
+            self._counters["disk_evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM quiz_cache")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, disk_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM quiz_cache"
+            ).fetchone()
+            counters = dict(self._counters)
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": entries,
+            "disk_bytes": disk_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_quiz_cache: Optional[QuizCache] = None
+_quiz_cache_lock = threading.Lock()
+
+
+def get_quiz_cache() -> Optional[QuizCache]:
+    """Return the process-wide quiz cache, or None when QUIZ_CACHE_ENABLED=false"""
+    global _quiz_cache
+    if not QUIZ_CACHE_ENABLED:
+        return None
+    if _quiz_cache is None:
+        with _quiz_cache_lock:
+            if _quiz_cache is None:
+                _quiz_cache = QuizCache()
+    return _quiz_cache
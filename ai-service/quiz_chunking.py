@@ -0,0 +1,243 @@
+"""
+Map-reduce quiz generation for documents larger than one model context.
+
+Instead of truncating long documents, the text is split into sections on
+paragraph boundaries, the requested question count is spread across sections
+in proportion to how much content they hold, sections are generated
+concurrently with a bounded fan-out, and the results are merged in document
+order with duplicate questions removed. Wall-clock time is set by the slowest
+wave of section calls rather than by document length.
+
+Coverage is bounded by extraction, not only by the section calls: uploads are
+extracted only up to text_budget() characters (QUIZ_CHUNK_CHARS times the
+section calls times QUIZ_EXTRACT_OVERSAMPLE, 480k characters by default),
+and sections are sampled from that leading part. A document longer than the
+budget gets no questions from its tail; raise QUIZ_EXTRACT_OVERSAMPLE to
+reach further into long documents at the cost of parsing more pages.
+"""
+import asyncio
+import os
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Characters per section (matches the old single-call context limit)
+QUIZ_CHUNK_CHARS = int(os.getenv("QUIZ_CHUNK_CHARS", "15000"))
+# Section calls in flight at once
+QUIZ_CHUNK_CONCURRENCY = int(os.getenv("QUIZ_CHUNK_CONCURRENCY", "4"))
+# Upper bound on section calls per quiz; very long documents are sampled
+# evenly across their length instead of sending every section
+QUIZ_MAX_CHUNK_CALLS = int(os.getenv("QUIZ_MAX_CHUNK_CALLS", "8"))
+# Source text gathered per section call before extraction stops early; the
+# surplus lets section sampling still spread across the document
+QUIZ_EXTRACT_OVERSAMPLE = int(os.getenv("QUIZ_EXTRACT_OVERSAMPLE", "4"))
+# Word-overlap above which two questions count as duplicates
+DUPLICATE_SIMILARITY = 0.85
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n|\f")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+")
+
+GenerateChunk = Callable[[str, int], Awaitable[List[Dict[str, Any]]]]
+# Called with (sections finished, sections planned) as generation advances
+SectionProgress = Callable[[int, int], None]
+
+
+def _pieces(text: str, max_chars: int) -> List[str]:
+    """Paragraphs, with any paragraph longer than max_chars split by sentence (or hard-cut)"""
+    pieces = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+    return pieces
+
+
+def split_into_sections(text: str, max_chars: int = QUIZ_CHUNK_CHARS) -> List[str]:
+    """Pack paragraphs into sections of at most max_chars characters, in order"""
+    sections: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in _pieces(text, max_chars):
+        if current and size + len(piece) + 2 > max_chars:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def content_weight(section: str) -> int:
+    """How much material a section holds (words, ignoring layout whitespace)"""
+    return len(_WORD_RE.findall(section))
+
+
+def select_sections(sections: List[str], max_calls: int) -> List[int]:
+    """Indexes of at most max_calls sections, spread evenly by content across the document"""
+    if len(sections) <= max_calls:
+        return list(range(len(sections)))
+    weights = [content_weight(section) for section in sections]
+    total = sum(weights) or 1
+    chosen: List[int] = []
+    cumulative = 0
+    targets = [(k + 0.5) * total / max_calls for k in range(max_calls)]
+    target_index = 0
+    for index, weight in enumerate(weights):
+        cumulative += weight
+        while target_index < len(targets) and cumulative >= targets[target_index]:
+            if not chosen or chosen[-1] != index:
+                chosen.append(index)
+            target_index += 1
+    return chosen
+
+
+def allocate_questions(weights: List[int], total: int) -> List[int]:
+    """Split `total` questions across sections proportionally to weight (largest remainder)"""
+    if not weights:
+        return []
+    weight_sum = sum(weights)
+    if weight_sum == 0:
+        weights = [1] * len(weights)
+        weight_sum = len(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(weights)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+class QuestionDeduper:
+    """Remembers accepted questions and rejects exact or near-duplicate ones"""
+
+    def __init__(self):
+        self._seen: List[Set[str]] = []
+
+    def add(self, question: Dict[str, Any]) -> bool:
+        words = set(_WORD_RE.findall(str(question.get("q", "")).lower()))
+        if not words:
+            return False
+        if any(len(words & other) / len(words | other) >= DUPLICATE_SIMILARITY for other in self._seen):
+            return False
+        self._seen.append(words)
+        return True
+
+
+def merge_questions(batches: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Concatenate batches in order, dropping exact and near-duplicate questions"""
+    deduper = QuestionDeduper()
+    merged: List[Dict[str, Any]] = []
+    for batch in batches:
+        for question in batch:
+            if deduper.add(question):
+                merged.append(question)
+                if len(merged) >= limit:
+                    return merged
+    return merged
+
+
+def text_budget(num_questions: int) -> int:
+    """Characters of source text worth extracting for a quiz of `num_questions`;
+    text past this point of a document is never read, so it gets no questions"""
+    calls = min(QUIZ_MAX_CHUNK_CALLS, max(1, num_questions))
+    return QUIZ_CHUNK_CHARS * calls * QUIZ_EXTRACT_OVERSAMPLE
+
+
+def plan_sections(text: str, num_questions: int, max_chars: int = QUIZ_CHUNK_CHARS,
+                  max_calls: int = QUIZ_MAX_CHUNK_CALLS) -> List[Tuple[str, int]]:
+    """(section text, question count) pairs covering the document, in document order"""
+    sections = split_into_sections(text, max_chars)
+    if not sections:
+        raise ValueError("No text content to generate questions from")
+    chosen = select_sections(sections, min(max_calls, max(1, num_questions)))
+    counts = allocate_questions([content_weight(sections[i]) for i in chosen], num_questions)
+    jobs = [(sections[i], count) for i, count in zip(chosen, counts) if count > 0]
+    if len(sections) > 1:
+        print(f"Generating {num_questions} questions from {len(jobs)} of {len(sections)} sections")
+    return jobs
+
+
+async def generate_in_sections(text: str, num_questions: int, generate_chunk: GenerateChunk,
+                               concurrency: int = QUIZ_CHUNK_CONCURRENCY,
+                               progress: Optional[SectionProgress] = None) -> List[Dict[str, Any]]:
+    """
+    Generate `num_questions` questions covering the whole of `text`.
+
+    `generate_chunk(section_text, count)` must raise on failure rather than
+    return fallback questions; failed sections are skipped and the error is
+    re-raised only if every section failed. `progress`, if given, is called
+    once the sections are planned and again as each one finishes.
+    """
+    jobs = plan_sections(text, num_questions)
+    if not jobs:
+        # No questions asked for
+        return []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    finished = 0
+    if progress is not None:
+        progress(0, len(jobs))
+
+    async def run(section: str, count: int) -> List[Dict[str, Any]]:
+        nonlocal finished
+        async with semaphore:
+            try:
+                return await generate_chunk(section, count)
+            finally:
+                finished += 1
+                if progress is not None:
+                    progress(finished, len(jobs))
+
+    results = await asyncio.gather(*(run(section, count) for section, count in jobs), return_exceptions=True)
+    batches = [result for result in results if not isinstance(result, BaseException)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if not batches:
+        raise errors[0]
+    for error in errors:
+        print(f"Section generation failed, skipping it: {error}")
+    return merge_questions(batches, num_questions)
+
+
+async def stream_sections(jobs: List[Tuple[str, int]], num_questions: int, generate_chunk: GenerateChunk,
+                          concurrency: int = QUIZ_CHUNK_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+    """Like generate_in_sections, but yields each section's new questions as soon as it finishes"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(section: str, count: int) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await generate_chunk(section, count)
+
+    tasks = [asyncio.ensure_future(run(section, count)) for section, count in jobs]
+    deduper = QuestionDeduper()
+    produced = 0
+    errors = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                batch = await finished
+            except Exception as e:
+                print(f"Section generation failed, skipping it: {e}")
+                errors.append(e)
+                continue
+            for question in batch:
+                if produced < num_questions and deduper.add(question):
+                    produced += 1
+                    yield question
+    finally:
+        for task in tasks:
+            task.cancel()
+    if not produced and errors:
+        raise errors[0]
@@ -1,114 +1,107 @@
+import asyncio
 import os
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Sequence, Tuple
 from pathlib import Path
 
 # External libs
 
 from dotenv import load_dotenv
 
-# Try to import Google Gemini, fallback to OpenAI if not available
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    print("Google Gemini not installed. Install with: pip install google-generativeai")
+from llm_adapters import Completion, CompletionRequest, get_adapter
+from llm_providers import GEMINI_AVAILABLE, OPENAI_AVAILABLE, get_registry
+from model_router import router
+from quiz_cache import get_quiz_cache, make_key as make_cache_key
+from quiz_parser import IncrementalQuestionParser, parse_and_record, top_up, top_up_sync
+from quiz_chunking import QuestionDeduper, SectionProgress, generate_in_sections, plan_sections, stream_sections
+from resilience import Route, call_with_failover, call_with_failover_sync, outcomes
+from token_budget import CallBudget, estimator, record_call
+from hedging import hedged_call, hedged_call_sync
+import metrics
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+if not GEMINI_AVAILABLE:
+    print("Google Gemini not installed. Install with: pip install google-generativeai")
 
 load_dotenv()
 
-# Initialize AI clients
-# Initialize AI clients
-gemini_key = os.getenv("GEMINI_API_KEY")
-openai_key = os.getenv("OPENAI_API_KEY")
+# Ask providers for schema-constrained JSON (Gemini response_schema, OpenAI
+# json_schema) with a compact prompt, instead of describing the format in
+# prose and hoping the free-text reply parses
+QUIZ_STRUCTURED_OUTPUT = os.getenv("QUIZ_STRUCTURED_OUTPUT", "true").lower() == "true"
 
-print("=" * 60)
-print("AI SERVICE INITIALIZATION")
-print("=" * 60)
+# Provider chosen from the configured keys and installed SDKs. The SDKs
+# themselves are imported and configured on first use (or by the registry's
+# background pre-warm), not when this module is imported.
+providers = get_registry()
+gemini_key = providers.gemini_key
+openai_key = providers.openai_key
+AI_PROVIDER = providers.default_provider()
 
-# DEBUG LOGGING TO FILE
-with open("ai_init_log.txt", "w") as f:
-    f.write("Starting initialization...\n")
-    f.write(f"Gemini Key Present: {bool(gemini_key)}\n")
-    if gemini_key:
-        f.write(f"Gemini Key Start: {gemini_key[:5]}...\n")
-
-if GEMINI_AVAILABLE and gemini_key and gemini_key != "your_gemini_key_here":
-    try:
-        # Explicitly configure with transport='rest' to avoid GRPC issues
-        genai.configure(api_key=gemini_key, transport='rest')
-        
-        # Use simple model name
-        gemini_model = genai.GenerativeModel('models/gemini-flash-latest')
-        
-        # Test generation to confirm it works
-        # response = gemini_model.generate_content("hello")
-        
-        AI_PROVIDER = "gemini"
-        print("OK: Using Google Gemini Flash (Latest) for quiz generation")
-        print(f"   API Key: {gemini_key[:10]}...{gemini_key[-4:]}")
-        
-        with open("ai_init_log.txt", "a") as f:
-            f.write("SUCCESS: Gemini initialized!\n")
-            
-    except Exception as e:
-        print(f"ERROR: Gemini initialization failed: {e}")
-        with open("ai_init_log.txt", "a") as f:
-            f.write(f"ERROR: Initialization failed: {e}\n")
-            import traceback
-            traceback.print_exc(file=f)
-            
-        AI_PROVIDER = "fallback"
 
-elif OPENAI_AVAILABLE and openai_key and openai_key not in ["your_openai_api_key_here", "dummy_key_for_testing"]:
+async def generate_quiz_from_content(content: str, num_questions: int, difficulty: str,
+                                     fallback: bool = True,
+                                     progress: Optional[SectionProgress] = None) -> List[Dict[str, Any]]:
+    """
+    Generates quiz questions from provided text content.
+    Long content is split into sections that are generated concurrently and
+    merged, instead of being truncated to the first context window.
+    With fallback=False errors are raised instead of answered with the
+    fallback questions, for callers that report them per quiz. `progress`
+    is passed on to generate_in_sections.
+    """
+    if AI_PROVIDER == "fallback":
+        if not fallback:
+            raise RuntimeError(f"Unsupported AI_PROVIDER: {AI_PROVIDER}")
+        return get_fallback_questions()
 
     try:
-        openai_client = OpenAI(api_key=openai_key)
-        AI_PROVIDER = "openai"
-        print("OK: Using OpenAI for quiz generation")
-        print(f"   API Key: {openai_key[:10]}...{openai_key[-4:]}")
-    except Exception as e:
-        print(f"ERROR: OpenAI initialization failed: {e}")
-        AI_PROVIDER = "fallback"
-else:
-    AI_PROVIDER = "fallback"
-    print("WARNING: No valid AI API key found. Using fallback mode.")
-    print("   Get free Gemini key at: https://aistudio.google.com/app/apikey")
-    if not GEMINI_AVAILABLE:
-        print("   Note: google-generativeai not installed")
-    if gemini_key:
-        print(f"   Gemini key status: {gemini_key[:20]}...")
-
-print("=" * 60)
+        async def generate_section(section: str, count: int) -> List[Dict[str, Any]]:
+            return await generate_questions_async(section, count, difficulty)
 
+        questions = await generate_in_sections(content, num_questions, generate_section, progress=progress)
+        outcomes.real()
+        return questions
 
-async def generate_quiz_from_content(content: str, num_questions: int, difficulty: str) -> List[Dict[str, Any]]:
-    """
-    Generates quiz questions from provided text content
-    """
-    try:
-        # 1. Limit content for context window
-        max_chars = 15000 
-        if len(content) > max_chars:
-            content = content[:max_chars] + "...[truncated]"
-
-        # 2. Generate via LLM
-        return query_llm_for_quiz(content, num_questions, difficulty)
-        
     except Exception as e:
         print(f"Error in quiz generation from content: {e}")
+        if not fallback:
+            raise
         return get_fallback_questions()
 
-def query_llm_for_quiz(content: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
-    
-    prompt = f"""
+def exclusion_note(existing: Sequence[str]) -> str:
+    """Prompt lines listing questions the quiz already has, for follow-up requests"""
+    if not existing:
+        return ""
+    listed = "\n".join(f"    - {question}" for question in existing)
+    return f"""
+    ALREADY ASKED (do not repeat or rephrase these):
+{listed}
+    """
+
+DIFFICULTY_FOCUS = {
+    "Easy": "definitions and facts stated in the content",
+    "Medium": "understanding and applying its concepts",
+    "Hard": "analysis and synthesis across the content",
+}
+
+def build_compact_quiz_prompt(content: str, count: int, difficulty: str, existing: Sequence[str] = ()) -> str:
+    """Quiz prompt for structured-output calls: the response schema carries the format, so no format prose or example"""
+    focus = DIFFICULTY_FOCUS.get(difficulty, difficulty)
+    lines = [
+        f"Generate {count} {difficulty} multiple-choice questions answerable only from the content below, testing {focus}.",
+        'Each question covers a different point and has 4 distinct plausible options; "correct" is the 0-based index of the one right answer.',
+    ]
+    if existing:
+        lines.append("Do not repeat or rephrase: " + " | ".join(existing))
+    lines.append(f"CONTENT:\n{content}")
+    return "\n".join(lines)
+
+def build_quiz_prompt(content: str, count: int, difficulty: str, existing: Sequence[str] = ()) -> str:
+    """Build the quiz generation prompt shared by every provider"""
+    if QUIZ_STRUCTURED_OUTPUT:
+        return build_compact_quiz_prompt(content, count, difficulty, existing)
+    return f"""
     You are an expert quiz generator for technical presentations and educational content.
     
     CONTENT TO ANALYZE:
@@ -129,7 +122,7 @@ def query_llm_for_quiz(content: str, count: int, difficulty: str) -> List[Dict[s
     4. Avoid ambiguous or trick questions
     5. Use clear, professional language
     6. Ensure diversity in question types (what, how, why, which, etc.)
-    
+    {exclusion_note(existing)}
     OUTPUT FORMAT:
     Return ONLY a valid JSON array with NO markdown formatting, NO code blocks, NO explanations.
     Each object must have exactly these fields:
@@ -145,83 +138,230 @@ def query_llm_for_quiz(content: str, count: int, difficulty: str) -> List[Dict[s
     
     Generate {count} questions now:
     """
-    
+
+def quiz_model_name(routes: List[Route]) -> str:
+    """Provider/model label that goes into quiz cache keys: the route the quiz is generated on"""
+    return str(routes[0]) if routes else AI_PROVIDER
+
+def generate_questions(content: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
+    """Generate questions for one piece of content via the cache or the provider; raises on failure"""
+    # The model router picks the model from the request and live model health;
+    # the quiz, its top-ups and its cache entry all belong to that model
+    routes = router.route_quiz(content, count, difficulty).routes
+    cache = get_quiz_cache()
+    cache_key = make_cache_key(content, count, difficulty, quiz_model_name(routes))
+    cached = cache.get(cache_key) if cache else None
+    if cached is not None:
+        return cached
+
+    def generate() -> List[Dict[str, Any]]:
+        # Invalid or missing questions are asked for again, not the whole batch
+        questions = top_up_sync(request_questions(content, count, difficulty, routes=routes), count,
+                                lambda wanted, existing: request_questions(content, wanted, difficulty, existing,
+                                                                           routes))
+        if cache and len(questions) == count:
+            cache.put(cache_key, questions)
+        return questions
+
+    # Identical requests already in flight share that call instead of making another
+    return providers.single_flight.do_sync(("quiz", cache_key), generate)
+
+async def generate_questions_async(content: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
+    """Async variant of generate_questions that keeps the event loop responsive"""
+    routes = router.route_quiz(content, count, difficulty).routes
+    cache = get_quiz_cache()
+    cache_key = make_cache_key(content, count, difficulty, quiz_model_name(routes))
+    # The cache is SQLite-backed (and shared between workers): read and write it off the loop
+    cached = await asyncio.to_thread(cache.get, cache_key) if cache else None
+    if cached is not None:
+        return cached
+
+    async def generate() -> List[Dict[str, Any]]:
+        questions = await top_up(await request_questions_async(content, count, difficulty, routes=routes), count,
+                                 lambda wanted, existing: request_questions_async(content, wanted, difficulty,
+                                                                                  existing, routes))
+        if cache and len(questions) == count:
+            await asyncio.to_thread(cache.put, cache_key, questions)
+        return questions
+
+    return await providers.single_flight.do(("quiz", cache_key), generate)
+
+def budgeted_prompt(content: str, count: int, difficulty: str, existing: Sequence[str], routes: List[Route]) -> str:
+    """The quiz prompt, with content trimmed to fit every route's context window next to its output budget"""
+    with metrics.stage_timer("prompt_build"):
+        overhead = build_quiz_prompt("", count, difficulty, existing)
+        content = estimator.fit_content(content, [route.model for route in routes], count, overhead)
+        return build_quiz_prompt(content, count, difficulty, existing)
+
+def request_questions(content: str, count: int, difficulty: str, existing: Sequence[str] = (),
+                      routes: Optional[List[Route]] = None) -> List[Dict[str, Any]]:
+    """One provider request (with retries, failover and hedging) for `count` new questions,
+    on `routes` or, by default, the ones the model router picks"""
+    if routes is None:
+        routes = router.route_quiz(content, count, difficulty).routes
+    prompt = budgeted_prompt(content, count, difficulty, existing, routes)
+
+    def query(route: Route) -> List[Dict[str, Any]]:
+        budget = estimator.plan(route.model, prompt, count)
+        completion = get_adapter(route.provider).complete(route.model, quiz_request(prompt, count, budget))
+        return parse_completion(route, completion, prompt, budget)
+
+    def attempt(route: Route) -> List[Dict[str, Any]]:
+        # A call stuck in the latency tail is raced against a duplicate
+        return hedged_call_sync(route, routes, query)
+
+    # Retries transient errors, then fails over to the next model/provider
+    questions, _ = call_with_failover_sync(routes, attempt)
+    return questions
+
+async def request_questions_async(content: str, count: int, difficulty: str, existing: Sequence[str] = (),
+                                  routes: Optional[List[Route]] = None) -> List[Dict[str, Any]]:
+    """Async variant of request_questions"""
+    if routes is None:
+        routes = router.route_quiz(content, count, difficulty).routes
+    prompt = budgeted_prompt(content, count, difficulty, existing, routes)
+
+    async def query(route: Route) -> List[Dict[str, Any]]:
+        budget = estimator.plan(route.model, prompt, count)
+        completion = await get_adapter(route.provider).acomplete(route.model, quiz_request(prompt, count, budget))
+        return parse_completion(route, completion, prompt, budget)
+
+    async def attempt(route: Route) -> List[Dict[str, Any]]:
+        return await hedged_call(route, routes, query)
+
+    questions, _ = await call_with_failover(routes, attempt)
+    return questions
+
+def query_llm_for_quiz(content: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
     try:
-        if AI_PROVIDER == "gemini":
-            return query_gemini(prompt)
-        elif AI_PROVIDER == "openai":
-            return query_openai(prompt)
-        else:
-            return get_fallback_questions()
+        questions = generate_questions(content, count, difficulty)
+        outcomes.real()
+        return questions
     except Exception as e:
         print(f"ERROR: AI Generation failed: {e}")
         print("WARNING: Falling back to generic questions!")
         return get_fallback_questions()
 
+async def query_llm_for_quiz_async(content: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
+    """Async variant of query_llm_for_quiz that keeps the event loop responsive"""
+    try:
+        questions = await generate_questions_async(content, count, difficulty)
+        outcomes.real()
+        return questions
+    except Exception as e:
+        print(f"ERROR: AI Generation failed: {e}")
+        print("WARNING: Falling back to generic questions!")
+        return get_fallback_questions()
 
-def query_gemini(prompt: str) -> List[Dict[str, Any]]:
-    """Query Google Gemini for quiz generation"""
+
+async def stream_quiz_from_content(content: str, num_questions: int, difficulty: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield quiz questions one at a time as the model writes them.
+
+    The provider response is streamed through IncrementalQuestionParser, so
+    question 1 reaches the caller while the rest are still being generated.
+    Content longer than one section is generated section by section and each
+    section's questions are yielded as it finishes. A cached quiz is replayed
+    immediately. Provider errors are raised to the caller, which decides
+    whether to fall back.
+    """
+    if AI_PROVIDER == "fallback":
+        raise RuntimeError("No AI provider configured")
+
+    jobs = plan_sections(content, num_questions)
+    if len(jobs) > 1:
+        async def generate_section(section: str, count: int) -> List[Dict[str, Any]]:
+            return await generate_questions_async(section, count, difficulty)
+
+        async for question in stream_sections(jobs, num_questions, generate_section):
+            yield question
+        return
+
+    content = jobs[0][0]
+    decision = router.route_quiz(content, num_questions, difficulty)
+    routes = decision.routes
+    cache = get_quiz_cache()
+    cache_key = make_cache_key(content, num_questions, difficulty, quiz_model_name(routes))
+    cached = await asyncio.to_thread(cache.get, cache_key) if cache else None
+    if cached is not None:
+        for question in cached:
+            yield question
+        return
+
+    route = decision.route
+    prompt = budgeted_prompt(content, num_questions, difficulty, (), [route])
+    budget = estimator.plan(route.model, prompt, num_questions)
+    chunks = get_adapter(route.provider).stream(route.model, quiz_request(prompt, num_questions, budget))
+
+    parser = IncrementalQuestionParser()
+    # Questions go out as they are parsed, so duplicates and any beyond the
+    # count asked for are dropped here rather than after the fact by top_up;
+    # the rest of the reply is still read for its token usage
+    deduper = QuestionDeduper()
+    questions = []
+    usage = None
     try:
-        response = gemini_model.generate_content(prompt)
-        raw_content = response.text.strip()
-        print(f"DEBUG: Raw Content from Gemini: {raw_content[:200]}...")
-
-        
-        # Clean up potential markdown code blocks
-        if raw_content.startswith("```json"):
-            raw_content = raw_content[7:]
-        if raw_content.startswith("```"):
-            if "json" in raw_content[:10]:
-                 raw_content = raw_content[raw_content.find("["):]
-            else:
-                 raw_content = raw_content[3:]
-        if raw_content.endswith("```"):
-            raw_content = raw_content[:raw_content.rfind("]")+1]
-            
-        # Robust JSON extraction
-        start_idx = raw_content.find("[")
-        end_idx = raw_content.rfind("]")
-        if start_idx != -1 and end_idx != -1:
-            raw_content = raw_content[start_idx:end_idx+1]
-
-        return json.loads(raw_content.strip())
-        
+        async for chunk in chunks:
+            usage = chunk["usage"] or usage
+            for question in parser.feed(chunk["text"]):
+                if len(questions) < num_questions and deduper.add(question):
+                    questions.append(question)
+                    yield question
+        usage = usage or {}
+        record_call(route.provider, budget, len(prompt), usage.get("input_tokens"), usage.get("output_tokens"),
+                    len(questions), parser.truncated)
     except Exception as e:
-        print(f"Error querying Gemini: {e}")
-        raise
+        if questions:
+            raise
+        # Nothing sent yet: retry/fail over without streaming rather than give up
+        print(f"Quiz stream failed before the first question ({e}); retrying with failover")
+        for question in await generate_questions_async(content, num_questions, difficulty):
+            yield question
+        return
+
+    if len(questions) < num_questions:
+        # Invalid objects and a cut-off reply leave gaps; ask for just those
+        more = await top_up(questions, num_questions,
+                            lambda wanted, existing: request_questions_async(content, wanted, difficulty,
+                                                                             existing, routes))
+        for question in more:
+            if question not in questions:
+                yield question
+        questions = more
+    if cache and len(questions) == num_questions:
+        await asyncio.to_thread(cache.put, cache_key, questions)
+
+
+OPENAI_SYSTEM_PROMPT = "You are a professional quiz generator that outputs only valid JSON arrays. Never include markdown formatting or explanations."
+OPENAI_STRUCTURED_SYSTEM_PROMPT = "You write multiple-choice quizzes from the user's content."
+QUIZ_TEMPERATURE = 0.7
+
+def quiz_request(prompt: str, count: int, budget: Optional[CallBudget] = None) -> CompletionRequest:
+    """The provider-independent description of one quiz call"""
+    return CompletionRequest(
+        prompt,
+        system=OPENAI_STRUCTURED_SYSTEM_PROMPT if QUIZ_STRUCTURED_OUTPUT else OPENAI_SYSTEM_PROMPT,
+        max_output_tokens=budget.max_output_tokens if budget else None,
+        temperature=QUIZ_TEMPERATURE,
+        task="quiz",
+        structured=QUIZ_STRUCTURED_OUTPUT,
+        questions=count,
+    )
 
-def query_openai(prompt: str) -> List[Dict[str, Any]]:
-    """Query OpenAI for quiz generation"""
+def parse_completion(route: Route, completion: Completion, prompt: str,
+                     budget: Optional[CallBudget]) -> List[Dict[str, Any]]:
+    """Questions from a quiz reply, with the call recorded against its token budget"""
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a professional quiz generator that outputs only valid JSON arrays. Never include markdown formatting or explanations."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        raw_content = response.choices[0].message.content.strip()
-        
-        # Clean up potential markdown code blocks
-        if raw_content.startswith("```json"):
-            raw_content = raw_content[7:]
-        if raw_content.startswith("```"):
-            raw_content = raw_content[3:]
-        if raw_content.endswith("```"):
-            raw_content = raw_content[:-3]
-            
-        return json.loads(raw_content.strip())
-        
+        return parse_and_record(route.provider, completion.text, prompt, budget, completion.usage,
+                                completion.truncated)
     except Exception as e:
-        print(f"Error querying OpenAI: {e}")
+        print(f"Unusable quiz reply from {route}: {e}")
         raise
 
 def get_fallback_questions() -> List[Dict[str, Any]]:
     """Return fallback questions when AI is not available"""
     print("Returning FALLBACK questions for testing.")
+    outcomes.fallback()
     return [
         {
             "q": "What is the primary architectural style of this application?",
@@ -0,0 +1,329 @@
+"""
+Parsing and validation of model quiz output, shared by every provider.
+
+Models return a JSON array of {"q", "options", "correct"} objects, often
+wrapped in markdown fences, preceded by a sentence of chat or cut off by the
+token limit. Rather than slicing the reply down to something json.loads
+accepts, a single-pass scanner (IncrementalQuestionParser) picks out every
+complete top-level object and keeps the ones that validate as questions, so
+one stray sentence or a truncated last object costs only the affected
+question, not the whole generation. The same scanner is fed streamed chunks
+on the streaming path. Question objects nested in a wrapper object (OpenAI's
+structured output has to be {"questions": [...]}) are picked out as they
+close as well, so wrapped replies still stream question by question.
+
+A question is valid with a non-empty "q", exactly 4 distinct non-empty
+options and "correct" an index from 0 to 3. When a reply has fewer valid
+questions than were asked for, top_up() asks the model for just the missing
+ones (telling it which questions it already has) instead of regenerating the
+batch.
+
+GEMINI_QUIZ_SCHEMA and OPENAI_QUIZ_RESPONSE_FORMAT describe the same shape
+for the providers' structured-output modes, which constrain decoding to it.
+"""
+import json
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+from quiz_chunking import QuestionDeduper
+from resilience import outcomes
+from token_budget import CallBudget, record_call
+
+load_dotenv()
+
+# Follow-up requests for questions missing from a reply before settling for fewer
+QUIZ_TOP_UP_ROUNDS = int(os.getenv("QUIZ_TOP_UP_ROUNDS", "2"))
+
+QUESTION_OPTIONS = 4
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+# Gemini response_schema (SDK field names; the REST API accepts them too)
+GEMINI_QUIZ_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "q": {"type": "STRING"},
+            "options": {"type": "ARRAY", "items": {"type": "STRING"},
+                        "min_items": QUESTION_OPTIONS, "max_items": QUESTION_OPTIONS},
+            "correct": {"type": "INTEGER"},
+        },
+        "required": ["q", "options", "correct"],
+    },
+}
+GEMINI_QUIZ_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": GEMINI_QUIZ_SCHEMA}
+
+# OpenAI strict json_schema mode needs an object at the top level
+OPENAI_QUIZ_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "quiz",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "questions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "q": {"type": "string"},
+                            "options": {"type": "array", "items": {"type": "string"}},
+                            "correct": {"type": "integer"},
+                        },
+                        "required": ["q", "options", "correct"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["questions"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+class QuizParseError(ValueError):
+    """A model reply that contained no valid question at all"""
+
+
+def validate_question(obj: Any) -> Optional[Dict[str, Any]]:
+    """The question normalised to {"q", "options", "correct"}, or None when it breaks the schema"""
+    if not isinstance(obj, dict):
+        return None
+    text, options, correct = obj.get("q"), obj.get("options"), obj.get("correct")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if not isinstance(options, list) or len(options) != QUESTION_OPTIONS:
+        return None
+    if not all(isinstance(option, str) and option.strip() for option in options):
+        return None
+    options = [option.strip() for option in options]
+    if len({option.casefold() for option in options}) != QUESTION_OPTIONS:
+        return None
+    if isinstance(correct, str) and correct.strip().isdigit():
+        correct = int(correct)
+    if isinstance(correct, bool) or not isinstance(correct, int) or not 0 <= correct < QUESTION_OPTIONS:
+        return None
+    return {"q": text.strip(), "options": options, "correct": correct}
+
+
+def is_question(obj: Any) -> bool:
+    """True for objects that validate as a quiz question"""
+    return validate_question(obj) is not None
+
+
+def _questions_in(obj: Any) -> List[Dict[str, Any]]:
+    """Valid questions in one decoded top-level object: the object itself, or a list under any key
+    (models in JSON mode like to wrap the array as {"questions": [...]})"""
+    question = validate_question(obj)
+    if question is not None:
+        return [question]
+    if not isinstance(obj, dict):
+        return []
+    found = []
+    for value in obj.values():
+        if isinstance(value, list):
+            found.extend(q for q in map(validate_question, value) if q is not None)
+    return found
+
+
+def _decode(raw: str) -> Any:
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        pass
+    try:
+        # The most common near-miss from models: a trailing comma before } or ]
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", raw))
+    except json.JSONDecodeError:
+        return None
+
+
+class IncrementalQuestionParser:
+    """
+    Single-pass scanner over a growing buffer of model output.
+
+    JSON objects are tracked by brace depth (array brackets, fences and other
+    stray text between objects are skipped). String literals and escapes are
+    followed so braces inside question text do not confuse the depth count.
+    A nested object is decoded when it closes, so questions inside a wrapper
+    are returned as they complete; a top-level object is decoded only when
+    nothing inside it was. Text that has been fully scanned is discarded, so
+    memory stays bounded by the largest top-level object. Objects that do
+    not decode or validate are counted in `rejected`; a nested object that
+    is not a question is only counted once its top-level object closes
+    without being one either, since it may just be an extra field (say
+    "meta") of a valid question.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._nested: List[int] = []
+        self._nested_found = 0
+        self._nested_rejected = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.rejected = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add streamed text and return the questions completed by it"""
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth:
+                    self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                    self._nested_found = 0
+                    self._nested_rejected = 0
+                else:
+                    self._nested.append(i)
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth:
+                    question = validate_question(_decode(buffer[self._nested.pop():i + 1]))
+                    if question is not None:
+                        completed.append(question)
+                        self._nested_found += 1
+                    elif self._depth == 1:
+                        self._nested_rejected += 1
+                else:
+                    if self._nested_found:
+                        self.rejected += self._nested_rejected
+                    else:
+                        questions = _questions_in(_decode(buffer[self._start:i + 1]))
+                        if questions:
+                            completed.extend(questions)
+                        else:
+                            self.rejected += self._nested_rejected or 1
+                    self._start = None
+            i += 1
+
+        # Keep only the unfinished object (if any) for the next feed
+        if self._start is None:
+            self._buffer, self._pos = "", 0
+        else:
+            offset = self._start
+            self._buffer = buffer[offset:]
+            self._pos = len(buffer) - offset
+            self._start = 0
+            self._nested = [start - offset for start in self._nested]
+        return completed
+
+    @property
+    def truncated(self) -> bool:
+        """True when the text fed so far ends inside an unfinished object"""
+        return self._start is not None
+
+
+def parse_questions(raw: str) -> List[Dict[str, Any]]:
+    """Every valid question in a complete model reply; raises QuizParseError when there is none"""
+    parser = IncrementalQuestionParser()
+    questions = parser.feed(raw)
+    if parser.rejected or parser.truncated:
+        print(f"Quiz reply had {parser.rejected} invalid object(s)"
+              f"{' and was cut off' if parser.truncated else ''}; kept {len(questions)} question(s)")
+    if not questions:
+        metrics.quiz_parse("failed")
+        raise QuizParseError(f"No valid questions in model reply: {raw[:200]!r}")
+    metrics.quiz_parse("partial" if parser.rejected or parser.truncated else "ok")
+    return questions
+
+
+def parse_and_record(provider: str, raw_content: str, prompt: str, budget: Optional[CallBudget],
+                     usage: Tuple[Optional[int], Optional[int]], truncated: bool) -> List[Dict[str, Any]]:
+    """parse_questions on a provider reply, recording the call's token usage against its budget
+    (also when the reply does not parse)"""
+    questions: List[Dict[str, Any]] = []
+    try:
+        with metrics.stage_timer("json_parse"):
+            questions = parse_questions(raw_content or "")
+        return questions
+    finally:
+        if budget:
+            if truncated:
+                print(f"{provider}:{budget.model} hit its {budget.max_output_tokens}-token output budget")
+            record_call(provider, budget, len(prompt), *usage, len(questions), truncated)
+
+
+def _add_new(questions: List[Dict[str, Any]], more: List[Dict[str, Any]], deduper: QuestionDeduper, count: int):
+    for question in more:
+        if len(questions) >= count:
+            return
+        if deduper.add(question):
+            questions.append(question)
+
+
+def _start(questions: List[Dict[str, Any]], count: int):
+    deduper = QuestionDeduper()
+    kept: List[Dict[str, Any]] = []
+    _add_new(kept, questions, deduper, count)
+    return kept, deduper
+
+
+RequestMore = Callable[[int, Sequence[str]], List[Dict[str, Any]]]
+RequestMoreAsync = Callable[[int, Sequence[str]], Awaitable[List[Dict[str, Any]]]]
+
+
+def top_up_sync(questions: List[Dict[str, Any]], count: int, request_more: RequestMore,
+                rounds: int = QUIZ_TOP_UP_ROUNDS) -> List[Dict[str, Any]]:
+    """
+    Fill `questions` up to `count` with request_more(missing, existing
+    question texts). Gives up after `rounds` follow-ups or the first failed
+    one and returns what it has.
+    """
+    questions, deduper = _start(questions, count)
+    for _ in range(rounds):
+        missing = count - len(questions)
+        if missing <= 0:
+            break
+        print(f"Got {len(questions)}/{count} valid questions; requesting the {missing} missing")
+        outcomes.topped_up()
+        try:
+            more = request_more(missing, [question["q"] for question in questions])
+        except Exception as e:
+            print(f"Requesting missing questions failed: {e}")
+            break
+        _add_new(questions, more, deduper, count)
+    return questions
+
+
+async def top_up(questions: List[Dict[str, Any]], count: int, request_more: RequestMoreAsync,
+                 rounds: int = QUIZ_TOP_UP_ROUNDS) -> List[Dict[str, Any]]:
+    """Async counterpart of top_up_sync"""
+    questions, deduper = _start(questions, count)
+    for _ in range(rounds):
+        missing = count - len(questions)
+        if missing <= 0:
+            break
+        print(f"Got {len(questions)}/{count} valid questions; requesting the {missing} missing")
+        outcomes.topped_up()
+        try:
+            more = await request_more(missing, [question["q"] for question in questions])
+        except Exception as e:
+            print(f"Requesting missing questions failed: {e}")
+            break
+        _add_new(questions, more, deduper, count)
+    return questions
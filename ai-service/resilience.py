@@ -0,0 +1,207 @@
+"""
+Retry, backoff and provider failover for quiz generation.
+
+A quiz request walks an ordered list of routes (provider + model): the primary
+Gemini quiz model, an alternate Gemini model, then OpenAI, keeping only the
+providers that are configured. Transient failures (429, 5xx, timeouts,
+dropped connections) are retried on the same route with full-jitter
+exponential backoff, honouring Retry-After when the provider sends one;
+anything else, or a route that keeps failing, moves on to the next route.
+Everything happens under one overall deadline, so a request never spends
+longer than LLM_RETRY_DEADLINE_SECONDS before the caller falls back to the
+canned questions.
+
+QuizOutcomes counts how many quiz requests ended with real model questions
+versus fallback questions, which is the success rate reported on /status.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+import metrics
+from admission import AdmissionRejected
+
+load_dotenv()
+
+LLM_RETRY_DEADLINE_SECONDS = float(os.getenv("LLM_RETRY_DEADLINE_SECONDS", "45"))
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = ("Timeout", "ConnectError", "ConnectionError", "RemoteProtocolError",
+                    "ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    model: str
+
+    def __str__(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an SDK/HTTP exception, if any"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for failures worth retrying on the same route (rate limits, overload, network)"""
+    if isinstance(error, AdmissionRejected):
+        # Local saturation; another provider may have capacity
+        return False
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in type(error).__name__ for name in _RETRYABLE_NAMES)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if present"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, error: BaseException) -> float:
+    """Full-jitter exponential backoff, stretched to Retry-After when the provider asks for more"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    hinted = retry_after(error)
+    return max(delay, hinted) if hinted is not None else delay
+
+
+class QuizOutcomes:
+    """How many quiz requests got real questions versus canned fallback questions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"real": 0, "fallback": 0, "retries": 0, "failovers": 0, "top_ups": 0}
+
+    def _add(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+        metrics.quiz_event(counter)
+
+    def retried(self):
+        self._add("retries")
+
+    def failed_over(self):
+        self._add("failovers")
+
+    def topped_up(self):
+        self._add("top_ups")
+
+    def real(self):
+        self._add("real")
+
+    def fallback(self):
+        self._add("fallback")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        total = counters["real"] + counters["fallback"]
+        return {**counters, "requests": total,
+                "success_rate": round(counters["real"] / total, 4) if total else None}
+
+
+outcomes = QuizOutcomes()
+
+
+class _Deadline:
+    """Shared bookkeeping for the sync and async failover loops"""
+
+    def __init__(self, routes: List[Route], deadline_seconds: float):
+        if not routes:
+            raise RuntimeError("No AI provider configured")
+        self.deadline = time.monotonic() + deadline_seconds
+        self.last_error: Optional[BaseException] = None
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def failing_over(self, route: Route):
+        outcomes.failed_over()
+        print(f"Failing over to {route} after: {self.last_error}")
+
+    def retry_delay(self, route: Route, attempt: int, error: BaseException) -> Optional[float]:
+        """Backoff before retrying this route, or None to move on to the next one"""
+        self.last_error = error
+        if not is_retryable(error) or attempt + 1 >= LLM_RETRY_ATTEMPTS:
+            return None
+        delay = backoff_delay(attempt, error)
+        if delay >= self.remaining():
+            return None
+        outcomes.retried()
+        print(f"{route} failed ({error}); retrying in {delay:.2f}s")
+        return delay
+
+    def exhausted(self) -> BaseException:
+        return self.last_error or TimeoutError("Retry deadline passed before any attempt")
+
+
+async def call_with_failover(routes: List[Route], call: Callable[[Route], Awaitable[T]],
+                             deadline_seconds: float = LLM_RETRY_DEADLINE_SECONDS) -> Tuple[T, Route]:
+    """
+    Await call(route) along the failover routes and return (result, route
+    that produced it); raise the last error if nothing succeeds in time.
+    """
+    deadline = _Deadline(routes, deadline_seconds)
+    for index, route in enumerate(routes):
+        if index:
+            deadline.failing_over(route)
+        for attempt in range(LLM_RETRY_ATTEMPTS):
+            if deadline.remaining() <= 0:
+                raise deadline.exhausted()
+            try:
+                return await asyncio.wait_for(call(route), deadline.remaining()), route
+            except Exception as e:
+                delay = deadline.retry_delay(route, attempt, e)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+    raise deadline.exhausted()
+
+
+def call_with_failover_sync(routes: List[Route], call: Callable[[Route], T],
+                            deadline_seconds: float = LLM_RETRY_DEADLINE_SECONDS) -> Tuple[T, Route]:
+    """
+    Blocking counterpart of call_with_failover. A single blocking attempt
+    cannot be interrupted, so the deadline is checked between attempts.
+    """
+    deadline = _Deadline(routes, deadline_seconds)
+    for index, route in enumerate(routes):
+        if index:
+            deadline.failing_over(route)
+        for attempt in range(LLM_RETRY_ATTEMPTS):
+            if deadline.remaining() <= 0:
+                raise deadline.exhausted()
+            try:
+                return call(route), route
+            except Exception as e:
+                delay = deadline.retry_delay(route, attempt, e)
+                if delay is None:
+                    break
+                time.sleep(delay)
+    raise deadline.exhausted()
@@ -0,0 +1,104 @@
+"""
+Production launcher for the AI service.
+
+Runs uvicorn with one worker process per CPU this container may actually
+use (CPU affinity and the cgroup CPU quota, not the host's core count),
+capped at WEB_MAX_WORKERS; WEB_CONCURRENCY overrides the count. Before the
+workers start it exports SERVICE_WORKERS, which switches the caches, rate
+limits and job queue to their SQLite-backed shared mode (see shared_state),
+and sets up PROMETHEUS_MULTIPROC_DIR so /metrics covers every worker.
+
+    python serve.py              # production: N workers, no reload
+    python serve.py --reload     # development: one process, reload on change
+"""
+import argparse
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WEB_MAX_WORKERS = int(os.getenv("WEB_MAX_WORKERS", "8"))
+PROMETHEUS_DIR = Path(__file__).parent / "cache" / "prometheus"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("serve")
+
+
+def cgroup_cpu_limit() -> float:
+    """CPUs allowed by the cgroup quota (v2 cpu.max, else v1 cfs), or 0 when unlimited or unknown"""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return 0.0 if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return quota / period if quota > 0 else 0.0
+    except (OSError, ValueError):
+        return 0.0
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit:
+        cpus = min(cpus, max(1, round(limit)))
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    return max(1, min(available_cpus(), WEB_MAX_WORKERS))
+
+
+def prepare_prometheus_dir() -> str:
+    """An empty multiprocess metrics directory; samples from a previous run would be added to this one's"""
+    directory = Path(os.getenv("PROMETHEUS_MULTIPROC_DIR") or PROMETHEUS_DIR)
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True, exist_ok=True)
+    return str(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reload", action="store_true", default=os.getenv("UVICORN_RELOAD", "false") == "true",
+                        help="development mode: a single process that restarts on code changes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    workers = 1 if args.reload else worker_count()
+    # Read by the workers at import time, so it has to be set before they start
+    os.environ["SERVICE_WORKERS"] = str(workers)
+    if workers > 1:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = prepare_prometheus_dir()
+
+    logger.info(f"Starting TechNexus Arena Service on port {args.port} with "
+                f"{'reload' if args.reload else f'{workers} worker(s)'} ({available_cpus()} CPU(s) available)")
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=None if args.reload else workers,
+        reload=args.reload,
+        log_level="info",
+        # Render terminates TLS at its proxy
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        timeout_graceful_shutdown=30,
+    )
+
+
+if __name__ == "__main__":
+    main()
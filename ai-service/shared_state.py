@@ -0,0 +1,43 @@
+"""
+State shared between the service's worker processes.
+
+In production the service runs as several uvicorn worker processes (see
+serve.py), each with its own memory. Anything that must hold across them
+lives in SQLite files opened through connect(): WAL journaling so readers
+never block the single writer, and a busy timeout so a writer waits for
+another process's transaction instead of failing. That covers the quiz and
+text caches, the shared tier of the chat cache, the provider rate-limit
+buckets and the job queue.
+
+Per-process limits that are configured as service-wide totals
+(LLM_MAX_IN_FLIGHT, EXTRACT_WORKERS) are divided between the workers with
+per_worker(), using the SERVICE_WORKERS count serve.py exports.
+"""
+import math
+import os
+import sqlite3
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Worker processes serving this instance (set by serve.py)
+SERVICE_WORKERS = max(1, int(os.getenv("SERVICE_WORKERS", "1")))
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", str(Path(__file__).parent / "cache" / "shared_state.sqlite3"))
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "5"))
+
+
+def connect(path: str, **kwargs) -> sqlite3.Connection:
+    """SQLite connection safe to share between threads and processes (WAL, busy timeout)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, **kwargs)
+    db.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL only risks the last transactions on power loss, not corruption
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def per_worker(total: int) -> int:
+    """This process's share of a limit configured for the whole service"""
+    return max(1, math.ceil(total / SERVICE_WORKERS))
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue, JobStore, job_key
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def create(store: JobStore, key: str):
+    return store.create(key, "notes.pdf", "/tmp/notes.pdf", 10, "Medium")
+
+
+def test_job_key_ignores_difficulty_case_and_spacing():
+    assert job_key("digest", 10, "Medium") == job_key("digest", 10, " medium ")
+    assert job_key("digest", 10, "Medium") != job_key("digest", 5, "Medium")
+
+
+def test_identical_submission_reuses_queued_running_and_done_jobs(db_path):
+    store = JobStore(db_path)
+    job, created = create(store, "k")
+    assert created
+    for state in ("queued", "running", "done"):
+        store.update(job["id"], state=state)
+        reused, created = create(store, "k")
+        assert not created
+        assert reused["id"] == job["id"]
+
+
+@pytest.mark.parametrize("state", ["failed", "cancelled"])
+def test_finished_without_a_result_is_not_reused(db_path, state):
+    store = JobStore(db_path)
+    job, _ = create(store, "k")
+    store.update(job["id"], state=state)
+    again, created = create(store, "k")
+    assert created
+    assert again["id"] != job["id"]
+
+
+def test_done_with_fallback_questions_is_not_reused(db_path):
+    store = JobStore(db_path)
+    job, _ = create(store, "k")
+    store.update(job["id"], state="done", result={"questions": []}, error="provider unavailable")
+    assert store.find_reusable("k") is None
+    again, created = create(store, "k")
+    assert created
+    assert store.find_reusable("k")["id"] == again["id"]
+
+
+def test_concurrent_identical_submissions_make_one_job(db_path):
+    # One store per thread, like separate worker processes sharing the file
+    stores = [JobStore(db_path) for _ in range(8)]
+    barrier = threading.Barrier(len(stores))
+    results = []
+
+    def submit(store: JobStore):
+        barrier.wait()
+        results.append(create(store, "k"))
+
+    threads = [threading.Thread(target=submit, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(created for _, created in results) == 1
+    assert len({job["id"] for job, _ in results}) == 1
+    assert stores[0].counts().get("queued") == 1
+
+
+def test_cancelling_a_running_job_returns_it_cancelled(db_path, tmp_path, monkeypatch):
+    async def execute(self, job_id):
+        self.started.set()
+        await asyncio.sleep(3600)
+
+    record_finish = JobQueue._record_finish
+
+    def slow_record_finish(self, *args):
+        # The worker records the outcome on a thread; make it lose any race with cancel()'s re-read
+        time.sleep(0.2)
+        record_finish(self, *args)
+
+    monkeypatch.setattr(JobQueue, "_execute", execute)
+    monkeypatch.setattr(JobQueue, "_record_finish", slow_record_finish)
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), str(tmp_path / "inputs"), workers=1)
+        queue.started = asyncio.Event()
+        await queue.start()
+        try:
+            job, _ = await queue.submit_text("Some notes about photosynthesis.", 5, "Easy")
+            await asyncio.wait_for(queue.started.wait(), 5)
+            return await queue.cancel(job["id"])
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(run())
+    assert job["state"] == "cancelled"
+    assert job["error"] == "Cancelled"
@@ -0,0 +1,75 @@
+import pytest
+
+import metrics
+import model_router
+from latency_stats import get_outcomes
+from model_router import MODEL_ROUTER_MIN_SAMPLES, ModelProfile, ModelRouter
+
+CONTENT = "Photosynthesis converts light energy into chemical energy. " * 20
+
+
+class Registry:
+    def __init__(self, *providers: str):
+        self.providers = list(providers)
+
+    def enabled_providers(self):
+        return self.providers
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    def configure(*providers: str):
+        monkeypatch.setattr(model_router, "get_registry", lambda: Registry(*providers))
+    return configure
+
+
+def routes(decision):
+    return [str(route) for route in decision.routes]
+
+
+@pytest.mark.parametrize("difficulty", ["Easy", "Medium", "Hard"])
+def test_default_provider_comes_first_under_auto(enabled, difficulty):
+    # gemini, then openai: the registry order when LLM_PROVIDER=auto
+    enabled("gemini", "openai")
+    decision = ModelRouter(enabled=True).route_quiz(CONTENT, 5, difficulty)
+    assert decision.route.provider == "gemini"
+    assert {route.provider for route in decision.routes} == {"gemini", "openai"}
+
+
+def test_configured_provider_comes_first(enabled):
+    enabled("openai", "gemini")
+    decision = ModelRouter(enabled=True).route_quiz(CONTENT, 5, "Medium")
+    assert str(decision.route) == "openai:gpt-4o-mini"
+
+
+def test_cheapest_capable_model_then_stronger_then_weaker(enabled):
+    enabled("gemini")
+    catalog = [
+        ModelProfile("gemini", "order-small", 1, 0.01, 0.01),
+        ModelProfile("gemini", "order-big", 3, 2.0, 8.0),
+        ModelProfile("gemini", "order-mid", 2, 0.5, 1.0),
+    ]
+    decision = ModelRouter(catalog, enabled=True).route_quiz(CONTENT, 5, "Medium")
+    assert routes(decision) == ["gemini:order-mid", "gemini:order-big", "gemini:order-small"]
+    assert decision.reason == "within_slo"
+
+
+def test_failing_model_moves_behind_the_other_provider(enabled):
+    enabled("gemini", "openai")
+    catalog = [
+        ModelProfile("gemini", "errors-primary", 2, 0.5, 1.0),
+        ModelProfile("openai", "errors-backup", 2, 1.0, 2.0),
+    ]
+    outcomes = get_outcomes(metrics.model_window_name("gemini", "errors-primary"))
+    for _ in range(MODEL_ROUTER_MIN_SAMPLES):
+        outcomes.observe(False)
+    decision = ModelRouter(catalog, enabled=True).route_quiz(CONTENT, 5, "Medium")
+    assert routes(decision) == ["openai:errors-backup", "gemini:errors-primary"]
+    assert decision.report["candidates"][0]["status"] == "errors"
+
+
+def test_large_hard_quiz_goes_to_a_current_strong_model(enabled):
+    enabled("gemini", "openai")
+    decision = ModelRouter(enabled=True).route_quiz(CONTENT, 30, "Hard")
+    assert decision.report["required_tier"] == 3
+    assert str(decision.route) == "gemini:gemini-2.5-pro"
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from quiz_parser import IncrementalQuestionParser, QuizParseError, parse_questions, validate_question
+
+
+def question(n: int, **extra):
+    return {"q": f"Question {n}?", "options": ["a", "b", "c", "d"], "correct": n % 4, **extra}
+
+
+def test_validate_question_normalises():
+    assert validate_question({"q": " Why? ", "options": [" a", "b ", "c", "d"], "correct": "2"}) == {
+        "q": "Why?", "options": ["a", "b", "c", "d"], "correct": 2}
+
+
+@pytest.mark.parametrize("obj", [
+    {"q": "", "options": ["a", "b", "c", "d"], "correct": 0},
+    {"q": "Why?", "options": ["a", "b", "c"], "correct": 0},
+    {"q": "Why?", "options": ["a", "A", "c", "d"], "correct": 0},
+    {"q": "Why?", "options": ["a", "b", "c", "d"], "correct": 4},
+    {"q": "Why?", "options": ["a", "b", "c", "d"], "correct": True},
+    ["not", "an", "object"],
+])
+def test_validate_question_rejects(obj):
+    assert validate_question(obj) is None
+
+
+def test_parses_fenced_reply_with_chatter_and_trailing_comma():
+    second = json.dumps(question(2))[:-1] + ",}"
+    raw = "Sure! Here is your quiz:\n```json\n[" + json.dumps(question(1)) + ",\n" + second + "]\n```"
+    assert parse_questions(raw) == [question(1), question(2)]
+
+
+def test_truncated_last_object_costs_only_that_question():
+    parser = IncrementalQuestionParser()
+    raw = "[" + json.dumps(question(1)) + ", " + json.dumps(question(2))[:30]
+    assert parser.feed(raw) == [question(1)]
+    assert parser.truncated
+    assert parser.rejected == 0
+
+
+def test_streamed_chunks_yield_questions_as_they_close():
+    raw = json.dumps({"questions": [question(1), question(2), question(3)]})
+    parser = IncrementalQuestionParser()
+    found = []
+    for i in range(0, len(raw), 7):
+        found.extend(parser.feed(raw[i:i + 7]))
+    assert found == [question(1), question(2), question(3)]
+    assert parser.rejected == 0
+    assert not parser.truncated
+
+
+def test_braces_inside_strings_do_not_confuse_the_scanner():
+    tricky = {"q": "What does {x} } mean?", "options": ["{", "}", "\"{\"", "none"], "correct": 3}
+    assert IncrementalQuestionParser().feed(json.dumps([tricky])) == [tricky]
+
+
+def test_extra_nested_field_of_a_valid_question_is_not_rejected():
+    parser = IncrementalQuestionParser()
+    assert parser.feed(json.dumps([question(1, meta={"source": "page 2"})])) == [question(1)]
+    assert parser.rejected == 0
+
+
+def test_invalid_objects_are_counted():
+    parser = IncrementalQuestionParser()
+    raw = json.dumps([question(1), {"q": "Broken", "options": []}, {"note": {"deep": 1}}])
+    assert parser.feed(raw) == [question(1)]
+    assert parser.rejected == 2
+
+
+def test_reply_without_questions_raises():
+    with pytest.raises(QuizParseError):
+        parse_questions("I could not generate a quiz from this content.")
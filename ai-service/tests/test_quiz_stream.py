@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+import quiz_generator
+from model_router import RouteDecision
+from resilience import Route
+
+
+def question(text: str, correct: int = 0):
+    return {"q": text, "options": ["a", "b", "c", "d"], "correct": correct}
+
+
+class Adapter:
+    def __init__(self, reply: str):
+        self.reply = reply
+
+    async def stream(self, model, request):
+        for i in range(0, len(self.reply), 20):
+            yield {"text": self.reply[i:i + 20], "usage": None}
+
+
+def stream(monkeypatch, reply: str, num_questions: int):
+    monkeypatch.setattr(quiz_generator, "AI_PROVIDER", "local")
+    monkeypatch.setattr(quiz_generator, "get_quiz_cache", lambda: None)
+    monkeypatch.setattr(quiz_generator.router, "route_quiz",
+                        lambda *args: RouteDecision("quiz", [Route("local", "stream-test")], "test", {}))
+    monkeypatch.setattr(quiz_generator, "get_adapter", lambda provider: Adapter(reply))
+
+    async def collect():
+        return [q async for q in quiz_generator.stream_quiz_from_content("Short notes.", num_questions, "Easy")]
+    return asyncio.run(collect())
+
+
+def test_stream_stops_at_the_requested_count(monkeypatch):
+    reply = json.dumps([question(f"Which planet is number {n} from the sun?") for n in range(1, 6)])
+    streamed = stream(monkeypatch, reply, 3)
+    assert [q["q"] for q in streamed] == [f"Which planet is number {n} from the sun?" for n in range(1, 4)]
+
+
+def test_stream_drops_near_duplicates_before_sending(monkeypatch):
+    reply = json.dumps([
+        question("What gas do plants absorb from the air?"),
+        question("What gas do plants absorb from the air ?", 1),
+        question("Where does photosynthesis take place?"),
+    ])
+    streamed = stream(monkeypatch, reply, 2)
+    assert [q["q"] for q in streamed] == ["What gas do plants absorb from the air?",
+                                          "Where does photosynthesis take place?"]
@@ -0,0 +1,197 @@
+"""
+Digest-keyed cache of text extracted from uploaded documents.
+
+Keys are the SHA-256 of the uploaded file bytes, computed while the upload
+streams in (UploadBuffer.digest), so a repeat upload of the same deck is
+answered without parsing a single page. Text is stored as zlib-compressed blob
+files under TEXT_CACHE_DIR with a small SQLite index, and the least recently
+used blobs are evicted once their total compressed size passes
+TEXT_CACHE_MAX_BYTES.
+
+Extraction may stop early once a quiz has enough text (text_budget), so each
+entry records whether it holds the whole document; a partial entry only
+answers requests whose budget it already covers.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+from shared_state import connect
+from text_extraction import Source, extract_text_async
+
+load_dotenv()
+
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", str(Path(__file__).parent / "cache" / "text"))
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TEXT_CACHE_COMPRESSION_LEVEL = int(os.getenv("TEXT_CACHE_COMPRESSION_LEVEL", "6"))
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file on disk, for callers that did not stream it in themselves"""
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+class TextCache:
+    """Compressed blob store of extracted document text, LRU-evicted by total bytes"""
+
+    def __init__(self, directory: str = TEXT_CACHE_DIR, max_bytes: int = TEXT_CACHE_MAX_BYTES,
+                 level: int = TEXT_CACHE_COMPRESSION_LEVEL):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.level = level
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._source_bytes_saved = 0
+        self._parse_seconds_saved = 0.0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._db = connect(str(self.directory / "index.sqlite3"))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS text_cache ("
+            " digest TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " text_chars INTEGER NOT NULL,"
+            " complete INTEGER NOT NULL,"
+            " source_bytes INTEGER NOT NULL,"
+            " parse_seconds REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS text_cache_last_access ON text_cache (last_access)")
+        self._db.commit()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / f"{digest}.z"
+
+    def get(self, digest: str, max_chars: Optional[int] = None) -> Optional[str]:
+        """Cached text for this file if it covers `max_chars` (or the whole document), else None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text_chars, complete, source_bytes, parse_seconds FROM text_cache WHERE digest = ?",
+                (digest,),
+            ).fetchone()
+            covered = row is not None and (row[1] or (max_chars is not None and row[0] >= max_chars))
+            if covered:
+                try:
+                    blob = self._blob_path(digest).read_bytes()
+                except OSError:
+                    self._db.execute("DELETE FROM text_cache WHERE digest = ?", (digest,))
+                    self._db.commit()
+                    covered = False
+            if not covered:
+                self._counters["misses"] += 1
+                metrics.cache_lookup("text", "miss")
+                return None
+            self._db.execute("UPDATE text_cache SET last_access = ? WHERE digest = ?", (time.time(), digest))
+            self._db.commit()
+            self._counters["hits"] += 1
+            metrics.cache_lookup("text", "hit")
+            self._source_bytes_saved += row[2]
+            self._parse_seconds_saved += row[3]
+        return zlib.decompress(blob).decode("utf-8")
+
+    def put(self, digest: str, text: str, complete: bool, source_bytes: int, parse_seconds: float):
+        blob = zlib.compress(text.encode("utf-8"), self.level)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            path = self._blob_path(digest)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO text_cache"
+                " (digest, size, text_chars, complete, source_bytes, parse_seconds, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, len(blob), len(text), int(complete), source_bytes, parse_seconds, time.time()),
+            )
+            self._evict()
+            self._db.commit()
+            self._counters["stores"] += 1
+
+    def _evict(self):
+        # Caller holds self._lock. Drop least recently used blobs until the
+        # store fits in max_bytes.
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM text_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in self._db.execute("SELECT digest, size FROM text_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM text_cache WHERE digest = ?", (digest,))
+            self._blob_path(digest).unlink(missing_ok=True)
+            total -= size
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            for (digest,) in self._db.execute("SELECT digest FROM text_cache").fetchall():
+                self._blob_path(digest).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM text_cache")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, stored_bytes, text_chars = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(text_chars), 0) FROM text_cache"
+            ).fetchone()
+            counters = dict(self._counters)
+            source_bytes_saved = self._source_bytes_saved
+            parse_seconds_saved = self._parse_seconds_saved
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "stored_bytes": stored_bytes,
+            "text_chars": text_chars,
+            "max_bytes": self.max_bytes,
+            # Document bytes whose parsing was skipped, and the parse time that took
+            "source_bytes_saved": source_bytes_saved,
+            "parse_seconds_saved": round(parse_seconds_saved, 3),
+        }
+
+
+_text_cache: Optional[TextCache] = None
+_text_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """Return the process-wide text cache, or None when TEXT_CACHE_ENABLED=false"""
+    global _text_cache
+    if not TEXT_CACHE_ENABLED:
+        return None
+    if _text_cache is None:
+        with _text_cache_lock:
+            if _text_cache is None:
+                _text_cache = TextCache()
+    return _text_cache
+
+
+async def extract_text_cached(source: Source, digest: str, source_bytes: int,
+                              max_chars: Optional[int] = None, filename: Optional[str] = None) -> str:
+    """extract_text_async(), answered from the text cache when this file was parsed before"""
+    cache = get_text_cache()
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, digest, max_chars)
+        if cached is not None:
+            print(f"Extracted text cache hit for {filename or source}")
+            return cached
+
+    started = time.perf_counter()
+    text = await extract_text_async(source, max_chars, filename)
+    if cache is not None:
+        # Extraction only stops once the budget is reached (counting one
+        # separator per page), so shorter text is the whole document
+        complete = max_chars is None or len(text) + 1 < max_chars
+        await asyncio.to_thread(cache.put, digest, text, complete, source_bytes, time.perf_counter() - started)
+    return text
@@ -0,0 +1,184 @@
+"""
+Parallel, streaming text extraction for uploaded PDF and PPTX files.
+
+PDF pages are parsed in a process pool (text extraction in pypdf is pure
+Python and CPU bound, so threads would serialize on the GIL). Pages are
+submitted in small batches with a bounded look-ahead and yielded in page
+order as soon as they are ready, so a caller that has gathered enough text can
+stop iterating and the remaining batches are cancelled instead of parsed.
+
+PPTX decks are a single zip archive that python-pptx has to load as a whole,
+so slides are walked serially; they are still streamed and honour the same
+early stop. Both paths are blocking and are meant to run off the event loop
+via extract_text_async().
+
+A source is either a file path or a binary stream (e.g. an in-memory upload).
+Paths are memory-mapped rather than opened by name, because pypdf reads a
+named file into a private copy; with mmap every worker shares the page cache.
+Only path sources can be fanned out to the process pool.
+"""
+import asyncio
+import mmap
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+from pptx import Presentation
+from pypdf import PdfReader
+
+import metrics
+from shared_state import per_worker
+
+load_dotenv()
+
+# Worker processes for PDF page parsing (1 parses in the calling thread),
+# shared out between the service's worker processes
+EXTRACT_WORKERS = per_worker(int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1))))
+# Pages handed to a worker per task; larger batches amortize IPC, smaller
+# ones let early stop kick in sooner
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "8"))
+# Documents with fewer pages than this are parsed in-process; the pool's IPC
+# costs more than it saves on short files
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "24"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+Source = Union[str, BinaryIO]
+
+# Per-worker-process reader, reused across batches of the same file
+_worker_reader: Optional[Tuple[str, float, PdfReader]] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Process-wide extraction pool, created on first parallel extraction"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the service process runs event loop and
+                # HTTP client threads that must not be duplicated mid-flight
+                _pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def map_file(path: str) -> mmap.mmap:
+    """Read-only memory map of a file (the mapping stays valid after the fd is closed)"""
+    with open(path, "rb") as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_pdf(source: Source) -> PdfReader:
+    return PdfReader(map_file(source) if isinstance(source, str) else source)
+
+
+def _page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        # One malformed page should not cost the whole document
+        print(f"Skipping unreadable PDF page: {e}")
+        return ""
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Worker task: text of pages [start, stop) of the PDF at `path`"""
+    global _worker_reader
+    mtime = os.path.getmtime(path)
+    if _worker_reader is None or _worker_reader[:2] != (path, mtime):
+        _worker_reader = (path, mtime, open_pdf(path))
+    reader = _worker_reader[2]
+    return [_page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def iter_pdf_pages(source: Source, workers: int = EXTRACT_WORKERS,
+                   pages_per_task: int = EXTRACT_PAGES_PER_TASK) -> Iterator[str]:
+    """Yield the text of each PDF page in order, parsing batches in parallel for path sources"""
+    reader = open_pdf(source)
+    page_count = len(reader.pages)
+    if workers <= 1 or page_count < EXTRACT_PARALLEL_MIN_PAGES or not isinstance(source, str):
+        for page in reader.pages:
+            yield _page_text(page)
+        return
+    del reader
+    path = source
+
+    pool = _get_pool()
+    batches = iter(range(0, page_count, pages_per_task))
+    # Keep every worker busy plus one batch queued each, but no further ahead,
+    # so stopping early leaves little wasted work behind
+    window: Deque[Future] = deque()
+    try:
+        for start in batches:
+            window.append(pool.submit(_extract_pdf_pages, path, start, min(start + pages_per_task, page_count)))
+            if len(window) >= workers * 2:
+                break
+        while window:
+            texts = window.popleft().result()
+            start = next(batches, None)
+            if start is not None:
+                window.append(pool.submit(_extract_pdf_pages, path, start, min(start + pages_per_task, page_count)))
+            yield from texts
+    finally:
+        for future in window:
+            future.cancel()
+
+
+def iter_pptx_slides(source: Source) -> Iterator[str]:
+    """Yield the text of each slide in order"""
+    # zipfile needs a real file object (mmap is not seekable() for it); it
+    # reads members on demand, so the path is opened directly
+    for slide in Presentation(source).slides:
+        yield "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text"))
+
+
+def iter_document_pages(source: Source, filename: Optional[str] = None) -> Iterator[str]:
+    """Page (PDF) or slide (PPTX) texts of a document; the type comes from `filename` or the path"""
+    name = (filename or (source if isinstance(source, str) else "")).lower()
+    if name.endswith(".pptx"):
+        return iter_pptx_slides(source)
+    if name.endswith(".pdf"):
+        return iter_pdf_pages(source)
+    raise ValueError("Unsupported file format")
+
+
+def extract_text(source: Source, max_chars: Optional[int] = None, filename: Optional[str] = None) -> str:
+    """
+    Text of the whole document, or of its leading pages once `max_chars`
+    characters have been gathered (the remaining pages are never parsed).
+    """
+    parts: List[str] = []
+    total = 0
+    with metrics.stage_timer("extraction"):
+        pages = iter_document_pages(source, filename)
+        try:
+            for text in pages:
+                parts.append(text)
+                total += len(text) + 1
+                if max_chars is not None and total >= max_chars:
+                    print(f"Stopped extraction after {len(parts)} pages ({total} characters)")
+                    break
+        finally:
+            pages.close()
+        return "\n".join(parts)
+
+
+async def extract_text_async(source: Source, max_chars: Optional[int] = None,
+                             filename: Optional[str] = None) -> str:
+    """extract_text() on a worker thread, keeping the event loop free"""
+    return await asyncio.to_thread(extract_text, source, max_chars, filename)
@@ -0,0 +1,308 @@
+"""
+Token budgeting and accounting for quiz calls.
+
+Output: a quiz call is allowed count x (observed output tokens per question)
+x QUIZ_OUTPUT_MARGIN plus a little overhead, capped at the model's output
+limit, instead of a fixed max_tokens that truncates large quizzes mid-JSON
+and overpays for small ones. Tokens per question start at
+QUIZ_TOKENS_PER_QUESTION and follow the usage each model actually reports
+(a moving average), so the budget tracks the model and prompt in use.
+Thinking models (THINKING_MODELS) spend hidden reasoning tokens out of the
+same max_output_tokens before writing the answer. Those are not in the
+output token count the calibration sees, so these models get a fixed
+QUIZ_THINKING_TOKENS on top; without it the budget can run out before any
+answer is written and the reply comes back empty.
+
+Input: the content is trimmed (at a paragraph or sentence boundary where
+possible) so prompt + output budget fit the smallest context window among
+the routes a call may fail over to. Tokens are counted with tiktoken for
+OpenAI models when it is installed; otherwise characters are divided by a
+characters-per-token ratio calibrated from the prompt token counts the
+provider reports for each model.
+
+Accounting: every quiz call produces a CallRecord (estimated and actual
+tokens, budget, questions asked and returned, whether output was cut off).
+A TokenLedger opened around an HTTP request with token_ledger() collects
+the records of the calls made on its behalf; its summary goes into the
+response and the most recent ones are kept for /status. Calls shared
+through single-flight are charged to the request that made them.
+"""
+import contextvars
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+load_dotenv()
+
+# Starting estimate of output tokens per question, until a model reports usage
+QUIZ_TOKENS_PER_QUESTION = float(os.getenv("QUIZ_TOKENS_PER_QUESTION", "90"))
+# Headroom over the estimate so a slightly wordy reply is not cut off
+QUIZ_OUTPUT_MARGIN = float(os.getenv("QUIZ_OUTPUT_MARGIN", "1.3"))
+# Fixed output overhead per call (array brackets, wrapper object)
+QUIZ_OUTPUT_OVERHEAD_TOKENS = int(os.getenv("QUIZ_OUTPUT_OVERHEAD_TOKENS", "64"))
+# Output room reserved for a thinking model's reasoning, on top of the answer's budget
+QUIZ_THINKING_TOKENS = int(os.getenv("QUIZ_THINKING_TOKENS", "8192"))
+# Starting characters-per-token ratio, until a model reports prompt tokens
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4.0"))
+# Weight of each new observation in the moving averages
+TOKEN_EWMA_ALPHA = 0.2
+# Ledgers kept for /status
+TOKEN_LEDGER_HISTORY = int(os.getenv("TOKEN_LEDGER_HISTORY", "20"))
+
+# (context window, max output tokens) per model
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gemini-flash-latest": (1_048_576, 65_536),
+    "gemini-2.5-flash": (1_048_576, 65_536),
+    "gemini-2.5-pro": (1_048_576, 65_536),
+    "gemini-1.5-flash": (1_048_576, 8192),
+    "gemini-2.0-flash": (1_048_576, 8192),
+    "gemini-1.5-pro": (2_097_152, 8192),
+    "gemini-pro": (30_720, 2048),
+    "gpt-4o-mini": (128_000, 16_384),
+    "gpt-4o": (128_000, 16_384),
+}
+DEFAULT_MODEL_LIMITS = (32_000, 4096)
+# Models whose thinking tokens count against max_output_tokens
+THINKING_MODELS = {"gemini-flash-latest", "gemini-2.5-flash", "gemini-2.5-pro"}
+
+_BOUNDARY_RE = re.compile(r"\n\s*\n|(?<=[.!?])\s+")
+
+
+def model_key(model: str) -> str:
+    return model.split("/")[-1]
+
+
+def model_limits(model: str) -> Tuple[int, int]:
+    return MODEL_LIMITS.get(model_key(model), DEFAULT_MODEL_LIMITS)
+
+
+def thinking_tokens(model: str) -> int:
+    """Output tokens to reserve for the model's thinking (0 for models that do not think)"""
+    return QUIZ_THINKING_TOKENS if model_key(model) in THINKING_MODELS else 0
+
+
+def _ewma(current: Optional[float], value: float) -> float:
+    return value if current is None else current + TOKEN_EWMA_ALPHA * (value - current)
+
+
+@dataclass
+class CallBudget:
+    """Token plan for one quiz call on one model"""
+    model: str
+    questions: int
+    input_tokens: int
+    max_output_tokens: int
+
+
+@dataclass
+class CallRecord:
+    """What one quiz call was budgeted and what it actually used"""
+    route: str
+    questions_requested: int
+    questions_returned: int
+    input_tokens_estimated: int
+    input_tokens: Optional[int]
+    output_budget: int
+    output_tokens: Optional[int]
+    truncated: bool
+
+
+class TokenEstimator:
+    """Calibrated token counts and output budgets per model"""
+
+    def __init__(self, tokens_per_question: float = QUIZ_TOKENS_PER_QUESTION,
+                 chars_per_token: float = CHARS_PER_TOKEN):
+        self.default_tokens_per_question = tokens_per_question
+        self.default_chars_per_token = chars_per_token
+        self._lock = threading.Lock()
+        self._chars_per_token: Dict[str, float] = {}
+        self._tokens_per_question: Dict[str, float] = {}
+        self._encodings: Dict[str, Any] = {}
+
+    def _encoding(self, model: str):
+        if not TIKTOKEN_AVAILABLE or not model_key(model).startswith(("gpt-", "o1", "o3")):
+            return None
+        key = model_key(model)
+        if key not in self._encodings:
+            try:
+                self._encodings[key] = tiktoken.encoding_for_model(key)
+            except KeyError:
+                self._encodings[key] = tiktoken.get_encoding("o200k_base")
+        return self._encodings[key]
+
+    def chars_per_token(self, model: str) -> float:
+        with self._lock:
+            return self._chars_per_token.get(model_key(model), self.default_chars_per_token)
+
+    def tokens_per_question(self, model: str) -> float:
+        with self._lock:
+            return self._tokens_per_question.get(model_key(model), self.default_tokens_per_question)
+
+    def count(self, text: str, model: str) -> int:
+        """Tokens in `text` for `model` (exact with tiktoken, else calibrated from reported usage)"""
+        encoding = self._encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token(model))
+
+    def output_budget(self, model: str, questions: int) -> int:
+        """max output tokens for a call asking `model` for `questions` questions"""
+        wanted = questions * self.tokens_per_question(model) * QUIZ_OUTPUT_MARGIN + QUIZ_OUTPUT_OVERHEAD_TOKENS
+        wanted += thinking_tokens(model)
+        return min(model_limits(model)[1], math.ceil(wanted))
+
+    def plan(self, model: str, prompt: str, questions: int) -> CallBudget:
+        return CallBudget(model, questions, self.count(prompt, model), self.output_budget(model, questions))
+
+    def fit_content(self, content: str, models: Sequence[str], questions: int, prompt_overhead: str = "") -> str:
+        """
+        `content` cut down so that prompt + output budget fit every model's
+        context window (the smallest one decides). Returned unchanged when it
+        already fits.
+        """
+        available = None
+        for model in models:
+            window = model_limits(model)[0]
+            room = window - self.output_budget(model, questions) - self.count(prompt_overhead, model)
+            chars = int(room * self.chars_per_token(model) * 0.95)
+            available = chars if available is None else min(available, chars)
+        if available is None or len(content) <= available:
+            return content
+        available = max(0, available)
+        cut = content[:available]
+        boundaries = [match.start() for match in _BOUNDARY_RE.finditer(cut)]
+        if boundaries and boundaries[-1] > available // 2:
+            cut = cut[:boundaries[-1]]
+        print(f"Trimmed quiz content from {len(content)} to {len(cut)} characters to fit the context window")
+        return cut
+
+    def observe(self, model: str, prompt_chars: int, input_tokens: Optional[int],
+                output_tokens: Optional[int], questions: int):
+        """Fold a call's reported usage into the model's calibration"""
+        key = model_key(model)
+        with self._lock:
+            if input_tokens:
+                self._chars_per_token[key] = _ewma(self._chars_per_token.get(key), prompt_chars / input_tokens)
+            if output_tokens and questions:
+                self._tokens_per_question[key] = _ewma(self._tokens_per_question.get(key), output_tokens / questions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = sorted(set(self._chars_per_token) | set(self._tokens_per_question))
+            return {
+                "tokenizer": "tiktoken (OpenAI models) + calibrated ratio" if TIKTOKEN_AVAILABLE else "calibrated ratio",
+                "models": {
+                    model: {
+                        "chars_per_token": round(self._chars_per_token.get(model, self.default_chars_per_token), 3),
+                        "tokens_per_question": round(
+                            self._tokens_per_question.get(model, self.default_tokens_per_question), 1),
+                    }
+                    for model in models
+                },
+            }
+
+
+estimator = TokenEstimator()
+
+
+@dataclass
+class TokenLedger:
+    """Token accounting for one HTTP request"""
+    label: str
+    started: float = field(default_factory=time.time)
+    calls: List[CallRecord] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        def total(name: str) -> Optional[int]:
+            values = [getattr(call, name) for call in self.calls]
+            return None if any(value is None for value in values) else sum(values)
+
+        return {
+            "calls": len(self.calls),
+            "input_tokens": total("input_tokens"),
+            "input_tokens_estimated": total("input_tokens_estimated"),
+            "output_tokens": total("output_tokens"),
+            "output_budget": total("output_budget"),
+            "truncated_calls": sum(call.truncated for call in self.calls),
+            "by_call": [asdict(call) for call in self.calls],
+        }
+
+
+_ledger: contextvars.ContextVar[Optional[TokenLedger]] = contextvars.ContextVar("token_ledger", default=None)
+_recent: Deque[Dict[str, Any]] = deque(maxlen=TOKEN_LEDGER_HISTORY)
+_recent_lock = threading.Lock()
+
+
+@contextmanager
+def token_ledger(label: str) -> Iterator[TokenLedger]:
+    """Charge the quiz calls made inside this block (and its tasks and threads) to one ledger"""
+    ledger = TokenLedger(label)
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        try:
+            _ledger.reset(token)
+        except ValueError:
+            # An async generator closed from another task's context
+            pass
+        if ledger.calls:
+            summary = ledger.summary()
+            print(f"Tokens for {label}: {summary['input_tokens']} in, {summary['output_tokens']} out "
+                  f"(budget {summary['output_budget']}) over {summary['calls']} call(s)")
+            with _recent_lock:
+                _recent.append({"label": label, "started": ledger.started,
+                                **{k: v for k, v in summary.items() if k != "by_call"}})
+
+
+def record_call(provider: str, budget: CallBudget, prompt_chars: int, input_tokens: Optional[int],
+                output_tokens: Optional[int], questions: int, truncated: bool) -> CallRecord:
+    """Calibrate on a finished call's usage and charge it to the current ledger, if any"""
+    estimator.observe(budget.model, prompt_chars, input_tokens, output_tokens, questions)
+    record = CallRecord(
+        route=f"{provider}:{budget.model}",
+        questions_requested=budget.questions,
+        questions_returned=questions,
+        input_tokens_estimated=budget.input_tokens,
+        input_tokens=input_tokens,
+        output_budget=budget.max_output_tokens,
+        output_tokens=output_tokens,
+        truncated=truncated,
+    )
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger.calls.append(record)
+    return record
+
+
+def gemini_truncated(response: Any) -> bool:
+    """True when Gemini stopped because it hit max_output_tokens"""
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return getattr(reason, "name", reason) in ("MAX_TOKENS", 2)
+
+
+def openai_truncated(response: Any) -> bool:
+    """True when OpenAI stopped because it hit max_tokens"""
+    choices = getattr(response, "choices", None) or []
+    return bool(choices) and choices[0].finish_reason == "length"
+
+
+def stats() -> Dict[str, Any]:
+    with _recent_lock:
+        recent = list(_recent)
+    return {**estimator.stats(), "recent_requests": recent}
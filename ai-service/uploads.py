@@ -0,0 +1,340 @@
+"""
+Streaming receipt of quiz source uploads (PDF/PPTX).
+
+The multipart body is parsed straight off the ASGI receive stream; file bytes
+go into an UploadBuffer that stays in memory up to UPLOAD_SPOOL_BYTES and then
+spills to a temporary file. Readers consume the buffer in place: the in-memory
+BytesIO directly, or the spilled file through mmap (see text_extraction), so
+an upload is never read back into a second copy.
+
+UPLOAD_MAX_BYTES is enforced on the raw body as it arrives (and up front from
+Content-Length when the client sends one), so an oversized upload is rejected
+after at most one chunk past the limit rather than after it has been stored.
+
+The buffer also hashes the bytes as they arrive, giving the digest used to
+key the extracted-text cache without a second pass over the file.
+
+Each upload records its size, where it was buffered, the resident memory it
+added and the time from first byte to extracted text; stats() aggregates
+these for /status.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+from latency_stats import get_window
+
+load_dotenv()
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+# Uploads up to this size are kept in memory; larger ones spill to a temp file
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(4 * 1024 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+ALLOWED_EXTENSIONS = (".pdf", ".pptx")
+# Multipart framing (boundaries, part headers, small form fields) on top of the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Longest non-file form field accepted; longer ones are rejected with 413
+FORM_FIELD_MAX_BYTES = MULTIPART_OVERHEAD_BYTES
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process, or 0 where getrusage is unavailable (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process right now (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        # AttributeError: no os.sysconf on Windows
+        return peak_rss_bytes()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBuffer:
+    """Write-once buffer for one uploaded file: memory first, temp file past the spool size"""
+
+    def __init__(self, filename: str, max_bytes: int = UPLOAD_MAX_BYTES,
+                 spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self._memory: Optional[io.BytesIO] = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+        self._hash = hashlib.sha256()
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the bytes written so far (hashed as they stream in)"""
+        return self._hash.hexdigest()
+
+    def write(self, data: memoryview):
+        if self.size + len(data) > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds the {self.max_bytes} byte upload limit")
+        if self._memory is not None and self.size + len(data) > self.spool_bytes:
+            self._spill()
+        (self._file or self._memory).write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def _spill(self):
+        suffix = os.path.splitext(self.filename)[1]
+        self._file = tempfile.NamedTemporaryFile(prefix="upload-", suffix=suffix, dir=UPLOAD_TMP_DIR, delete=False)
+        self.path = self._file.name
+        self._file.write(self._memory.getbuffer())
+        self._memory = None
+
+    def finish(self):
+        """Flush and close the write side; the buffer is read-only afterwards"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def source(self) -> Union[str, BinaryIO]:
+        """What the document readers should open: the spilled file's path, or the in-memory stream"""
+        if self.path is not None:
+            return self.path
+        self._memory.seek(0)
+        return self._memory
+
+    def save(self, path: str):
+        """Keep the upload at `path` (moving the spilled temp file when there is one); the buffer is closed afterwards"""
+        self.finish()
+        if self.path is not None:
+            shutil.move(self.path, path)
+            self.path = None
+        else:
+            with open(path, "wb") as fh:
+                fh.write(self._memory.getbuffer())
+        self.close()
+
+    def close(self):
+        self.finish()
+        self._memory = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"Failed to delete upload buffer {self.path}: {e}")
+            self.path = None
+
+
+class ReceivedUpload:
+    """Uploaded document(s), the form fields, and measurements taken while handling them"""
+
+    def __init__(self, buffers: List[UploadBuffer], fields: Dict[str, str], started: float, rss_before: int):
+        self.buffers = buffers
+        self.fields = fields
+        self.started = started
+        self.received = time.perf_counter()
+        self._rss_before = rss_before
+        self._rss_peak = max(rss_before, current_rss_bytes())
+
+    @property
+    def buffer(self) -> UploadBuffer:
+        """The first (for single-file requests, the only) uploaded file"""
+        return self.buffers[0]
+
+    @property
+    def filename(self) -> str:
+        return self.buffer.filename
+
+    def sample_memory(self):
+        self._rss_peak = max(self._rss_peak, current_rss_bytes())
+
+    def mark_extracted(self) -> Dict[str, Any]:
+        """Record upload→extraction time and memory growth for this upload"""
+        self.sample_memory()
+        report = {
+            "bytes": sum(buffer.size for buffer in self.buffers),
+            "buffer": "disk" if any(buffer.on_disk for buffer in self.buffers) else "memory",
+            "receive_ms": round((self.received - self.started) * 1000, 1),
+            "upload_to_extraction_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "rss_delta_bytes": self._rss_peak - self._rss_before,
+        }
+        _stats.record(report)
+        get_window("upload_receive").observe(report["receive_ms"] / 1000)
+        get_window("upload_to_extraction").observe(report["upload_to_extraction_ms"] / 1000)
+        names = self.filename if len(self.buffers) == 1 else f"{len(self.buffers)} files"
+        print(f"Upload {names}: {report}")
+        return report
+
+    def close(self):
+        for buffer in self.buffers:
+            buffer.close()
+
+
+class UploadStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"uploads": 0, "rejected_too_large": 0, "bytes_received": 0, "spilled_to_disk": 0}
+        self._max_rss_delta = 0
+
+    def record(self, report: Dict[str, Any]):
+        with self._lock:
+            self._counters["uploads"] += 1
+            self._counters["bytes_received"] += report["bytes"]
+            self._counters["spilled_to_disk"] += report["buffer"] == "disk"
+            self._max_rss_delta = max(self._max_rss_delta, report["rss_delta_bytes"])
+
+    def rejected(self):
+        with self._lock:
+            self._counters["rejected_too_large"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            max_rss_delta = self._max_rss_delta
+        return {
+            **counters,
+            "max_bytes": UPLOAD_MAX_BYTES,
+            "spool_bytes": UPLOAD_SPOOL_BYTES,
+            "max_rss_delta_bytes": max_rss_delta,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+_stats = UploadStats()
+
+
+def stats() -> Dict[str, Any]:
+    return _stats.stats()
+
+
+def _close_all(buffers: List[UploadBuffer]):
+    for buffer in buffers:
+        buffer.close()
+
+
+async def receive_upload(request: Request, max_bytes: int = UPLOAD_MAX_BYTES,
+                         max_files: int = 1, field: str = "file") -> ReceivedUpload:
+    """
+    Parse a multipart/form-data request with up to `max_files` file parts
+    named `field`, streaming each file into its own UploadBuffer. Raises
+    HTTPException 413 once a file passes `max_bytes` (or the body passes
+    max_files x max_bytes) or a form field passes FORM_FIELD_MAX_BYTES, and
+    400 for malformed requests, unsupported file types or too many files.
+    """
+    started = time.perf_counter()
+    rss_before = current_rss_bytes()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    body_limit = max_bytes * max_files + MULTIPART_OVERHEAD_BYTES
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > body_limit:
+        _stats.rejected()
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte upload limit")
+
+    fields: Dict[str, str] = {}
+    buffers: List[UploadBuffer] = []
+    part: Dict[str, Any] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        part.clear()
+        part["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part["headers"][bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        part["name"] = name
+        if filename is not None and name == field:
+            if len(buffers) >= max_files:
+                raise HTTPException(status_code=400, detail=f"At most {max_files} file(s) per request")
+            filename = os.path.basename(filename.decode("utf-8", "replace"))
+            if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+                raise HTTPException(status_code=400, detail="Only PDF and PPTX files are supported")
+            buffers.append(UploadBuffer(filename, max_bytes=max_bytes))
+            part["buffer"] = buffers[-1]
+        else:
+            part["value"] = bytearray()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if "buffer" in part:
+            # memoryview slice: the chunk is copied once, into the buffer
+            part["buffer"].write(memoryview(data)[start:end])
+        else:
+            if len(part["value"]) + end - start > FORM_FIELD_MAX_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"Form field {part['name']!r} exceeds the {FORM_FIELD_MAX_BYTES} byte limit")
+            part["value"].extend(data[start:end])
+
+    def on_part_end():
+        if "value" in part:
+            fields[part["name"]] = part["value"].decode("utf-8", "replace")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit")
+            parser.write(chunk)
+        parser.finalize()
+    except UploadTooLarge as e:
+        _stats.rejected()
+        _close_all(buffers)
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        _close_all(buffers)
+        raise
+    except Exception as e:
+        _close_all(buffers)
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {e}")
+
+    if not buffers or any(buffer.size == 0 for buffer in buffers):
+        _close_all(buffers)
+        raise HTTPException(status_code=400, detail="No file uploaded" if not buffers else "Empty file uploaded")
+    for buffer in buffers:
+        buffer.finish()
+    return ReceivedUpload(buffers, fields, started, rss_before)
@@ -13,7 +13,7 @@ echo ========================================
 echo.
 
 REM Start AI Service
-start "AI Service (Port 8000)" cmd /k "cd /d "%~dp0ai-service" && echo Starting AI Service v2.1.0... && python main.py"
+start "AI Service (Port 8000)" cmd /k "cd /d "%~dp0ai-service" && echo Starting AI Service v2.1.0... && python serve.py --reload"
 
 REM Wait a bit for AI service to start
 timeout /t 3 /nobreak >nul